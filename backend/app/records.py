@@ -0,0 +1,108 @@
+import json
+from dataclasses import dataclass, field, fields
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+# Internal counterparts of the models in schemas.py. Results are built, cached and
+# encoded as these slotted dataclasses; the pydantic models only describe the API
+# (OpenAPI docs), so responses skip the second validation pass response_model would run.
+
+
+@dataclass(slots=True)
+class AuthorRecord:
+    name: Optional[str] = None
+    url: Optional[str] = None
+    mal_id: Optional[int] = None
+    image_url: Optional[str] = None
+
+
+@dataclass(slots=True)
+class WorkRecord:
+    title: Optional[str] = None
+    image_url: Optional[str] = None
+    url: Optional[str] = None
+    relation_type: Optional[str] = None
+
+
+@dataclass(slots=True)
+class MatchRecord:
+    titulo: Optional[str] = None
+    similarity: float = 0.0
+    portada_url: Optional[str] = None
+
+
+@dataclass(slots=True)
+class LinkRecord:
+    name: Optional[str] = None
+    url: Optional[str] = None
+
+
+@dataclass(slots=True)
+class SearchRecord:
+    found: bool
+    similarity_confidence: float = 0.0
+    titulo: Optional[str] = None
+    capitulo_estimado: Optional[str] = None
+    pagina_estimada: Optional[str] = None
+    sinopsis: Optional[str] = None
+    sinopsis_en: Optional[str] = None
+    sinopsis_es: Optional[str] = None
+    message: Optional[str] = None
+    portada_url: Optional[str] = None
+    autores: List[AuthorRecord] = field(default_factory=list)
+    otras_obras: List[WorkRecord] = field(default_factory=list)
+    external_links: List[LinkRecord] = field(default_factory=list)
+    chapters: Optional[int] = None
+    status: Optional[str] = None
+    published: Optional[str] = None
+    score: Optional[float] = None
+    related_manga: List[WorkRecord] = field(default_factory=list)
+    otras_coincidencias: List[MatchRecord] = field(default_factory=list)
+    match_image_url: Optional[str] = None
+
+    @classmethod
+    def from_fields(cls, data: dict, **extra):
+        """
+        Builds a record from a dict that may carry extra keys (e.g. a SauceNAO result).
+        """
+        names = cls.__dataclass_fields__
+        return cls(**{k: v for k, v in data.items() if k in names}, **extra)
+
+
+@dataclass(slots=True)
+class BatchPageRecord:
+    filename: str
+    found: bool = False
+    similarity_confidence: float = 0.0
+    capitulo_estimado: Optional[str] = None
+    pagina_estimada: Optional[str] = None
+    duplicate_of: Optional[str] = None
+    message: Optional[str] = None
+
+
+@dataclass(slots=True)
+class BatchTitleRecord(SearchRecord):
+    pages: List[BatchPageRecord] = field(default_factory=list)
+
+
+def to_dict(record) -> dict:
+    """Shallow dict of a record; nested records are left for the encoder."""
+    return {f.name: getattr(record, f.name) for f in fields(record)}
+
+
+def json_default(obj):
+    if hasattr(obj, "__dataclass_fields__"):
+        return {name: getattr(obj, name) for name in obj.__dataclass_fields__}
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj) -> bytes:
+    """
+    Compact JSON encoding of records (and plain containers of them) straight to bytes.
+    """
+    return json.dumps(
+        obj, default=json_default, ensure_ascii=False, separators=(",", ":")
+    ).encode()
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import RedirectResponse, Response
+
+from ..services.image_proxy import (
+    IMAGE_SIZES,
+    ImageProxyError,
+    get_image,
+    image_key,
+    is_proxyable,
+)
+
+router = APIRouter()
+
+# Renditions never change for a given URL and size, so browsers and CDNs keep them
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@router.get("/img/{size}")
+async def proxy_image(request: Request, size: str, url: str = Query(...)):
+    """
+    Serves a cover, thumbnail or portrait from an allowed host, downscaled to `size`
+    (thumb, card or cover) and re-encoded as WebP. Falls back to redirecting to the
+    original when it can't be fetched or decoded.
+    """
+    if size not in IMAGE_SIZES:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown size. Use one of: {', '.join(IMAGE_SIZES)}.",
+        )
+    if not is_proxyable(url):
+        raise HTTPException(status_code=400, detail="This image host is not allowed.")
+
+    etag = f'"{image_key(url, size)}"'
+    headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    try:
+        data = await get_image(url, size)
+    except ImageProxyError as e:
+        print(f"Image proxy error: {e}")
+        return RedirectResponse(url, status_code=307)
+    return Response(content=data, media_type="image/webp", headers=headers)
@@ -0,0 +1,73 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, File, Form, HTTPException, Query, UploadFile
+from fastapi.responses import Response
+
+from ..records import dumps
+from ..schemas import JobStatus
+from ..services.jobs import JOB_MAX_WAIT, Job, job_queue, wait_for_job
+from ..services.uploads import read_image_upload
+from .search import json_response, parse_include, run_search
+
+router = APIRouter()
+
+
+async def run_search_job(job: Job) -> bytes:
+    """Job handler: the /search pipeline for a queued upload."""
+    include = job.params.get("include")
+    return await run_search(
+        job.upload, job.params.get("include_nsfw", False),
+        frozenset(include) if include is not None else None, endpoint="job",
+    )
+
+
+@router.post("/jobs", response_model=JobStatus, status_code=202)
+async def submit_job(
+    file: UploadFile = File(...),
+    lang: str = Form("en"),
+    include_nsfw: bool = Form(False),
+    include: Optional[str] = Form(None),
+):
+    """
+    Queues a /search and answers right away with the job id; the result is collected
+    from GET /jobs/{id}. Takes the same form fields as /search.
+    """
+    include = parse_include(include)
+    upload = await read_image_upload(file)
+    job_id = await asyncio.to_thread(job_queue.submit, upload, {
+        "include_nsfw": include_nsfw,
+        "include": sorted(include) if include is not None else None,
+    })
+    if job_id is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many searches are waiting. Please retry later.",
+            headers={"Retry-After": "30"},
+        )
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    return Response(
+        content=dumps(job),
+        status_code=202,
+        media_type="application/json",
+        headers={"Location": f"/jobs/{job_id}"},
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str, wait: float = Query(0, ge=0, le=JOB_MAX_WAIT)):
+    """
+    A job's status, with the /search result once it is done or the error once it failed.
+    `wait` long-polls: the answer is held up to that many seconds for the job to finish.
+    """
+    job = await wait_for_job(job_id, wait)
+    if job is None:
+        raise HTTPException(
+            status_code=404, detail="No job with this id (finished jobs expire)."
+        )
+    result = job.pop("result")
+    body = dumps(job)
+    if result is not None:
+        # The result is stored encoded; splice it in rather than decoding it again
+        body = body[:-1] + b',"result":' + result + b"}"
+    return json_response(body)
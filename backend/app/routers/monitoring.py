@@ -0,0 +1,165 @@
+import asyncio
+import sqlite3
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from ..services import jikan, saucenao
+from ..services.admission import admission_stats
+from ..services.circuit_breaker import OPEN
+from ..services.image_cache import saucenao_cache
+from ..services.image_proxy import image_store
+from ..services.jobs import job_queue
+from ..services.metrics import Gauge, registry
+from ..services.prefetch import popularity, prefetch_stats
+from ..services.response_cache import details_responses, search_responses
+from ..services.singleflight import singleflight_stats
+from ..services.snapshot import snapshot
+from ..services.title_index import title_index
+from ..services.translation import translation_service
+
+router = APIRouter()
+
+def cache_stats() -> dict:
+    return {
+        "jikan": jikan.cache.stats(),
+        "translation": translation_service.cache.stats(),
+        "title_index": title_index.stats(),
+        "snapshot": snapshot.stats(),
+        "jikan_revalidation": jikan.revalidation_stats,
+        "image_proxy": image_store.stats(),
+        "saucenao_phash": {
+            "hits": saucenao_cache.hits,
+            "misses": saucenao_cache.misses,
+            "evictions": saucenao_cache.evictions,
+            "entries": len(saucenao_cache),
+        },
+        "search_responses": {
+            "hits": search_responses.hits,
+            "misses": search_responses.misses,
+            "evictions": search_responses.evictions,
+            "entries": len(search_responses),
+        },
+        "details_responses": details_responses.stats(),
+    }
+
+
+def _collect_cache_stats():
+    return {
+        (cache, stat): value
+        for cache, stats in cache_stats().items()
+        for stat, value in stats.items()
+    }
+
+
+def _collect_scheduler_stats():
+    return {
+        (name, stat): value
+        for name, scheduler in (
+            ("jikan", jikan.scheduler),
+            ("saucenao", saucenao.scheduler),
+        )
+        for stat, value in scheduler.stats().items()
+    }
+
+
+def _collect_breaker_states():
+    return {
+        (name, endpoint): int(breaker["state"] == OPEN)
+        for name, group in (("jikan", jikan.breakers), ("saucenao", saucenao.breakers))
+        for endpoint, breaker in group.stats().items()
+    }
+
+
+def _collect_admission():
+    return {
+        (endpoint, stat): value
+        for endpoint, stats in admission_stats().items()
+        for stat, value in stats.items()
+    }
+
+
+def _collect_jobs():
+    return {(stat,): value for stat, value in job_queue.stats().items()}
+
+
+def _collect_coalescing():
+    return {
+        (group, stat): value
+        for group, stats in singleflight_stats().items()
+        for stat, value in stats.items()
+    }
+
+
+# Read from the existing counters at scrape time, so the hot paths pay nothing extra
+Gauge(
+    "mangafinder_cache",
+    "Cache counters (hits, misses, evictions) and sizes.",
+    ["cache", "stat"],
+    collect=_collect_cache_stats,
+)
+Gauge(
+    "mangafinder_upstream_scheduler",
+    "Upstream rate-limit scheduler counters and queue depth.",
+    ["upstream", "stat"],
+    collect=_collect_scheduler_stats,
+)
+Gauge(
+    "mangafinder_circuit_open",
+    "1 while an upstream endpoint's circuit breaker is open.",
+    ["upstream", "endpoint"],
+    collect=_collect_breaker_states,
+)
+Gauge(
+    "mangafinder_coalescing",
+    "Request coalescing counters and in-flight calls per group.",
+    ["group", "stat"],
+    collect=_collect_coalescing,
+)
+Gauge(
+    "mangafinder_admission",
+    "Admission control slots in use, queue depth and counters per endpoint.",
+    ["endpoint", "stat"],
+    collect=_collect_admission,
+)
+Gauge(
+    "mangafinder_jobs",
+    "Search jobs per status and job queue counters.",
+    ["stat"],
+    collect=_collect_jobs,
+)
+
+
+async def _count_snapshot() -> None:
+    """Refreshes the snapshot's manga count off the event loop before it's reported."""
+    try:
+        await asyncio.to_thread(snapshot.count_manga)
+    except sqlite3.Error as e:
+        print(f"Snapshot count failed: {e}")
+
+
+@router.get("/stats")
+async def get_stats():
+    await _count_snapshot()
+    return {
+        "admission": admission_stats(),
+        "coalescing": singleflight_stats(),
+        "upstreams": {
+            "jikan": dict(jikan.scheduler.stats(), breakers=jikan.breakers.stats()),
+            "saucenao": dict(
+                saucenao.scheduler.stats(), breakers=saucenao.breakers.stats()
+            ),
+        },
+        "caches": cache_stats(),
+        "prefetch": dict(
+            prefetch_stats, popular=await asyncio.to_thread(popularity.top, 10)
+        ),
+        "jobs": await asyncio.to_thread(job_queue.stats),
+    }
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text exposition format."""
+    await _count_snapshot()
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -1,102 +1,277 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from deep_translator import GoogleTranslator
-from ..schemas import MangaSearchResult, Author
+import asyncio
+import hashlib
+import os
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, List, Optional
+
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    File,
+    Form,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+)
+from fastapi.responses import Response, StreamingResponse
+
+from ..records import (
+    AuthorRecord,
+    BatchPageRecord,
+    BatchTitleRecord,
+    SearchRecord,
+    dumps,
+    to_dict,
+)
+from ..schemas import BatchSearchResult, MangaSearchResult
+from ..services.image_cache import saucenao_cache
+from ..services.jikan import (
+    BRANCH_FIELDS,
+    JIKAN_CACHE_STALE_TTL,
+    branches_for,
+    cache as jikan_cache,
+    fetch_manga_details,
+    fetch_manga_details_by_id,
+    mal_key,
+    missing_branches,
+    normalize_title,
+    title_key,
+)
+from ..services.prefetch import enrich_alternatives, popularity
+from ..services.preprocess import preprocess_image
+from ..services.response_cache import CachedDetails, details_responses, search_responses
 from ..services.saucenao import search_saucenao
-from ..services.jikan import fetch_manga_details
+from ..services.singleflight import SingleFlight
+from ..services.tracing import stage
+from ..services.translation import translation_service
+from ..services.uploads import ImageUpload, read_batch_uploads, read_image_upload
 
 router = APIRouter()
 
-def translate_synopsis(synopsis_en: str) -> str:
+DETAIL_FIELDS = [
+    "sinopsis", "portada_url", "autores", "otras_obras", "external_links",
+    "chapters", "status", "published", "score", "related_manga",
+]
+
+# Optional parts of a result that `include` selects, and the fields each one adds.
+# Title, cover, status and the other basics are always sent. Unselected parts are left
+# out of the response and their Jikan branches are never fetched (see
+# jikan.INCLUDE_BRANCHES).
+INCLUDE_FIELDS = {
+    "synopsis": ["sinopsis", "sinopsis_en"],
+    "translation": ["sinopsis_es"],
+    "authors": ["autores"],
+    "author_works": ["otras_obras"],
+    "external_links": ["external_links"],
+    "relations": ["related_manga"],
+}
+
+# Stage names used by /search/stream for each Jikan enrichment branch
+STREAM_STAGES = {
+    "full": "details",
+    "people": "authors",
+    "people_manga": "author_works",
+    "external": "external_links",
+}
+
+# Pages of one batch searched at a time; the SauceNAO scheduler still enforces the quota
+BATCH_SAUCENAO_CONCURRENCY = int(os.getenv("BATCH_SAUCENAO_CONCURRENCY", "2"))
+# Titles of one batch enriched at a time. Each takes about five Jikan requests, so two
+# keep the Jikan queue well inside its max_wait even at the 60-per-minute pace
+BATCH_JIKAN_CONCURRENCY = int(os.getenv("BATCH_JIKAN_CONCURRENCY", "2"))
+
+# Concurrent uploads of the same page share one upstream call
+saucenao_flight = SingleFlight("saucenao")
+
+async def translate_synopsis(synopsis_en: str) -> str:
     if not synopsis_en:
         return None
     try:
-        translator = GoogleTranslator(source='auto', target='es')
-        return translator.translate(synopsis_en)
+        return await translation_service.translate(synopsis_en, "es")
     except Exception as e:
         print(f"Translation error (synopsis): {e}")
         return synopsis_en
 
+async def identify_image(upload: ImageUpload, image_hash, include_nsfw: bool) -> dict:
+    """Runs the SauceNAO search, unless a near-identical page was searched recently."""
+    if image_hash is None:
+        return await search_saucenao(upload, include_nsfw)
+
+    async def search():
+        result = saucenao_cache.get(image_hash, include_nsfw)
+        if result is None:
+            result = await search_saucenao(upload, include_nsfw)
+            saucenao_cache.set(image_hash, result, include_nsfw)
+        return result
+
+    return await saucenao_flight.do((image_hash, include_nsfw), search)
+
+def parse_include(include: Optional[str]) -> Optional[frozenset]:
+    """The parts named in a comma-separated `include`; None (everything) if absent."""
+    if include is None:
+        return None
+    names = {name.strip() for name in include.split(",") if name.strip()}
+    unknown = names - INCLUDE_FIELDS.keys()
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"Unknown include: {', '.join(sorted(unknown))}. "
+                f"Use any of: {', '.join(INCLUDE_FIELDS)}."
+            ),
+        )
+    # The translation is of the synopsis, so asking for it brings the synopsis along
+    if "translation" in names:
+        names.add("synopsis")
+    return frozenset(names)
+
+def included(include: Optional[frozenset], name: str) -> bool:
+    return include is None or name in include
+
+def encode_result(result_data: SearchRecord, include: Optional[frozenset]) -> bytes:
+    """Encodes a result without the fields of the parts `include` left out."""
+    if include is None:
+        return dumps(result_data)
+    data = to_dict(result_data)
+    for name, fields in INCLUDE_FIELDS.items():
+        if name not in include:
+            for field in fields:
+                del data[field]
+    return dumps(data)
+
+def json_response(body: bytes) -> Response:
+    """
+    Sends an already encoded body; response_model stays on the routes for the docs only.
+    """
+    return Response(content=body, media_type="application/json")
+
+def apply_details(result_data: SearchRecord, details: dict) -> None:
+    """Copies the Jikan fields that came back non-empty onto the result."""
+    for field in DETAIL_FIELDS:
+        if details.get(field):
+            setattr(result_data, field, details[field])
+
+def apply_author_fallback(
+    result_data: SearchRecord, saucenao_author: Optional[str]
+) -> None:
+    # Fallback: If no authors found via Jikan (or Jikan skipped), use SauceNAO author
+    if not result_data.autores and saucenao_author:
+        result_data.autores = [AuthorRecord(
+            name=saucenao_author,
+            url="",
+            mal_id=None,
+            image_url=None
+        )]
+
+async def enrich_result(
+    result_data: SearchRecord,
+    saucenao_author: Optional[str],
+    endpoint: str = "search",
+    include: Optional[frozenset] = None,
+) -> SearchRecord:
+    """
+    Fills a SauceNAO match in with Jikan details and the translated synopsis, limited to
+    the parts in `include` (None for all of them).
+    """
+    # 2. Search Jikan (only if we have a valid title)
+    if result_data.titulo:
+        with stage(endpoint, "jikan"):
+            details = await fetch_manga_details(
+                result_data.titulo, branches=branches_for(include)
+            )
+        apply_details(result_data, details)
+        popularity.record(result_data.titulo, details.get("mal_id"))
+
+    if included(include, "authors"):
+        apply_author_fallback(result_data, saucenao_author)
+
+    # 3. Translate Synopsis
+    result_data.sinopsis_en = result_data.sinopsis
+    if included(include, "translation"):
+        with stage(endpoint, "translation"):
+            result_data.sinopsis_es = await translate_synopsis(result_data.sinopsis)
+
+    return result_data
+
+async def run_search(
+    upload: ImageUpload,
+    include_nsfw: bool,
+    include: Optional[frozenset],
+    endpoint: str = "search",
+    background: Optional[BackgroundTasks] = None,
+) -> bytes:
+    """
+    The /search pipeline for an upload that was already read: the encoded result.
+    Speculative enrichment of the alternatives is left to `background` when given, so it
+    starts after the response is sent.
+    """
+    # 1. Search SauceNAO with a downscaled copy, unless a near-identical page was
+    # searched recently
+    with stage(endpoint, "preprocess"):
+        upload, image_hash = await preprocess_image(upload)
+    # A near-identical page answered within RESPONSE_CACHE_TTL seconds is resent as-is
+    if image_hash is not None:
+        cached = search_responses.get(image_hash, (include_nsfw, include))
+        if cached is not None:
+            body, titulo = cached
+            popularity.record(titulo)
+            return body
+
+    with stage(endpoint, "saucenao"):
+        saucenao_result = await identify_image(upload, image_hash, include_nsfw)
+
+    if not saucenao_result.get("found"):
+        return encode_result(SearchRecord.from_fields(saucenao_result), include)
+
+    # Construct initial result object
+    result_data = SearchRecord.from_fields(saucenao_result)
+
+    # Ensure match_image_url is populated from SauceNAO result
+    if saucenao_result.get("portada_url"):
+         result_data.match_image_url = saucenao_result.get("portada_url")
+
+    # 2. Jikan details and 3. translation
+    result_data = await enrich_result(
+        result_data,
+        saucenao_result.get("saucenao_author"),
+        endpoint=endpoint,
+        include=include,
+    )
+    body = encode_result(result_data, include)
+    if image_hash is not None:
+        search_responses.set(
+            image_hash, (body, result_data.titulo), (include_nsfw, include)
+        )
+    if background is not None:
+        background.add_task(enrich_alternatives, result_data.otras_coincidencias)
+    else:
+        enrich_alternatives(result_data.otras_coincidencias)
+    return body
+
 @router.post("/search", response_model=MangaSearchResult)
 async def search_manga(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...), 
     lang: str = Form("en"),
-    include_nsfw: bool = Form(False)
+    include_nsfw: bool = Form(False),
+    include: Optional[str] = Form(None),
 ):
-    # Validate file type
-    valid_content_types = ['image/jpeg', 'image/jpg', 'image/png', 'image/webp', 'image/gif']
-    if file.content_type not in valid_content_types:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Invalid file type: {file.content_type}. Please upload a JPG, PNG, WEBP, or GIF image."
-        )
-    
-    # Validate file size (10MB limit)
-    max_size = 10 * 1024 * 1024  # 10MB
-    file_content = await file.read()
-    if len(file_content) > max_size:
-        raise HTTPException(
-            status_code=400,
-            detail="File is too large. Maximum size is 10MB."
-        )
-    
-    # Reset file pointer for later use
-    await file.seek(0)
+    """
+    Identifies a manga page. `include` is an optional comma-separated list of the parts
+    to send (synopsis, translation, authors, author_works, external_links, relations);
+    without it everything is sent.
+    """
+    include = parse_include(include)
+    # Validate type (from magic bytes) and size (10MB limit) while reading the upload
+    with stage("search", "read_upload"):
+        upload = await read_image_upload(file)
     
     try:
-        # 1. Search SauceNAO
-        saucenao_result = await search_saucenao(file, include_nsfw)
-        
-        if not saucenao_result.get("found"):
-            return MangaSearchResult(**saucenao_result)
-
-        # Construct initial result object
-        result_data = MangaSearchResult(**saucenao_result)
-        
-        # Ensure match_image_url is populated from SauceNAO result
-        if saucenao_result.get("portada_url"):
-             result_data.match_image_url = saucenao_result.get("portada_url")
-        
-        # 2. Search Jikan (only if we have a valid title)
-        title = result_data.titulo
-        saucenao_author = saucenao_result.get("saucenao_author")
-        
-        if title:
-            details = fetch_manga_details(title)
-            if details["sinopsis"]:
-                result_data.sinopsis = details["sinopsis"]
-            if details["portada_url"]:
-                result_data.portada_url = details["portada_url"]
-            if details["autores"]:
-                result_data.autores = details["autores"]
-            if details["otras_obras"]:
-                result_data.otras_obras = details["otras_obras"]
-            if details["external_links"]:
-                result_data.external_links = details["external_links"]
-            if details["chapters"]:
-                result_data.chapters = details["chapters"]
-            if details["status"]:
-                result_data.status = details["status"]
-            if details["published"]:
-                result_data.published = details["published"]
-            if details["score"]:
-                result_data.score = details["score"]
-            if details["related_manga"]:
-                result_data.related_manga = details["related_manga"]
-
-        # Fallback: If no authors found via Jikan (or Jikan skipped), use SauceNAO author
-        if not result_data.autores and saucenao_author:
-            result_data.autores = [Author(
-                name=saucenao_author,
-                url="", 
-                mal_id=None,
-                image_url=None 
-            )]
-
-        # 3. Translate Synopsis
-        result_data.sinopsis_en = result_data.sinopsis
-        result_data.sinopsis_es = translate_synopsis(result_data.sinopsis)
-
-        return result_data
+        return json_response(
+            await run_search(upload, include_nsfw, include, background=background_tasks)
+        )
     
     except HTTPException:
         # Re-raise HTTP exceptions (validation errors)
@@ -111,33 +286,341 @@ async def search_manga(
             detail="Failed to process image. Please try again with a different image."
         )
 
-@router.post("/details", response_model=MangaSearchResult)
-async def get_manga_details(
-    title: str = Form(...),
+def _ndjson(stage_name: str, data) -> bytes:
+    return dumps({"stage": stage_name, "data": data}) + b"\n"
+
+@router.post("/search/stream")
+async def search_manga_stream(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    lang: str = Form("en"),
+    include_nsfw: bool = Form(False)
 ):
-    # Initialize basic result
-    result_data = MangaSearchResult(
-        found=True,
-        titulo=title,
-        otras_coincidencias=[] 
+    """
+    Same pipeline as /search, streamed as NDJSON. Each line is {"stage", "data"} with
+    the MangaSearchResult fields that stage produced, in the order they become
+    available: match (SauceNAO, incl. thumbnail), details, authors, author_works,
+    external_links, translation, and finally done with the complete result. Failures end
+    the stream with an error line carrying status_code and detail.
+    """
+    # Validation errors are still plain 400s, before the stream starts
+    upload = await read_image_upload(file)
+
+    async def events():
+        try:
+            prepared, image_hash = await preprocess_image(upload)
+            saucenao_result = await identify_image(prepared, image_hash, include_nsfw)
+        except HTTPException as e:
+            yield _ndjson("error", {"status_code": e.status_code, "detail": e.detail})
+            return
+
+        result_data = SearchRecord.from_fields(saucenao_result)
+        if saucenao_result.get("portada_url"):
+            result_data.match_image_url = saucenao_result.get("portada_url")
+        yield _ndjson("match", result_data)
+
+        try:
+            if result_data.found and result_data.titulo:
+                # Forward each Jikan branch as it lands; whatever wasn't reported (cache
+                # hit, coalesced with another request) is sent with the full details
+                queue: asyncio.Queue = asyncio.Queue()
+                fetch = asyncio.create_task(
+                    fetch_manga_details(
+                        result_data.titulo,
+                        progress=lambda *landed: queue.put_nowait(landed),
+                    )
+                )
+                sent = set()
+                while not (fetch.done() and queue.empty()):
+                    getter = asyncio.ensure_future(queue.get())
+                    await asyncio.wait(
+                        {getter, fetch}, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    if not getter.done():
+                        getter.cancel()
+                        continue
+                    branch, fields = getter.result()
+                    sent.add(branch)
+                    yield _ndjson(
+                        STREAM_STAGES[branch], {k: v for k, v in fields.items() if v}
+                    )
+
+                details = fetch.result()
+                for branch, stage_name in STREAM_STAGES.items():
+                    if branch not in sent:
+                        names = BRANCH_FIELDS[branch]
+                        yield _ndjson(
+                            stage_name, {f: details[f] for f in names if details.get(f)}
+                        )
+                apply_details(result_data, details)
+                popularity.record(result_data.titulo, details.get("mal_id"))
+
+            apply_author_fallback(result_data, saucenao_result.get("saucenao_author"))
+
+            result_data.sinopsis_en = result_data.sinopsis
+            result_data.sinopsis_es = await translate_synopsis(result_data.sinopsis)
+            yield _ndjson("translation", {
+                "sinopsis_en": result_data.sinopsis_en,
+                "sinopsis_es": result_data.sinopsis_es,
+            })
+
+            yield _ndjson("done", result_data)
+            background_tasks.add_task(
+                enrich_alternatives, result_data.otras_coincidencias
+            )
+        except Exception as e:
+            print(f"Error streaming image search: {str(e)}")
+            import traceback
+
+            traceback.print_exc()
+            yield _ndjson(
+                "error",
+                {
+                    "status_code": 500,
+                    "detail": "Failed to process image. "
+                    "Please try again with a different image.",
+                },
+            )
+
+    return StreamingResponse(
+        events(), media_type="application/x-ndjson", background=background_tasks
     )
 
+@router.post("/search/batch", response_model=BatchSearchResult)
+async def search_manga_batch(
+    files: List[UploadFile] = File(...),
+    lang: str = Form("en"),
+    include_nsfw: bool = Form(False)
+):
+    """
+    Identifies a stack of pages (images and/or zip/CBZ archives). Identical pages are
+    searched once, and pages resolving to the same title share one Jikan lookup and
+    translation; each title comes back with the pages that matched it.
+    """
+    pages = await read_batch_uploads(files)
+
+    try:
+        # 1. De-duplicate by content hash and search each distinct page once
+        unique: Dict[str, ImageUpload] = {}
+        page_digests = []
+        for page in pages:
+            digest = hashlib.sha256(page.data).hexdigest()
+            unique.setdefault(digest, page)
+            page_digests.append(digest)
+
+        semaphore = asyncio.Semaphore(BATCH_SAUCENAO_CONCURRENCY)
+
+        async def lookup(page: ImageUpload) -> dict:
+            async with semaphore:
+                prepared, image_hash = await preprocess_image(page)
+                try:
+                    return await identify_image(prepared, image_hash, include_nsfw)
+                except HTTPException as e:
+                    # One page hitting the quota shouldn't fail the whole batch
+                    return {"found": False, "message": e.detail}
+
+        digests = list(unique)
+        matches = dict(
+            zip(digests, await asyncio.gather(*(lookup(unique[d]) for d in digests)))
+        )
+
+        # 2. Group pages by the title they resolved to
+        groups: Dict[str, list] = {}
+        unmatched = []
+        for page, digest in zip(pages, page_digests):
+            match = matches[digest]
+            batch_page = BatchPageRecord(
+                filename=page.filename,
+                found=match.get("found", False),
+                similarity_confidence=match.get("similarity_confidence", 0.0),
+                capitulo_estimado=match.get("capitulo_estimado") or None,
+                pagina_estimada=match.get("pagina_estimada"),
+                duplicate_of=unique[digest].filename
+                if unique[digest] is not page
+                else None,
+                message=match.get("message"),
+            )
+            if match.get("found") and match.get("titulo"):
+                groups.setdefault(normalize_title(match["titulo"]), []).append(
+                    (batch_page, match)
+                )
+            else:
+                unmatched.append(batch_page)
+
+        # 3. Jikan details and translation once per title, a few titles at a time
+        jikan_semaphore = asyncio.Semaphore(BATCH_JIKAN_CONCURRENCY)
+
+        async def build_group(entries: list) -> BatchTitleRecord:
+            best = max(
+                entries, key=lambda entry: entry[1].get("similarity_confidence", 0)
+            )[1]
+            result_data = BatchTitleRecord.from_fields(
+                best, pages=[batch_page for batch_page, _ in entries]
+            )
+            if best.get("portada_url"):
+                result_data.match_image_url = best.get("portada_url")
+            async with jikan_semaphore:
+                return await enrich_result(
+                    result_data, best.get("saucenao_author"), endpoint="batch"
+                )
+
+        results = await asyncio.gather(
+            *(build_group(entries) for entries in groups.values())
+        )
+        results.sort(key=lambda result: len(result.pages), reverse=True)
+
+        return json_response(dumps({
+            "total_pages": len(pages),
+            "unique_pages": len(unique),
+            "results": results,
+            "unmatched": unmatched,
+        }))
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error processing batch search: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to process the batch. Please try again."
+        )
+
+async def details_response(
+    cache_key,
+    title: Optional[str],
+    mal_id: Optional[int] = None,
+    include: Optional[frozenset] = None,
+) -> CachedDetails:
+    """
+    The encoded /details response for a title, or for a mal_id when title is None, with
+    what the GET variants need for validators and freshness.
+    """
+    cache_key = (cache_key, include)
+    entry = details_responses.get(cache_key)
+    if entry is not None:
+        popularity.record(entry.title, mal_id)
+        return entry
+
     # Fetch details from Jikan
-    details = fetch_manga_details(title)
-    
-    result_data.sinopsis = details["sinopsis"]
-    result_data.portada_url = details["portada_url"]
-    result_data.autores = details["autores"]
-    result_data.otras_obras = details["otras_obras"]
-    result_data.external_links = details["external_links"]
-    result_data.chapters = details["chapters"]
-    result_data.status = details["status"]
-    result_data.published = details["published"]
-    result_data.score = details["score"]
-    result_data.related_manga = details["related_manga"]
+    branches = branches_for(include)
+    with stage("details", "jikan"):
+        if title is None:
+            details = await fetch_manga_details_by_id(mal_id, branches=branches)
+        else:
+            details = await fetch_manga_details(title, branches=branches)
+    missing = missing_branches(details, branches)
+    if not details.get("title"):
+        if missing:
+            # Jikan failed or its breaker is open: nothing to send, but worth a retry
+            raise HTTPException(
+                status_code=503,
+                detail="Manga details are unavailable right now. Please retry later.",
+                headers={"Retry-After": "30"},
+            )
+        if title is None:
+            raise HTTPException(status_code=404, detail="No manga found with this id.")
+
+    result_data = SearchRecord(
+        found=True,
+        titulo=title or details["title"],
+        **{field: details[field] for field in DETAIL_FIELDS},
+    )
+    popularity.record(result_data.titulo, details.get("mal_id"))
 
     # Translate Synopsis
     result_data.sinopsis_en = result_data.sinopsis
-    result_data.sinopsis_es = translate_synopsis(result_data.sinopsis)
+    if included(include, "translation"):
+        with stage("details", "translation"):
+            result_data.sinopsis_es = await translate_synopsis(result_data.sinopsis)
 
-    return result_data
+    body = encode_result(result_data, include)
+    # Fresh for as long as the Jikan record it was built from
+    cached = await jikan_cache.peek(
+        mal_key(mal_id) if title is None else title_key(title)
+    )
+    entry = CachedDetails(
+        body=body,
+        etag='"%s"' % hashlib.sha1(body).hexdigest()[:24],
+        modified_at=details.get("modified_at"),
+        fresh_until=time.time() + max(0.0, cached[1] if cached is not None else 0.0),
+        title=result_data.titulo,
+        complete=not missing,
+    )
+    details_responses.set(cache_key, entry)
+    return entry
+
+def _not_modified(request: Request, entry: CachedDetails) -> bool:
+    """Evaluates If-None-Match, or If-Modified-Since when there's no If-None-Match."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or entry.etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and entry.modified_at:
+        try:
+            return (
+                int(entry.modified_at)
+                <= parsedate_to_datetime(if_modified_since).timestamp()
+            )
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def cacheable_details(request: Request, entry: CachedDetails) -> Response:
+    """
+    Response for the GET variants, with validators, Cache-Control and 304s. Records
+    missing a part that failed to load aren't stored by caches, so the next request
+    comes back for the whole record.
+    """
+    if entry.complete:
+        cache_control = "public, max-age=%d, stale-while-revalidate=%d" % (
+            max(0, entry.fresh_until - time.time()), JIKAN_CACHE_STALE_TTL,
+        )
+    else:
+        cache_control = "no-store"
+    headers = {"ETag": entry.etag, "Cache-Control": cache_control}
+    if entry.modified_at:
+        headers["Last-Modified"] = formatdate(entry.modified_at, usegmt=True)
+    if _not_modified(request, entry):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+@router.post("/details", response_model=MangaSearchResult)
+async def get_manga_details(
+    title: str = Form(...),
+    include: Optional[str] = Form(None),
+):
+    """Details for a title; `include` selects the parts to send, as in /search."""
+    entry = await details_response(
+        normalize_title(title), title, include=parse_include(include)
+    )
+    return json_response(entry.body)
+
+@router.get("/details", response_model=MangaSearchResult)
+async def get_manga_details_by_title(
+    request: Request,
+    title: str = Query(..., min_length=1),
+    include: Optional[str] = Query(None),
+):
+    """
+    Cacheable /details: carries ETag, Last-Modified and Cache-Control and answers 304.
+    """
+    entry = await details_response(
+        normalize_title(title), title, include=parse_include(include)
+    )
+    return cacheable_details(request, entry)
+
+@router.get("/details/{mal_id}", response_model=MangaSearchResult)
+async def get_manga_details_by_id(
+    request: Request, mal_id: int, include: Optional[str] = Query(None)
+):
+    """
+    Like GET /details?title=, by MyAnimeList id; 404 if Jikan has no such manga, 503
+    with Retry-After if Jikan couldn't be reached.
+    """
+    entry = await details_response(
+        ("mal", mal_id), None, mal_id, include=parse_include(include)
+    )
+    return cacheable_details(request, entry)
@@ -1,6 +1,8 @@
 from typing import List, Optional
+
 from pydantic import BaseModel
 
+
 class Author(BaseModel):
     name: Optional[str] = None
     url: Optional[str] = None
@@ -45,3 +47,34 @@ class MangaSearchResult(BaseModel):
     related_manga: List[RelatedWork] = []
     otras_coincidencias: List[OtherMatch] = []
     match_image_url: Optional[str] = None
+
+class BatchPage(BaseModel):
+    filename: str
+    found: bool = False
+    similarity_confidence: float = 0.0
+    capitulo_estimado: Optional[str] = None
+    pagina_estimada: Optional[str] = None
+    duplicate_of: Optional[str] = None
+    message: Optional[str] = None
+
+class BatchTitleResult(MangaSearchResult):
+    pages: List[BatchPage] = []
+
+class BatchSearchResult(BaseModel):
+    total_pages: int
+    unique_pages: int
+    results: List[BatchTitleResult] = []
+    unmatched: List[BatchPage] = []
+
+class JobError(BaseModel):
+    status_code: int
+    detail: str
+
+class JobStatus(BaseModel):
+    id: str
+    status: str  # queued, running, done or failed
+    attempts: int = 0
+    created_at: float
+    finished_at: Optional[float] = None
+    result: Optional[MangaSearchResult] = None
+    error: Optional[JobError] = None
@@ -0,0 +1,266 @@
+import asyncio
+import math
+import os
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Dict, Optional
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .circuit_breaker import endpoint_of
+from .metrics import admission_queue_seconds, admission_rejected
+
+# Requests handled at once per endpoint (0 disables admission control for it)
+ADMISSION_SEARCH_CONCURRENCY = int(os.getenv("ADMISSION_SEARCH_CONCURRENCY", "8"))
+ADMISSION_BATCH_CONCURRENCY = int(os.getenv("ADMISSION_BATCH_CONCURRENCY", "2"))
+ADMISSION_DETAILS_CONCURRENCY = int(os.getenv("ADMISSION_DETAILS_CONCURRENCY", "16"))
+# Requests waiting per endpoint, and per client and endpoint, before new ones are shed
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_CLIENT_QUEUE = int(os.getenv("ADMISSION_CLIENT_QUEUE", "8"))
+# Seconds a request may wait for a slot before it is answered 503
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+# Clients are told apart by this header, else by IP (the first X-Forwarded-For hop when
+# that header is trusted)
+ADMISSION_CLIENT_HEADER = (
+    os.getenv("ADMISSION_CLIENT_HEADER", "X-API-Key").lower().encode()
+)
+ADMISSION_TRUST_FORWARDED = os.getenv("ADMISSION_TRUST_FORWARDED", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionQueue:
+    """
+    Bounded concurrency for one endpoint with a fair wait queue in front of it.
+
+    Each client has its own FIFO of waiters. When a slot frees up it goes to the waiting
+    client with the fewest requests in progress, round-robin among ties, so a client
+    flooding the endpoint only ever competes for its share. Requests are shed up front
+    (queue full) or after `max_wait`, before any of their body has been read.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        concurrency: int,
+        max_queue: int,
+        client_queue: int,
+        max_wait: float,
+    ):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.client_queue = client_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self._active_by_client = Counter()
+        self._waiters: "OrderedDict[str, deque]" = OrderedDict()
+        self._queued = 0
+        # Moving average of how long a request holds its slot, for Retry-After
+        self._service_seconds = 1.0
+
+        self.admitted = 0
+        self.rejected = Counter()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": self._queued,
+            "waiting_clients": len(self._waiters),
+            "admitted": self.admitted,
+            **{f"rejected_{reason}": count for reason, count in self.rejected.items()},
+        }
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue has likely drained."""
+        return min(
+            60,
+            max(
+                1,
+                math.ceil(
+                    self._service_seconds * (self._queued + 1) / self.concurrency
+                ),
+            ),
+        )
+
+    def _reject(self, status_code: int, reason: str) -> AdmissionRejected:
+        self.rejected[reason] += 1
+        admission_rejected.inc(endpoint=self.name, reason=reason)
+        return AdmissionRejected(status_code, reason, self.retry_after())
+
+    async def acquire(self, client: str) -> None:
+        if self.active < self.concurrency and not self._waiters:
+            self._admit(client)
+            admission_queue_seconds.observe(0, endpoint=self.name)
+            return
+
+        if self._queued >= self.max_queue:
+            raise self._reject(503, "queue_full")
+        waiters = self._waiters.get(client)
+        if waiters is not None and len(waiters) >= self.client_queue:
+            raise self._reject(429, "client_queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(client, deque()).append(future)
+        self._queued += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait({future}, timeout=self.max_wait)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(client, 0)
+            else:
+                self._discard(client, future)
+            raise
+        if not future.done():
+            self._discard(client, future)
+            raise self._reject(503, "timeout")
+        admission_queue_seconds.observe(time.perf_counter() - start, endpoint=self.name)
+
+    def release(self, client: str, held_seconds: float) -> None:
+        self.active -= 1
+        self._active_by_client[client] -= 1
+        if self._active_by_client[client] <= 0:
+            del self._active_by_client[client]
+        self._service_seconds = 0.9 * self._service_seconds + 0.1 * held_seconds
+        self._grant_next()
+
+    def _admit(self, client: str) -> None:
+        self.active += 1
+        self._active_by_client[client] += 1
+        self.admitted += 1
+
+    def _discard(self, client: str, future: asyncio.Future) -> None:
+        future.cancel()
+        waiters = self._waiters.get(client)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            self._queued -= 1
+            if not waiters:
+                del self._waiters[client]
+
+    def _grant_next(self) -> None:
+        while self.active < self.concurrency and self._waiters:
+            # min() keeps the first of equals; moving the winner last round-robins ties
+            client = min(self._waiters, key=lambda c: self._active_by_client.get(c, 0))
+            waiters = self._waiters[client]
+            future = waiters.popleft()
+            self._queued -= 1
+            if waiters:
+                self._waiters.move_to_end(client)
+            else:
+                del self._waiters[client]
+            if not future.done():
+                self._admit(client)
+                future.set_result(None)
+
+
+def _queues() -> Dict[str, AdmissionQueue]:
+    def queue(name: str, concurrency: int) -> Optional[AdmissionQueue]:
+        if concurrency <= 0:
+            return None
+        return AdmissionQueue(
+            name,
+            concurrency,
+            ADMISSION_MAX_QUEUE,
+            ADMISSION_CLIENT_QUEUE,
+            ADMISSION_MAX_WAIT,
+        )
+
+    # /search and /search/stream run the same pipeline, so they share their slots
+    search = queue("search", ADMISSION_SEARCH_CONCURRENCY)
+    details = queue("details", ADMISSION_DETAILS_CONCURRENCY)
+    paths = {
+        "/search": search,
+        "/search/stream": search,
+        "/search/batch": queue("batch", ADMISSION_BATCH_CONCURRENCY),
+        "/details": details,
+        "/details/{id}": details,
+    }
+    return {path: q for path, q in paths.items() if q is not None}
+
+
+admission_queues = _queues()
+
+
+def admission_stats() -> dict:
+    return {q.name: q.stats() for q in admission_queues.values()}
+
+
+def client_id(scope: Scope) -> str:
+    headers = dict(scope["headers"])
+    api_key = headers.get(ADMISSION_CLIENT_HEADER)
+    if api_key:
+        return "key:" + api_key.decode("latin-1")
+    forwarded = headers.get(b"x-forwarded-for") if ADMISSION_TRUST_FORWARDED else None
+    if forwarded:
+        return "ip:" + forwarded.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+class AdmissionControlMiddleware:
+    """
+    Holds requests to the expensive endpoints in their AdmissionQueue until a slot is
+    free, before the upload is read. Shed requests get 503 (endpoint saturated) or 429
+    (this client already has too many waiting), both with Retry-After.
+    """
+
+    def __init__(self, app: ASGIApp, queues: Dict[str, AdmissionQueue]):
+        self.app = app
+        self.queues = queues
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        queue = (
+            self.queues.get(endpoint_of(scope["path"]))
+            if scope["type"] == "http"
+            else None
+        )
+        if queue is None or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        client = client_id(scope)
+        try:
+            await queue.acquire(client)
+        except AdmissionRejected as e:
+            await self._reject(send, e)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            queue.release(client, time.perf_counter() - start)
+
+    @staticmethod
+    async def _reject(send: Send, rejection: AdmissionRejected) -> None:
+        if rejection.status_code == 429:
+            detail = (
+                b"Too many requests from this client are already waiting. "
+                b"Please retry later."
+            )
+        else:
+            detail = b"The server is busy. Please retry later."
+        body = b'{"detail":"' + detail + b'"}'
+        await send({
+            "type": "http.response.start",
+            "status": rejection.status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(rejection.retry_after).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,137 @@
+import os
+import re
+import time
+from collections import deque
+from typing import Dict
+from urllib.parse import urlsplit
+
+# Outcomes remembered per endpoint, and how many are needed before the breaker may trip
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+# Trip when this share of the window failed (5xx, timeout, connection error) or was slow
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_SLOW_RATE = float(os.getenv("BREAKER_SLOW_RATE", "0.8"))
+# Seconds an open breaker fails fast before letting a probe through
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an upstream endpoint whose breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open breaker over a rolling window of call outcomes.
+
+    While closed, calls go through and their outcome is recorded; once the window holds
+    at least BREAKER_MIN_CALLS and too many failed or were slower than
+    `slow_call_seconds`, the breaker opens and calls raise CircuitOpen straight away.
+    After BREAKER_OPEN_SECONDS one probe call is let through (half-open): success closes
+    the breaker, failure opens it again.
+    """
+
+    def __init__(self, name: str, slow_call_seconds: float):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=BREAKER_WINDOW)  # (failed, slow)
+        self._opened_at = 0.0
+        self._probing = False
+
+        self.rejected = 0
+        self.trips = 0
+
+    def stats(self) -> dict:
+        calls = len(self._outcomes)
+        return {
+            "state": self.state,
+            "calls": calls,
+            "failures": sum(failed for failed, _ in self._outcomes),
+            "slow": sum(slow for _, slow in self._outcomes),
+            "rejected": self.rejected,
+            "trips": self.trips,
+        }
+
+    def allow(self) -> None:
+        """
+        Raises CircuitOpen unless a call may go out now; a half-open probe is reserved.
+        """
+        if (
+            self.state == OPEN
+            and time.monotonic() - self._opened_at >= BREAKER_OPEN_SECONDS
+        ):
+            self.state = HALF_OPEN
+        if self.state == CLOSED:
+            return
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return
+        self.rejected += 1
+        raise CircuitOpen(f"{self.name} circuit is open")
+
+    def release(self) -> None:
+        """
+        Gives back a reserved call that ended without an outcome (cancelled, shed).
+        """
+        self._probing = False
+
+    def record(self, failed: bool, elapsed: float) -> None:
+        slow = elapsed > self.slow_call_seconds
+        if self.state == HALF_OPEN:
+            self._probing = False
+            if failed or slow:
+                self._open()
+            else:
+                self.state = CLOSED
+                self._outcomes.clear()
+            return
+
+        self._outcomes.append((failed, slow))
+        calls = len(self._outcomes)
+        if self.state == CLOSED and calls >= BREAKER_MIN_CALLS:
+            failures = sum(f for f, _ in self._outcomes)
+            slows = sum(s for _, s in self._outcomes)
+            if (
+                failures / calls >= BREAKER_ERROR_RATE
+                or slows / calls >= BREAKER_SLOW_RATE
+            ):
+                self._open()
+
+    def _open(self) -> None:
+        print(f"Circuit breaker {self.name} opened")
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.trips += 1
+
+
+def endpoint_of(url: str) -> str:
+    """Groups URLs by route: /v4/manga/13/full -> /v4/manga/{id}/full."""
+    return re.sub(r"/\d+(?=/|$)", "/{id}", urlsplit(url).path)
+
+
+class BreakerGroup:
+    """One CircuitBreaker per endpoint of an upstream, created on first use."""
+
+    def __init__(self, name: str, slow_call_seconds: float):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def for_url(self, url: str) -> CircuitBreaker:
+        endpoint = endpoint_of(url)
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = self._breakers[endpoint] = CircuitBreaker(
+                f"{self.name} {endpoint}", self.slow_call_seconds
+            )
+        return breaker
+
+    def stats(self) -> dict:
+        return {
+            endpoint: breaker.stats() for endpoint, breaker in self._breakers.items()
+        }
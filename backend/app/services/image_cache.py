@@ -0,0 +1,135 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Hashable, List, Tuple
+
+from PIL import Image
+
+# Max Hamming distance (out of 64 bits) for two images to count as the same page
+PHASH_THRESHOLD = int(os.getenv("PHASH_THRESHOLD", "6"))
+PHASH_CACHE_TTL = int(os.getenv("PHASH_CACHE_TTL", str(24 * 3600)))
+PHASH_CACHE_SIZE = int(os.getenv("PHASH_CACHE_SIZE", "5000"))
+
+
+def dhash_image(img: Image.Image, hash_size: int = 8) -> int:
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = small.tobytes()  # One byte per pixel in mode L, row by row
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over Hamming distance, for radius queries on 64-bit hashes.
+    """
+
+    def __init__(self):
+        self.root = None  # Nodes are [hash, {distance: child}]
+        self.size = 0
+
+    def add(self, value: int) -> None:
+        if self.root is None:
+            self.root = [value, {}]
+            self.size = 1
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [value, {}]
+                self.size += 1
+                return
+            node = child
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, int]]:
+        """
+        Returns (distance, hash) for every stored hash within `radius`, closest first.
+        """
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                found.append((distance, node[0]))
+            for child_distance, child in node[1].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        found.sort()
+        return found
+
+
+class PerceptualCache:
+    """
+    LRU + TTL cache keyed by perceptual hash, where a lookup matches any stored hash
+    within `threshold` bits. `variant` separates results for the same image that depend
+    on request options (e.g. the NSFW filter). BK-trees don't support deletion, so
+    evicted hashes stay in the tree until it is rebuilt once it holds twice as many
+    hashes as the cache.
+    """
+
+    def __init__(self, maxsize: int, ttl: int, threshold: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries: "OrderedDict[Tuple[int, Hashable], Tuple[float, object]]" = (
+            OrderedDict()
+        )
+        self._tree = BKTree()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, image_hash: int, variant: Hashable = None):
+        now = time.monotonic()
+        for _, candidate in self._tree.search(image_hash, self.threshold):
+            key = (candidate, variant)
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            expires_at, value = entry
+            if expires_at < now:
+                del self._entries[key]
+                continue
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+        self.misses += 1
+        return None
+
+    def set(self, image_hash: int, value, variant: Hashable = None) -> None:
+        key = (image_hash, variant)
+        if key not in self._entries:
+            self._tree.add(image_hash)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        if self._tree.size > 2 * max(len(self._entries), 1):
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        self._tree = BKTree()
+        for image_hash in {h for h, _ in self._entries}:
+            self._tree.add(image_hash)
+
+
+# SauceNAO results, keyed by the perceptual hash of the uploaded page
+saucenao_cache = PerceptualCache(PHASH_CACHE_SIZE, PHASH_CACHE_TTL, PHASH_THRESHOLD)
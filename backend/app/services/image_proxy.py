@@ -0,0 +1,256 @@
+import asyncio
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+from urllib.parse import quote, urlsplit
+
+from PIL import Image, ImageOps
+
+from .http_client import get_client
+from .preprocess import run_image_job
+from .singleflight import SingleFlight
+from .tiered_cache import (
+    CACHE_DB_PATH,
+    TRIM_EVERY_WRITES,
+    get_connection,
+    lru_victims,
+)
+
+# Public base URL of this API (e.g. https://api.example.com). Empty leaves image URLs as
+# the upstreams returned them; set, result builders point images at GET /img/{size}.
+IMAGE_PROXY_BASE_URL = os.getenv("IMAGE_PROXY_BASE_URL", "").rstrip("/")
+IMAGE_PROXY_DIR = os.getenv("IMAGE_PROXY_DIR", "cache/images")
+IMAGE_PROXY_MAX_MB = int(os.getenv("IMAGE_PROXY_MAX_MB", "500"))
+IMAGE_PROXY_QUALITY = int(os.getenv("IMAGE_PROXY_QUALITY", "80"))
+# Only images from these hosts (or their subdomains) are proxied
+IMAGE_PROXY_ALLOWED_HOSTS = [
+    host.strip().lower()
+    for host in os.getenv(
+        "IMAGE_PROXY_ALLOWED_HOSTS", "myanimelist.net,saucenao.com"
+    ).split(",")
+    if host.strip()
+]
+# Source images larger than this are not proxied
+IMAGE_PROXY_MAX_SOURCE_BYTES = 10 * 1024 * 1024
+
+# Longest edge per size name: alternative matches, author portraits and work cards use
+# thumb, the SauceNAO match card, cover the main cover
+IMAGE_SIZES = {"thumb": 160, "card": 320, "cover": 640}
+
+
+class ImageProxyError(Exception):
+    pass
+
+
+def is_proxyable(url: Optional[str]) -> bool:
+    if not url:
+        return False
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    return parts.scheme in ("http", "https") and any(
+        host == allowed or host.endswith("." + allowed)
+        for allowed in IMAGE_PROXY_ALLOWED_HOSTS
+    )
+
+
+def proxied_url(url: Optional[str], size: str, warm: bool = False) -> Optional[str]:
+    """
+    The proxy URL serving `url` at `size`, or `url` unchanged when the proxy is off or
+    the host isn't allowed. `warm` renders it right away, for upstream URLs that expire
+    (SauceNAO thumbnails) before the browser might ask for them.
+    """
+    if not IMAGE_PROXY_BASE_URL or not is_proxyable(url):
+        return url
+    if warm:
+        _warm(url, size)
+    return f"{IMAGE_PROXY_BASE_URL}/img/{size}?url={quote(url, safe='')}"
+
+
+class ImageStore:
+    """
+    Rendered images as files under `directory`, indexed in SQLite so every worker shares
+    them. Bounded by total bytes; the least recently served files are evicted first.
+    The methods block on the disk and SQLite, so async code calls them through
+    asyncio.to_thread.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, path: str = CACHE_DB_PATH):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._writes_since_trim = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = get_connection(self.path, owner="image_proxy")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS image_files (
+                    key TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS image_files_accessed"
+                " ON image_files (accessed_at)"
+            )
+        return self._conn
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".webp")
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._file(key), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        now = time.time()
+        try:
+            with self._lock:
+                # An hour of LRU precision is plenty and saves a write on every hit
+                self.conn.execute(
+                    "UPDATE image_files SET accessed_at = ?"
+                    " WHERE key = ? AND accessed_at < ?",
+                    (now, key, now - 3600),
+                )
+        except sqlite3.Error as e:
+            # The file is served all the same; only its LRU position is stale
+            print(f"Image proxy: could not touch {key}: {e}")
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._file(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(data)
+        os.replace(temp, path)
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO image_files VALUES (?, ?, ?)",
+                (key, len(data), time.time()),
+            )
+            self._maybe_trim()
+
+    def _maybe_trim(self) -> None:
+        self._writes_since_trim += 1
+        if self._writes_since_trim < TRIM_EVERY_WRITES:
+            return
+        self._writes_since_trim = 0
+        doomed = lru_victims(self.conn, "image_files", self.max_bytes)
+        self.conn.executemany(
+            "DELETE FROM image_files WHERE key = ?", [(key,) for key in doomed]
+        )
+        for key in doomed:
+            try:
+                os.remove(self._file(key))
+            except FileNotFoundError:
+                pass
+        self.evictions += len(doomed)
+
+
+image_store = ImageStore(IMAGE_PROXY_DIR, IMAGE_PROXY_MAX_MB * 1024 * 1024)
+image_flight = SingleFlight("image_proxy")
+_warm_tasks = set()
+
+
+def image_key(url: str, size: str) -> str:
+    return f"{hashlib.sha1(url.encode()).hexdigest()}-{size}"
+
+
+def _render(data: bytes, max_edge: int, quality: int) -> bytes:
+    """Runs in a worker process: first frame, EXIF orientation, downscale, WebP."""
+    img = Image.open(io.BytesIO(data))
+    img.seek(0)
+    img.draft("RGB", (max_edge, max_edge))
+    img = ImageOps.exif_transpose(img)
+    img = img.convert("RGBA" if img.mode in ("RGBA", "LA", "P") else "RGB")
+    img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    out = io.BytesIO()
+    img.save(out, "WEBP", quality=quality, method=4)
+    return out.getvalue()
+
+
+async def get_image(url: str, size: str) -> bytes:
+    """The WebP rendition of `url` at `size`, from disk or fetched and rendered once."""
+    key = image_key(url, size)
+    data = await asyncio.to_thread(image_store.get, key)
+    if data is not None:
+        return data
+    return await image_flight.do(key, lambda: _fetch_and_render(url, size, key))
+
+
+async def _fetch_source(url: str) -> bytes:
+    """
+    Downloads `url`, abandoning the transfer once it exceeds the source size limit.
+    """
+    too_large = ImageProxyError(
+        f"{url} is larger than {IMAGE_PROXY_MAX_SOURCE_BYTES} bytes"
+    )
+    chunks = []
+    received = 0
+    try:
+        async with get_client(url).stream("GET", url) as response:
+            if response.status_code != 200:
+                raise ImageProxyError(f"HTTP {response.status_code} from {url}")
+            length = response.headers.get("content-length", "")
+            if length.isdigit() and int(length) > IMAGE_PROXY_MAX_SOURCE_BYTES:
+                raise too_large
+            async for chunk in response.aiter_bytes():
+                received += len(chunk)
+                if received > IMAGE_PROXY_MAX_SOURCE_BYTES:
+                    raise too_large
+                chunks.append(chunk)
+    except ImageProxyError:
+        raise
+    except Exception as e:
+        raise ImageProxyError(f"Could not fetch {url}: {e}")
+    return b"".join(chunks)
+
+
+async def _fetch_and_render(url: str, size: str, key: str) -> bytes:
+    source = await _fetch_source(url)
+    try:
+        data = await run_image_job(
+            _render, source, IMAGE_SIZES[size], IMAGE_PROXY_QUALITY
+        )
+    except Exception as e:
+        raise ImageProxyError(f"Could not decode {url}: {e}")
+    try:
+        await asyncio.to_thread(image_store.put, key, data)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Image proxy: could not store {url}: {e}")
+    return data
+
+
+def _warm(url: str, size: str) -> None:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return
+
+    async def warm():
+        try:
+            await get_image(url, size)
+        except ImageProxyError as e:
+            print(f"Image proxy: could not warm {url}: {e}")
+
+    task = asyncio.create_task(warm())
+    _warm_tasks.add(task)
+    task.add_done_callback(_warm_tasks.discard)
@@ -1,17 +1,100 @@
-import requests
-from cachetools import TTLCache, cached
-from ..schemas import Author, RelatedWork, ExternalLink
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from typing import AbstractSet, Awaitable, Callable, Dict, Iterable, Optional
+from urllib.parse import urlencode
 
-# Cache for 1 hour, max 100 items
-cache = TTLCache(maxsize=100, ttl=3600)
+from ..records import AuthorRecord, LinkRecord, WorkRecord, json_default
+from .circuit_breaker import BreakerGroup
+from .image_proxy import proxied_url
+from .rate_limit import (
+    PRIORITY_BACKGROUND,
+    TokenBucket,
+    UpstreamScheduler,
+    hedged_request,
+    request_priority,
+)
+from .singleflight import SingleFlight
+from .snapshot import snapshot
+from .tiered_cache import TieredCache
+from .title_index import normalize_title, title_index
+from .tracing import span
 
-@cached(cache)
-def fetch_manga_details(title: str) -> dict:
-    """
-    Fetches manga details from Jikan API based on title.
-    Returns a dictionary with keys: sinopsis, portada_url, autores, otras_obras, external_links
-    """
-    details = {
+JIKAN_BASE_URL = os.getenv("JIKAN_BASE_URL", "https://api.jikan.moe/v4")
+
+# Seconds a Jikan request may take once it has a rate-limit slot; a branch whose request
+# times out is dropped from the result (time queued for the slot doesn't count)
+JIKAN_BRANCH_TIMEOUT = float(os.getenv("JIKAN_BRANCH_TIMEOUT", "8"))
+
+# Records are fresh for JIKAN_CACHE_TTL, then served stale (while refreshing) for
+# another JIKAN_CACHE_STALE_TTL
+JIKAN_CACHE_TTL = float(os.getenv("JIKAN_CACHE_TTL", str(6 * 3600)))
+JIKAN_CACHE_STALE_TTL = float(os.getenv("JIKAN_CACHE_STALE_TTL", str(24 * 3600)))
+JIKAN_CACHE_MEMORY_SIZE = int(os.getenv("JIKAN_CACHE_MEMORY_SIZE", "1000"))
+JIKAN_CACHE_MAX_MB = int(os.getenv("JIKAN_CACHE_MAX_MB", "200"))
+# Results with missing branches are only kept briefly so the next lookup retries them
+JIKAN_PARTIAL_TTL = 60
+
+# Jikan allows 3 requests per second and 60 per minute
+JIKAN_RATE_PER_SECOND = int(os.getenv("JIKAN_RATE_PER_SECOND", "3"))
+JIKAN_RATE_PER_MINUTE = int(os.getenv("JIKAN_RATE_PER_MINUTE", "60"))
+scheduler = UpstreamScheduler(
+    "jikan",
+    [TokenBucket(JIKAN_RATE_PER_SECOND, 1), TokenBucket(JIKAN_RATE_PER_MINUTE, 60)],
+)
+# Calls slower than this count against the endpoint's breaker like failures do
+JIKAN_SLOW_CALL_SECONDS = float(os.getenv("JIKAN_SLOW_CALL_SECONDS", "3"))
+breakers = BreakerGroup("jikan", JIKAN_SLOW_CALL_SECONDS)
+# Seconds before an unanswered interactive read is duplicated (0 disables hedging)
+JIKAN_HEDGE_DELAY = float(os.getenv("JIKAN_HEDGE_DELAY", "0"))
+
+# Fields each enrichment branch fills in, reported through `progress` as it lands
+BRANCH_FIELDS = {
+    "full": [
+        "mal_id",
+        "sinopsis",
+        "portada_url",
+        "autores",
+        "chapters",
+        "status",
+        "published",
+        "score",
+        "related_manga",
+    ],
+    "people": ["autores"],
+    "people_manga": ["otras_obras"],
+    "external": ["external_links"],
+}
+
+ALL_BRANCHES = frozenset(BRANCH_FIELDS)
+# Optional parts of the details and the branch providing each. The rest (title, cover,
+# synopsis, status, ...) comes with the search hit or /full and is always there.
+INCLUDE_BRANCHES = {
+    "relations": "full",
+    "authors": "people",
+    "author_works": "people_manga",
+    "external_links": "external",
+}
+
+ProgressCallback = Callable[[str, dict], None]
+
+ALLOWED_RELATIONS = [
+    "Prequel",
+    "Sequel",
+    "Spin-Off",
+    "Side Story",
+    "Parent Story",
+    "Alternative Setting",
+    "Alternative Version",
+]
+
+
+def _empty_details() -> dict:
+    return {
+        "mal_id": None,
+        "title": None,
         "sinopsis": None,
         "portada_url": None,
         "autores": [],
@@ -20,120 +103,589 @@ def fetch_manga_details(title: str) -> dict:
         "chapters": None,
         "status": None,
         "published": None,
-        "related_manga": []
+        "score": None,
+        "related_manga": [],
+        "timings": {},
+        # Branches the record holds; lookups needing others fetch and merge just those
+        "branches": [],
+        # When the content last changed (unchanged refreshes keep it), for Last-Modified
+        "modified_at": None,
     }
-    
+
+
+def _dump_details(details: dict) -> str:
+    return json.dumps(details, default=json_default)
+
+
+def _load_details(payload: str) -> dict:
+    details = json.loads(payload)
+    details["autores"] = [AuthorRecord(**a) for a in details["autores"]]
+    details["otras_obras"] = [WorkRecord(**w) for w in details["otras_obras"]]
+    details["related_manga"] = [WorkRecord(**w) for w in details["related_manga"]]
+    details["external_links"] = [LinkRecord(**e) for e in details["external_links"]]
+    return details
+
+
+# Records are stored under "mal:<id>", with "title:<normalized title>" aliases pointing
+# at them, so /search (SauceNAO titles) and /details (clicked titles) share one entry
+# per manga.
+cache = TieredCache(
+    "jikan",
+    ttl=JIKAN_CACHE_TTL,
+    stale_ttl=JIKAN_CACHE_STALE_TTL,
+    memory_size=JIKAN_CACHE_MEMORY_SIZE,
+    max_bytes=JIKAN_CACHE_MAX_MB * 1024 * 1024,
+    dumps=_dump_details,
+    loads=_load_details,
+)
+# Raw Jikan records with their ETag / Last-Modified, so refreshes can ask Jikan whether
+# anything changed (a 304 costs neither side a body). Disk only; nothing reads them hot.
+upstream_cache = TieredCache(
+    "jikan_upstream",
+    ttl=JIKAN_CACHE_TTL + JIKAN_CACHE_STALE_TTL,
+    memory_size=0,
+    max_bytes=JIKAN_CACHE_MAX_MB * 1024 * 1024,
+)
+revalidation_stats = {"conditional": 0, "not_modified": 0}
+_background_tasks = set()
+
+# Concurrent lookups of a title, or titles resolving to the same manga, share one chain
+title_flight = SingleFlight("jikan_title")
+mal_flight = SingleFlight("jikan_mal_id")
+
+
+def title_key(title: str) -> str:
+    return f"title:{normalize_title(title)}"
+
+
+def mal_key(mal_id: int) -> str:
+    return f"mal:{mal_id}"
+
+
+def branches_for(include: Optional[Iterable[str]]) -> frozenset:
+    """The Jikan branches needed for a set of include names (None means everything)."""
+    if include is None:
+        return ALL_BRANCHES
+    return frozenset(
+        INCLUDE_BRANCHES[name] for name in include if name in INCLUDE_BRANCHES
+    )
+
+
+def _branches_of(details: dict) -> frozenset:
+    # Records cached before branches were tracked always had all of them
+    return frozenset(details.get("branches", ALL_BRANCHES))
+
+
+def missing_branches(details: dict, branches: AbstractSet[str]) -> frozenset:
+    """
+    The `branches` a record lacks because fetching them failed (or was never tried).
+    """
+    return frozenset(branches) - _branches_of(details)
+
+
+async def fetch_manga_details(
+    title: str,
+    progress: Optional[ProgressCallback] = None,
+    branches: AbstractSet[str] = ALL_BRANCHES,
+) -> dict:
+    """
+    Fetches manga details from Jikan API based on title.
+    Returns a dictionary with keys: mal_id, title, sinopsis, portada_url, autores,
+    otras_obras, external_links, chapters, status, published, score, related_manga,
+    branches, modified_at and timings (ms per Jikan branch).
+    Only the enrichment `branches` asked for are fetched (see branches_for); fields of
+    other branches are filled in only if the cached record already had them.
+    Lookups go through the cache, then the offline snapshot, and only then to Jikan.
+    Stale cache entries are returned immediately and refreshed in the background.
+    When this call does the fetching, `progress(branch, fields)` is called as each
+    branch lands, with the fields listed in BRANCH_FIELDS for that branch.
+    """
     if not title:
+        return _empty_details()
+
+    branches = frozenset(branches)
+    cached = await cache.get(title_key(title))
+    if cached is not None and branches <= _branches_of(cached[0]):
+        details, fresh = cached
+        if not fresh:
+            _schedule_refresh(title, _branches_of(details))
+        return details
+
+    return await title_flight.do(
+        (title_key(title), branches),
+        lambda: _load_and_store(title, progress, branches=branches),
+    )
+
+
+async def fetch_manga_details_by_id(
+    mal_id: int, branches: AbstractSet[str] = ALL_BRANCHES
+) -> dict:
+    """fetch_manga_details for a known mal_id: no title search, same cache entry."""
+    branches = frozenset(branches)
+    cached = await cache.get(mal_key(mal_id))
+    if cached is not None and branches <= _branches_of(cached[0]):
+        details, fresh = cached
+        if not fresh:
+            _schedule_background(mal_key(mal_id), lambda: _load_mal_id(
+                mal_id, None, {"mal_id": mal_id}, {}, branches=_branches_of(details)
+            ))
+        return details
+
+    return await _load_mal_id(mal_id, None, {"mal_id": mal_id}, {}, branches=branches)
+
+
+def _schedule_refresh(title: str, branches: frozenset) -> None:
+    key = title_key(title)
+    _schedule_background(key, lambda: title_flight.do(
+        (key, branches), lambda: _load_and_store(title, branches=branches)
+    ))
+
+
+def _schedule_background(name: str, load: Callable[[], Awaitable]) -> None:
+    if any(task.get_name() == name for task in _background_tasks):
+        return
+
+    async def refresh():
+        request_priority.set(PRIORITY_BACKGROUND)
+        return await load()
+
+    task = asyncio.create_task(refresh(), name=name)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def prefetch_manga_details(title: str, refresh: bool = False) -> dict:
+    """
+    Loads a manga into the cache ahead of the users asking for it; with refresh=True the
+    chain runs even if the entry is still fresh, to reset its TTL before it expires.
+    Callers run it at background priority.
+    """
+    return await title_flight.do(
+        (title_key(title), ALL_BRANCHES),
+        lambda: _load_and_store(title, refresh=refresh),
+    )
+
+
+async def _load_and_store(
+    title: str,
+    progress: Optional[ProgressCallback] = None,
+    refresh: bool = False,
+    branches: frozenset = ALL_BRANCHES,
+) -> dict:
+    timings = {}
+    # A confident local title match skips the free-text search, going straight to /full
+    mal_id = await _indexed_mal_id(title) or await _from_snapshot(
+        snapshot.find_by_title, title
+    )
+    if mal_id:
+        search_result = {"mal_id": mal_id}
+    else:
+        search_result = await _search_title(title, timings)
+        mal_id = (search_result or {}).get("mal_id")
+
+    if not mal_id:
+        details, complete = await _enrich(
+            title, search_result, timings, progress, branches
+        )
+        cache.set(title_key(title), details, None if complete else JIKAN_PARTIAL_TTL)
         return details
 
-    jikan_url = f"https://api.jikan.moe/v4/manga"
-    jikan_params = {"q": title, "limit": 1}
-    
+    details = await _load_mal_id(
+        mal_id, title, search_result, timings, progress, refresh, branches
+    )
+    cache.alias(title_key(title), mal_key(mal_id))
+    return details
+
+
+async def _load_mal_id(
+    mal_id: int,
+    title: Optional[str],
+    search_result: dict,
+    timings: Dict[str, float],
+    progress: Optional[ProgressCallback] = None,
+    refresh: bool = False,
+    branches: frozenset = ALL_BRANCHES,
+) -> dict:
+    # A different title may already have resolved to this manga
+    cached = await cache.get(mal_key(mal_id))
+    previous, fresh = cached if cached is not None else (None, False)
+    if fresh and not refresh:
+        if branches <= _branches_of(previous):
+            return previous
+        # Fetch only what the record lacks; _store merges it in
+        wanted = branches - _branches_of(previous)
+        if "full" in _branches_of(previous) and not search_result.get("title"):
+            # The record stands in for the search hit, so `full` isn't fetched again
+            search_result = _search_hit_from(previous)
+    else:
+        # Refreshing: everything the record had, plus what this lookup needs
+        wanted = branches | (
+            _branches_of(previous) if previous is not None else frozenset()
+        )
+
+    # The offline snapshot covers the popular head without touching Jikan
+    details = await _details_from_snapshot(mal_id)
+    if details is not None and wanted <= _branches_of(details):
+        return await _store(mal_id, details, previous, complete=True)
+
+    async def enrich_and_store():
+        details, complete = await _enrich(
+            title, search_result, timings, progress, wanted
+        )
+        if not complete and previous is not None:
+            # Jikan is failing (or its breaker is open); a complete stale record beats
+            # a partial one
+            return previous
+        return await _store(mal_id, details, previous, complete)
+
+    return await mal_flight.do((mal_id, wanted), enrich_and_store)
+
+
+async def _indexed_mal_id(title: str) -> Optional[int]:
+    """
+    The mal_id the local title index resolves `title` to, or None. The index is a
+    shortcut: when its database is locked or broken, the lookup goes to Jikan.
+    """
     try:
-        j_resp = requests.get(jikan_url, params=jikan_params)
-        if j_resp.status_code == 200:
-            j_data = j_resp.json()
-            if j_data.get("data"):
-                # 1. Get Basic Info from Search
-                search_result = j_data["data"][0]
-                mal_id = search_result.get("mal_id")
-                
-                # 2. Fetch Full Details if ID exists
-                manga_info = search_result # Default to search result
-                if mal_id:
-                    try:
-                        full_url = f"https://api.jikan.moe/v4/manga/{mal_id}/full"
-                        full_resp = requests.get(full_url)
-                        if full_resp.status_code == 200:
-                            full_data = full_resp.json()
-                            if full_data.get("data"):
-                                manga_info = full_data["data"]
-                    except Exception as e:
-                        print(f"Error fetching full details: {e}")
-
-                details["sinopsis"] = manga_info.get("synopsis")
-                details["chapters"] = manga_info.get("chapters")
-                details["status"] = manga_info.get("status")
-                details["published"] = manga_info.get("published", {}).get("string")
-                details["score"] = manga_info.get("score")
-                
-                # Extract Relations (Prequel/Sequel/Spin-Off/etc)
-                relations = manga_info.get("relations", [])
-                related_manga_list = []
-                allowed_relations = ["Prequel", "Sequel", "Spin-Off", "Side Story", "Parent Story", "Alternative Setting", "Alternative Version"]
-                
-                for rel in relations:
-                    relation_type = rel.get("relation")
-                    if relation_type in allowed_relations:
-                        for entry in rel.get("entry", []):
-                            if entry.get("type") == "manga":
-                                related_manga_list.append(RelatedWork(
-                                    title=entry.get("name"),
-                                    url=entry.get("url"),
-                                    relation_type=relation_type
-                                ))
-                details["related_manga"] = related_manga_list
-
-                # Prefer Jikan cover if available as it might be higher res/official
-                images = manga_info.get("images", {}).get("jpg", {})
-                large_image = images.get("large_image_url")
-                if large_image:
-                    details["portada_url"] = large_image
-                elif images.get("image_url"):
-                    details["portada_url"] = images.get("image_url")
-
-                # Extract Authors
-                authors = manga_info.get("authors", [])
-                # Initialize authors list with basic info
-                authors_data = [Author(name=a.get("name"), url=a.get("url"), mal_id=a.get("mal_id")) for a in authors]
-
-                # Fetch Related Works (for the first author found) AND Author Image
-                if authors:
-                    first_author_id = authors[0].get("mal_id")
-                    if first_author_id:
-                        try:
-                            # Fetch Author Details for Image
-                            author_details_url = f"https://api.jikan.moe/v4/people/{first_author_id}"
-                            ad_resp = requests.get(author_details_url)
-                            if ad_resp.status_code == 200:
-                                ad_data = ad_resp.json().get("data", {})
-                                # Update the first author in our list with the image
-                                authors_data[0].image_url = ad_data.get("images", {}).get("jpg", {}).get("image_url")
-
-                            # Fetch Related Works
-                            author_works_url = f"https://api.jikan.moe/v4/people/{first_author_id}/manga"
-                            a_resp = requests.get(author_works_url, params={"limit": 5}) # Top 5 works
-                            if a_resp.status_code == 200:
-                                a_data = a_resp.json()
-                                related_works = []
-                                for work in a_data.get("data", []):
-                                    # Skip the current manga if possible, but simple check is enough
-                                    work_entry = work.get("manga", {})
-                                    related_works.append(RelatedWork(
-                                        title=work_entry.get("title"),
-                                        image_url=work_entry.get("images", {}).get("jpg", {}).get("image_url"),
-                                        url=work_entry.get("url")
-                                    ))
-                                details["otras_obras"] = related_works
-                        except Exception as e:
-                            print(f"Error fetching author details/works: {e}")
-                
-                details["autores"] = authors_data
-
-                # Extract External Links
-                # Search result doesn't include external links, so we need to fetch them using the ID
-                mal_id = manga_info.get("mal_id")
-                if mal_id:
-                    try:
-                        ext_url = f"https://api.jikan.moe/v4/manga/{mal_id}/external"
-                        ext_resp = requests.get(ext_url)
-                        if ext_resp.status_code == 200:
-                            ext_data = ext_resp.json().get("data", [])
-                            details["external_links"] = [ExternalLink(name=e.get("name"), url=e.get("url")) for e in ext_data]
-                    except Exception as e:
-                        print(f"Error fetching external links: {e}")
+        return await asyncio.to_thread(title_index.lookup, title)
+    except sqlite3.Error as e:
+        print(f"Title index lookup failed for '{title}': {e}")
+        return None
 
-    except Exception as e:
-        print(f"Jikan API error: {e}")
-        
+
+async def _learn_title(mal_id: int, manga: dict, title: Optional[str]) -> None:
+    try:
+        await asyncio.to_thread(title_index.learn, mal_id, manga, query=title)
+    except sqlite3.Error as e:
+        print(f"Title index update failed for {mal_id}: {e}")
+
+
+def _search_hit_from(details: dict) -> dict:
+    """
+    The parts of a search hit _enrich builds on (title and author ids), from a record.
+    """
+    return {
+        "mal_id": details["mal_id"],
+        "title": details["title"],
+        "authors": [
+            {"mal_id": a.mal_id, "name": a.name, "url": a.url}
+            for a in details["autores"]
+        ],
+    }
+
+
+def _content(details: dict) -> str:
+    return _dump_details(
+        {k: v for k, v in details.items() if k not in ("timings", "modified_at")}
+    )
+
+
+async def _store(
+    mal_id: int, details: dict, previous: Optional[dict], complete: bool
+) -> dict:
+    """
+    Caches a freshly built record, merging in the branches it lacks from the current
+    record while that one is fresh (it keeps the current record's expiry then, so
+    merged-in branches aren't kept past their own TTL). Returns the stored record.
+    """
+    ttl = None if complete else JIKAN_PARTIAL_TTL
+    current = await cache.peek(mal_key(mal_id))
+    if current is not None and current[1] > 0:
+        current_details, remaining = current
+        own = _branches_of(details)
+        missing = _branches_of(current_details) - own
+        if missing:
+            own_fields = {field for branch in own for field in BRANCH_FIELDS[branch]}
+            for branch in missing:
+                for field in BRANCH_FIELDS[branch]:
+                    if field not in own_fields:
+                        details[field] = current_details[field]
+            details["branches"] = sorted(own | missing)
+            ttl = min(remaining, JIKAN_CACHE_TTL if ttl is None else ttl)
+
+    if (
+        previous is not None
+        and previous.get("modified_at")
+        and _content(previous) == _content(details)
+    ):
+        details["modified_at"] = previous["modified_at"]
+    cache.set(mal_key(mal_id), details, ttl)
+    return details
+
+
+async def _from_snapshot(read: Callable, *args):
+    """
+    Runs a snapshot read in a thread. The snapshot only saves Jikan calls: when its
+    database is locked or broken, the read misses and the lookup goes to Jikan.
+    """
+    try:
+        return await asyncio.to_thread(read, *args)
+    except sqlite3.Error as e:
+        print(f"Snapshot read failed: {e}")
+        return None
+
+
+async def _details_from_snapshot(mal_id: int) -> Optional[dict]:
+    branches = await _from_snapshot(snapshot.get_manga, mal_id)
+    if branches is None:
+        return None
+    details = _empty_details()
+    details["mal_id"] = mal_id
+    details["modified_at"] = time.time()
+    held = {name for name, data in branches.items() if data is not None}
+    if not (branches["full"] or {}).get("authors"):
+        held |= {"people", "people_manga"}
+    details["branches"] = sorted(held)
+    _merge_branches(details, {"mal_id": mal_id}, branches)
     return details
+
+
+async def _get_json(url: str, params: Optional[dict] = None, revalidate: bool = False):
+    """
+    GETs a Jikan resource's data. With `revalidate`, the record is kept with its
+    validators and later fetches of the same URL are conditional; a 304 returns the kept
+    record. A 404 returns {}: there is nothing to fetch, which isn't a failed branch.
+    """
+    key = url + ("?" + urlencode(params) if params else "")
+    stored = await upstream_cache.get(key) if revalidate else None
+    headers = {}
+    if stored is not None:
+        stored = stored[0]
+        if stored.get("etag"):
+            headers["If-None-Match"] = stored["etag"]
+        if stored.get("last_modified"):
+            headers["If-Modified-Since"] = stored["last_modified"]
+        if headers:
+            revalidation_stats["conditional"] += 1
+
+    resp = await hedged_request(
+        scheduler, "GET", url, JIKAN_HEDGE_DELAY, breakers=breakers, params=params,
+        headers=headers or None, attempt_timeout=JIKAN_BRANCH_TIMEOUT,
+    )
+    if resp.status_code == 304 and headers:
+        revalidation_stats["not_modified"] += 1
+        upstream_cache.set(key, stored)
+        return stored["data"]
+    if resp.status_code == 404:
+        return {}
+    if resp.status_code != 200:
+        raise RuntimeError(f"HTTP {resp.status_code} from {url}")
+    data = resp.json().get("data")
+    if revalidate and (resp.headers.get("etag") or resp.headers.get("last-modified")):
+        upstream_cache.set(key, {
+            "etag": resp.headers.get("etag"),
+            "last_modified": resp.headers.get("last-modified"),
+            "data": data,
+        })
+    return data
+
+
+async def _run_branch(name: str, coro: Awaitable, timings: Dict[str, float]):
+    """
+    Runs one enrichment branch. A failed or slow branch (JIKAN_BRANCH_TIMEOUT applies to
+    each request once the scheduler grants it a slot) yields None so the other branches
+    still make it into the result.
+    """
+    start = time.perf_counter()
+    try:
+        with span(f"jikan.{name}"):
+            return await coro
+    except Exception as e:
+        print(f"Error fetching Jikan branch '{name}': {e}")
+    finally:
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+    return None
+
+
+def _apply_manga_info(details: dict, manga_info: dict) -> None:
+    details["title"] = manga_info.get("title") or details["title"]
+    details["sinopsis"] = manga_info.get("synopsis")
+    details["chapters"] = manga_info.get("chapters")
+    details["status"] = manga_info.get("status")
+    details["published"] = (manga_info.get("published") or {}).get("string")
+    details["score"] = manga_info.get("score")
+
+    # Extract Relations (Prequel/Sequel/Spin-Off/etc), only present on the full record
+    related_manga_list = []
+    for rel in manga_info.get("relations") or []:
+        relation_type = rel.get("relation")
+        if relation_type in ALLOWED_RELATIONS:
+            for entry in rel.get("entry", []):
+                if entry.get("type") == "manga":
+                    related_manga_list.append(WorkRecord(
+                        title=entry.get("name"),
+                        url=entry.get("url"),
+                        relation_type=relation_type
+                    ))
+    details["related_manga"] = related_manga_list
+
+    # Prefer Jikan cover if available as it might be higher res/official
+    images = (manga_info.get("images") or {}).get("jpg", {})
+    details["portada_url"] = proxied_url(
+        images.get("large_image_url") or images.get("image_url"), "cover"
+    )
+
+    details["autores"] = [
+        AuthorRecord(name=a.get("name"), url=a.get("url"), mal_id=a.get("mal_id"))
+        for a in manga_info.get("authors") or []
+    ]
+
+
+def _build_author_works(works: list) -> list:
+    related_works = []
+    for work in works or []:
+        work_entry = work.get("manga", {})
+        related_works.append(
+            WorkRecord(
+                title=work_entry.get("title"),
+                image_url=proxied_url(
+                    work_entry.get("images", {}).get("jpg", {}).get("image_url"),
+                    "thumb",
+                ),
+                url=work_entry.get("url"),
+            )
+        )
+    return related_works
+
+
+def _build_external_links(links: list) -> list:
+    return [LinkRecord(name=e.get("name"), url=e.get("url")) for e in links or []]
+
+
+async def _search_title(title: str, timings: Dict[str, float]):
+    """The top Jikan search hit, {} when there is none, or None if the search failed."""
+    search_data = await _run_branch(
+        "search",
+        _get_json(f"{JIKAN_BASE_URL}/manga", {"q": title, "limit": 1}),
+        timings,
+    )
+    if search_data is None:
+        return None
+    return search_data[0] if search_data else {}
+
+
+def _merge_branches(details: dict, search_result: dict, results: dict) -> None:
+    """
+    Rebuilds details from the search hit plus whichever branches have landed so far.
+    """
+    _apply_manga_info(details, search_result)
+    if results.get("full"):
+        _apply_manga_info(details, results["full"])
+    person = results.get("people")
+    if person and details["autores"]:
+        details["autores"][0].image_url = proxied_url(
+            person.get("images", {}).get("jpg", {}).get("image_url"), "thumb"
+        )
+    if results.get("people_manga") is not None:
+        details["otras_obras"] = _build_author_works(results["people_manga"])
+    if results.get("external") is not None:
+        details["external_links"] = _build_external_links(results["external"])
+
+
+async def _enrich(
+    title: Optional[str],
+    search_result: Optional[dict],
+    timings: Dict[str, float],
+    progress: Optional[ProgressCallback] = None,
+    branches: AbstractSet[str] = ALL_BRANCHES,
+):
+    """
+    Runs the requested `branches` of the Jikan enrichment as a small dependency graph:
+
+        search ─┬─> full ───────────┐
+                ├─> external        ├─> details
+                └─> author id ─┬─> people
+                               └─> people/manga
+
+    Everything after the search runs concurrently. The author branches take the author
+    id from the search hit and only wait on `full` when the search hit has no authors.
+    `full` also runs when there is no search hit to build the base record from (known
+    mal_id). Returns (details, complete) where complete is False if any branch was
+    dropped.
+    """
+    details = _empty_details()
+    details["timings"] = timings
+
+    if search_result is None:
+        return details, False
+    if not search_result:
+        # Nothing to find, so the record is as complete as any lookup could want
+        details["branches"] = sorted(ALL_BRANCHES)
+        return details, True
+
+    # 1. Basic info from the search hit, the fallback for whatever /full misses
+    mal_id = search_result.get("mal_id")
+    details["mal_id"] = mal_id
+    _apply_manga_info(details, search_result)
+
+    if not mal_id:
+        details["branches"] = sorted(ALL_BRANCHES)
+        return details, True
+
+    # 2. Fan out everything that only needs mal_id or the author id
+    author_branches = {"people", "people_manga"} & set(branches)
+    fetch_full = (
+        "full" in branches
+        or not search_result.get("title")
+        or (author_branches and not search_result.get("authors"))
+    )
+    tasks = {}
+
+    def start(name: str, fetch) -> asyncio.Future:
+        task = asyncio.ensure_future(_run_branch(name, fetch, timings))
+        tasks[task] = name
+        return task
+
+    full_task = None
+    if fetch_full:
+        full_url = f"{JIKAN_BASE_URL}/manga/{mal_id}/full"
+        full_task = start("full", _get_json(full_url, revalidate=True))
+
+    async def author_id():
+        authors = search_result.get("authors")
+        if not authors and full_task is not None:
+            authors = ((await asyncio.shield(full_task)) or {}).get("authors")
+        return authors[0].get("mal_id") if authors else None
+
+    async def author_branch(suffix: str, params: Optional[dict] = None):
+        person_id = await author_id()
+        if not person_id:
+            return None
+        return await _get_json(
+            f"{JIKAN_BASE_URL}/people/{person_id}{suffix}", params, revalidate=True
+        )
+
+    if "external" in branches:
+        external_url = f"{JIKAN_BASE_URL}/manga/{mal_id}/external"
+        start("external", _get_json(external_url, revalidate=True))
+    if "people" in branches:
+        start("people", author_branch(""))
+    if "people_manga" in branches:
+        start("people_manga", author_branch("/manga", {"limit": 5}))  # Top 5 works
+
+    # 3. Merge whatever came back, reporting each branch as it lands
+    results = {}
+    pending = set(tasks)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            name = tasks[task]
+            results[name] = task.result()
+            if progress is not None and results[name] is not None:
+                _merge_branches(details, search_result, results)
+                progress(name, {field: details[field] for field in BRANCH_FIELDS[name]})
+    _merge_branches(details, search_result, results)
+    full = results.get("full")
+    if full or search_result.get("title"):
+        await _learn_title(mal_id, full or search_result, title)
+
+    details["modified_at"] = time.time()
+
+    # Without authors the author branches have nothing to fetch, so they can't fail
+    has_authors = bool(search_result.get("authors") or (full or {}).get("authors"))
+    failed = {
+        name for name, data in results.items()
+        if data is None and (has_authors or name not in ("people", "people_manga"))
+    }
+    details["branches"] = sorted(set(results) - failed)
+    return details, not failed
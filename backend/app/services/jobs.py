@@ -0,0 +1,388 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from fastapi import HTTPException
+
+from .tiered_cache import get_connection
+from .uploads import ImageUpload
+
+# Jobs live in their own database: the cache DB may be wiped any time, queued jobs not
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "cache/jobs.sqlite3")
+# Job workers run by each API process (0 leaves the jobs to scripts/job_worker.py)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Attempts per job before it is marked failed; retries back off from JOB_RETRY_DELAY
+# seconds, doubling each time
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "5"))
+# A running job whose worker stopped renewing its lease this long ago is picked up again
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+# Jobs waiting to run; beyond this new submissions are answered 503
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "1000"))
+# Finished jobs (and their results) are kept this many seconds
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+# Longest a GET /jobs/{id}?wait= long-poll is held open
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "30"))
+# How often idle workers and long-polls look at the queue
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+FINISHED = (DONE, FAILED)
+
+# Upstream quota, rate limiting and outages are worth another attempt, bad uploads not
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+@dataclass(slots=True)
+class Job:
+    id: str
+    upload: ImageUpload
+    params: dict
+    attempts: int
+
+
+class JobQueue:
+    """
+    Durable job queue in SQLite, shared by the API processes and any standalone workers.
+
+    Workers claim a job by taking a lease on it and renew the lease while they work; a
+    job whose lease runs out (worker crashed or was killed) is claimed again. Failed
+    attempts are retried with exponential backoff up to `max_attempts`. The upload is
+    stored with the job and dropped once it finishes; results are kept for `result_ttl`
+    seconds. The methods block on SQLite (and move uploads and results of up to several
+    MB), so async code calls them through asyncio.to_thread.
+    """
+
+    def __init__(
+        self, path: str, max_attempts: int, lease_seconds: float, result_ttl: float
+    ):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.result_ttl = result_ttl
+        self._conn = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+        self.recovered = 0
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = get_connection(self.path, owner="jobs")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    filename TEXT,
+                    content_type TEXT,
+                    image BLOB,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL,
+                    lease_owner TEXT,
+                    lease_expires_at REAL,
+                    result BLOB,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    finished_at REAL
+                )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at)"
+            )
+        return self._conn
+
+    def _transaction(self, fn: Callable[[sqlite3.Connection], object]):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self.conn)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(
+                self.conn.execute(
+                    "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+                ).fetchall()
+            )
+        return {
+            **{
+                status: counts.get(status, 0)
+                for status in (QUEUED, RUNNING, DONE, FAILED)
+            },
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed_permanently": self.failed,
+            "recovered": self.recovered,
+        }
+
+    def submit(
+        self, upload: ImageUpload, params: dict, max_queued: int = JOB_MAX_QUEUED
+    ) -> Optional[str]:
+        """Queues a job and returns its id, or None if `max_queued` jobs are waiting."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+
+        def insert(conn):
+            queued = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)
+            ).fetchone()[0]
+            if queued >= max_queued:
+                return None
+            conn.execute(
+                "INSERT INTO jobs (id, status, params, filename, content_type, image,"
+                " available_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id, QUEUED, json.dumps(params), upload.filename,
+                    upload.content_type, upload.data, now, now,
+                ),
+            )
+            self.submitted += 1
+            return job_id
+
+        return self._transaction(insert)
+
+    def claim(self, owner: str) -> Optional[Job]:
+        """
+        Leases the oldest runnable job to `owner`: queued and due, or running with an
+        expired lease.
+        """
+        now = time.time()
+
+        def take(conn):
+            row = conn.execute(
+                """SELECT id, status, params, filename, content_type, image, attempts
+                   FROM jobs
+                   WHERE (status = ? AND available_at <= ?)
+                      OR (status = ? AND lease_expires_at < ?)
+                   ORDER BY available_at LIMIT 1""",
+                (QUEUED, now, RUNNING, now),
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, status, params, filename, content_type, image, attempts = row
+            if status == RUNNING:
+                self.recovered += 1
+                if attempts >= self.max_attempts:
+                    # Its worker died on the last attempt
+                    self._finish(
+                        conn,
+                        job_id,
+                        FAILED,
+                        error={
+                            "status_code": 500,
+                            "detail": "The search could not be completed.",
+                        },
+                    )
+                    self.failed += 1
+                    return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_owner = ?,"
+                " lease_expires_at = ? WHERE id = ?",
+                (RUNNING, owner, now + self.lease_seconds, job_id),
+            )
+            return Job(
+                id=job_id,
+                upload=ImageUpload(
+                    filename=filename, content_type=content_type, data=image
+                ),
+                params=json.loads(params),
+                attempts=attempts + 1,
+            )
+
+        return self._transaction(take)
+
+    def renew(self, job_id: str, owner: str) -> bool:
+        """Extends `owner`'s lease; False if the job was taken over in the meantime."""
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET lease_expires_at = ?"
+                " WHERE id = ? AND status = ? AND lease_owner = ?",
+                (time.time() + self.lease_seconds, job_id, RUNNING, owner),
+            )
+        return cursor.rowcount > 0
+
+    def complete(self, job_id: str, owner: str, result: bytes) -> None:
+        def store(conn):
+            if self._owns(conn, job_id, owner):
+                self._finish(conn, job_id, DONE, result=result)
+                self.completed += 1
+
+        self._transaction(store)
+
+    def fail(
+        self, job_id: str, owner: str, status_code: int, detail: str, retry: bool
+    ) -> None:
+        """Records a failed attempt, queued again after a backoff if `retry` allows."""
+
+        def store(conn):
+            if not self._owns(conn, job_id, owner):
+                return
+            attempts = conn.execute(
+                "SELECT attempts FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()[0]
+            if retry and attempts < self.max_attempts:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, available_at = ?, lease_owner = NULL,"
+                    " lease_expires_at = NULL WHERE id = ?",
+                    (
+                        QUEUED,
+                        time.time() + JOB_RETRY_DELAY * 2 ** (attempts - 1),
+                        job_id,
+                    ),
+                )
+                self.retried += 1
+            else:
+                self._finish(
+                    conn,
+                    job_id,
+                    FAILED,
+                    error={"status_code": status_code, "detail": detail},
+                )
+                self.failed += 1
+
+        self._transaction(store)
+
+    @staticmethod
+    def _owns(conn: sqlite3.Connection, job_id: str, owner: str) -> bool:
+        row = conn.execute(
+            "SELECT status, lease_owner FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return row is not None and row[0] == RUNNING and row[1] == owner
+
+    @staticmethod
+    def _finish(
+        conn: sqlite3.Connection,
+        job_id: str,
+        status: str,
+        result: bytes = None,
+        error: dict = None,
+    ):
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, image = NULL,"
+            " lease_owner = NULL, lease_expires_at = NULL, finished_at = ?"
+            " WHERE id = ?",
+            (status, result, json.dumps(error) if error else None, time.time(), job_id),
+        )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT status, attempts, created_at, finished_at, result, error"
+                " FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        status, attempts, created_at, finished_at, result, error = row
+        return {
+            "id": job_id,
+            "status": status,
+            "attempts": attempts,
+            "created_at": created_at,
+            "finished_at": finished_at,
+            "result": result,
+            "error": json.loads(error) if error else None,
+        }
+
+    def purge(self) -> int:
+        """Deletes jobs that finished more than `result_ttl` seconds ago."""
+        with self._lock:
+            cursor = self.conn.execute(
+                "DELETE FROM jobs WHERE finished_at < ?",
+                (time.time() - self.result_ttl,),
+            )
+        return cursor.rowcount
+
+
+job_queue = JobQueue(JOB_DB_PATH, JOB_MAX_ATTEMPTS, JOB_LEASE_SECONDS, JOB_RESULT_TTL)
+
+
+async def wait_for_job(job_id: str, timeout: float) -> Optional[dict]:
+    """
+    The job, once it has finished or after `timeout` seconds, whichever comes first.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        job = await asyncio.to_thread(job_queue.get, job_id)
+        if job is None or job["status"] in FINISHED or time.monotonic() >= deadline:
+            return job
+        await asyncio.sleep(
+            min(JOB_POLL_INTERVAL, max(0.0, deadline - time.monotonic()))
+        )
+
+
+async def _run_job(
+    job: Job, owner: str, handler: Callable[[Job], Awaitable[bytes]]
+) -> None:
+    async def keep_lease():
+        while True:
+            await asyncio.sleep(job_queue.lease_seconds / 3)
+            if not await asyncio.to_thread(job_queue.renew, job.id, owner):
+                return
+
+    lease = asyncio.create_task(keep_lease())
+    try:
+        result = await handler(job)
+    except HTTPException as e:
+        retry = e.status_code in RETRYABLE_STATUS
+        print(
+            f"Job {job.id} attempt {job.attempts} failed: "
+            f"HTTP {e.status_code} {e.detail}"
+        )
+        await asyncio.to_thread(
+            job_queue.fail, job.id, owner, e.status_code, e.detail, retry
+        )
+    except Exception as e:
+        print(f"Job {job.id} attempt {job.attempts} failed: {e}")
+        await asyncio.to_thread(
+            job_queue.fail, job.id, owner, 500,
+            "Failed to process image. Please try again with a different image.", True,
+        )
+    else:
+        await asyncio.to_thread(job_queue.complete, job.id, owner, result)
+    finally:
+        lease.cancel()
+
+
+async def job_worker(handler: Callable[[Job], Awaitable[bytes]]) -> None:
+    """Runs jobs one at a time for as long as it lives; start several for a pool."""
+    owner = uuid.uuid4().hex
+    last_purge = 0.0
+    while True:
+        try:
+            if time.monotonic() - last_purge > 60:
+                last_purge = time.monotonic()
+                await asyncio.to_thread(job_queue.purge)
+            job = await asyncio.to_thread(job_queue.claim, owner)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Job worker error: {e}")
+            job = None
+        if job is None:
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            continue
+        await _run_job(job, owner, handler)
+
+
+def start_job_workers(count: int, handler: Callable[[Job], Awaitable[bytes]]) -> list:
+    return [asyncio.create_task(job_worker(handler)) for _ in range(count)]
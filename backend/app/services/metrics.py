@@ -0,0 +1,258 @@
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Seconds; covers cache hits (ms) up to SauceNAO searches queued behind the quota
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        registry.register(self)
+
+    def _key(self, labels: dict) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.type}",
+            *self.samples(),
+        ]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labels, key)} {value}"
+
+
+class Gauge(Metric):
+    """A settable gauge, or a callback gauge whose values are read at scrape time."""
+
+    type = "gauge"
+
+    def __init__(
+        self, name: str, help: str, labels: Sequence[str] = (),
+        collect: Callable[[], Dict[LabelValues, float]] = None,
+    ):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._collect = collect
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def samples(self) -> Iterable[str]:
+        values = self._values
+        if self._collect is not None:
+            try:
+                values = self._collect()
+            except Exception as e:
+                print(f"Error collecting metric {self.name}: {e}")
+                values = {}
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.labels, key)} {value}"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self._values: Dict[LabelValues, list] = {}  # [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [0] * (len(self.buckets) + 2)
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            state[index] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterable[str]:
+        for key, state in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = _format_labels(self.labels, key, 'le="%s"' % bound)
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, key, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {state[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {state[-2]}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {state[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Pipeline stages of /search and /details
+# (read_upload, preprocess, saucenao, jikan, translation)
+stage_seconds = Histogram(
+    "mangafinder_stage_seconds",
+    "Time spent in each pipeline stage.",
+    ["endpoint", "stage"],
+)
+http_requests = Counter(
+    "mangafinder_http_requests_total",
+    "HTTP requests handled.",
+    ["method", "route", "status"],
+)
+http_request_seconds = Histogram(
+    "mangafinder_http_request_seconds",
+    "HTTP request duration until the response started.",
+    ["route"],
+)
+http_in_flight = Gauge(
+    "mangafinder_http_requests_in_flight", "HTTP requests currently being handled."
+)
+upstream_requests = Counter(
+    "mangafinder_upstream_requests_total",
+    "Requests sent to upstream APIs, by response status.",
+    ["upstream", "endpoint", "status"],
+)
+upstream_errors = Counter(
+    "mangafinder_upstream_errors_total",
+    "Upstream calls that failed without a usable response "
+    "(timeout, connection, circuit_open, shed).",
+    ["upstream", "endpoint", "kind"],
+)
+upstream_rate_limited = Counter(
+    "mangafinder_upstream_rate_limited_total",
+    "429 responses received from upstream APIs.",
+    ["upstream"],
+)
+upstream_request_seconds = Histogram(
+    "mangafinder_upstream_request_seconds",
+    "Upstream request latency, excluding time queued for a slot.",
+    ["upstream", "endpoint"],
+)
+upstream_in_flight = Gauge(
+    "mangafinder_upstream_requests_in_flight",
+    "Upstream requests currently on the wire.",
+    ["upstream"],
+)
+admission_queue_seconds = Histogram(
+    "mangafinder_admission_queue_seconds",
+    "Time admitted requests waited for a slot.",
+    ["endpoint"],
+)
+admission_rejected = Counter(
+    "mangafinder_admission_rejected_total",
+    "Requests shed by admission control (queue_full, client_queue_full, timeout).",
+    ["endpoint", "reason"],
+)
+
+
+class MetricsMiddleware:
+    """
+    Counts requests, in-flight requests and latency per route template (not raw path).
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # In-flight isn't split by route, as the route is known only once it's matched
+        start = time.perf_counter()
+        status = 500
+        observed = False
+
+        def route() -> str:
+            return getattr(scope.get("route"), "path", "unmatched")
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, observed
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if not observed:
+                    observed = True
+                    http_request_seconds.observe(
+                        time.perf_counter() - start, route=route()
+                    )
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            http_requests.inc(method=scope["method"], route=route(), status=status)
@@ -0,0 +1,293 @@
+import asyncio
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from . import jikan
+from .rate_limit import PRIORITY_BACKGROUND, request_priority
+from .snapshot import snapshot
+from .tiered_cache import CACHE_DB_PATH, get_connection
+from .title_index import normalize_title
+
+# Seconds between prefetch rounds (0 disables the worker)
+PREFETCH_INTERVAL = float(os.getenv("PREFETCH_INTERVAL", "60"))
+# How many of the most popular manga are kept warm
+PREFETCH_TOP_N = int(os.getenv("PREFETCH_TOP_N", "50"))
+# Popular entries with less than this many seconds of TTL left are refreshed
+PREFETCH_REFRESH_WINDOW = float(os.getenv("PREFETCH_REFRESH_WINDOW", "1800"))
+# Related manga / other works by the author prefetched per popular manga
+PREFETCH_RELATED = int(os.getenv("PREFETCH_RELATED", "3"))
+# Jikan chains (about 4 requests each) started per round, so prefetching stays a
+# fraction of the 60 requests/minute budget even when live traffic leaves it all unused
+PREFETCH_MAX_PER_ROUND = int(os.getenv("PREFETCH_MAX_PER_ROUND", "5"))
+# A hit counts half as much after this many seconds
+POPULARITY_HALF_LIFE = float(os.getenv("POPULARITY_HALF_LIFE", str(6 * 3600)))
+# Alternative matches of a /search result enriched in the background (0 disables) and
+# how many of those chains may run at once
+SPECULATIVE_ENRICH_TOP_N = int(os.getenv("SPECULATIVE_ENRICH_TOP_N", "0"))
+SPECULATIVE_ENRICH_CONCURRENCY = int(os.getenv("SPECULATIVE_ENRICH_CONCURRENCY", "2"))
+# Titles waiting for a speculative slot; beyond this new ones are dropped
+SPECULATIVE_MAX_PENDING = 100
+
+_MAL_URL_ID = re.compile(r"/manga/(\d+)")
+
+
+class Popularity:
+    """
+    Exponentially decayed hit counts per title, shared by all workers through SQLite.
+
+    Hits are counted in memory and flushed once per prefetch round; with prefetching
+    disabled nothing would flush them, so `enabled=False` drops them. Scores are kept as
+    rank = log2(score) + updated_at / half_life, which orders entries by their decayed
+    score at any later time without rewriting every row as the scores decay. flush() and
+    top() block on SQLite, so async code calls them through asyncio.to_thread.
+    """
+
+    def __init__(
+        self, half_life: float, path: str = CACHE_DB_PATH, enabled: bool = True
+    ):
+        self.half_life = half_life
+        self.path = path
+        self.enabled = enabled
+        self._pending: Dict[str, list] = {}  # key -> [hits, title, mal_id]
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = get_connection(self.path, owner="popularity")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS popularity (
+                    key TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    mal_id INTEGER,
+                    rank REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS popularity_rank ON popularity (rank)"
+            )
+        return self._conn
+
+    def record(self, title: Optional[str], mal_id: Optional[int] = None) -> None:
+        """Counts a hit on a title; the mal_id is kept once any hit has resolved it."""
+        if not title or not self.enabled:
+            return
+        key = normalize_title(title)
+        with self._lock:
+            entry = self._pending.setdefault(key, [0, title, mal_id])
+            entry[0] += 1
+            entry[2] = mal_id or entry[2]
+
+    def flush(self) -> int:
+        """
+        Adds the hits counted since the last flush to the shared scores. If the write
+        fails, the hits are kept for the next flush.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        now_rank = time.time() / self.half_life
+        with self._lock:
+            try:
+                self.conn.execute("BEGIN IMMEDIATE")
+                for key, (hits, title, mal_id) in pending.items():
+                    row = self.conn.execute(
+                        "SELECT rank FROM popularity WHERE key = ?", (key,)
+                    ).fetchone()
+                    score = hits + (2 ** (row[0] - now_rank) if row else 0)
+                    self.conn.execute(
+                        """INSERT INTO popularity VALUES (?, ?, ?, ?)
+                           ON CONFLICT(key) DO UPDATE SET title = excluded.title,
+                               mal_id = COALESCE(excluded.mal_id, popularity.mal_id),
+                               rank = excluded.rank""",
+                        (key, title, mal_id, math.log2(score) + now_rank),
+                    )
+                # Forget entries whose score decayed below 1/1024 of a hit
+                self.conn.execute(
+                    "DELETE FROM popularity WHERE rank < ?", (now_rank - 10,)
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                if self.conn.in_transaction:
+                    self.conn.execute("ROLLBACK")
+                for key, (hits, title, mal_id) in pending.items():
+                    entry = self._pending.setdefault(key, [0, title, mal_id])
+                    entry[0] += hits
+                    entry[2] = entry[2] or mal_id
+                raise
+        return len(pending)
+
+    def top(self, limit: int) -> List[Tuple[str, Optional[int], float]]:
+        """The `limit` most popular manga as (title, mal_id, decayed score)."""
+        now_rank = time.time() / self.half_life
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT title, mal_id, rank FROM popularity ORDER BY rank DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            (title, mal_id, round(2 ** (rank - now_rank), 3))
+            for title, mal_id, rank in rows
+        ]
+
+
+popularity = Popularity(POPULARITY_HALF_LIFE, enabled=PREFETCH_INTERVAL > 0)
+prefetch_stats = {
+    "rounds": 0,
+    "refreshed": 0,
+    "prefetched": 0,
+    "speculative": 0,
+    "skipped_busy": 0,
+    "errors": 0,
+}
+_speculative_slots = asyncio.Semaphore(max(1, SPECULATIVE_ENRICH_CONCURRENCY))
+_speculative_pending = set()
+_speculative_tasks = set()
+
+
+async def _cached(title: Optional[str], mal_id: Optional[int]):
+    """
+    (details, seconds of TTL left) for whichever key the manga may be cached under.
+    """
+    if mal_id:
+        entry = await jikan.cache.peek(jikan.mal_key(mal_id))
+        if entry is not None:
+            return entry
+    return await jikan.cache.peek(jikan.title_key(title)) if title else None
+
+
+def _related(details: dict) -> List[Tuple[str, Optional[int]]]:
+    """Titles users click through to next: related manga, then the author's works."""
+    related = []
+    for works in (details.get("related_manga") or [], details.get("otras_obras") or []):
+        for work in works[:PREFETCH_RELATED]:
+            if work.title:
+                match = _MAL_URL_ID.search(work.url or "")
+                related.append((work.title, int(match.group(1)) if match else None))
+    return related
+
+
+def _live_traffic_waiting() -> bool:
+    return jikan.scheduler.stats()["queued"] > 0
+
+
+async def _run(title: str, refresh: bool, stat: Optional[str] = None) -> Optional[dict]:
+    try:
+        details = await jikan.prefetch_manga_details(title, refresh=refresh)
+        prefetch_stats[stat or ("refreshed" if refresh else "prefetched")] += 1
+        return details
+    except Exception as e:
+        prefetch_stats["errors"] += 1
+        print(f"Prefetch: error loading '{title}': {e}")
+        return None
+
+
+async def prefetch_round() -> None:
+    """
+    Refreshes the most popular manga whose cache entries expire within
+    PREFETCH_REFRESH_WINDOW, then loads their related manga that aren't cached yet.
+    Stops early once PREFETCH_MAX_PER_ROUND chains ran or live requests are queued for
+    Jikan.
+    """
+    prefetch_stats["rounds"] += 1
+    budget = PREFETCH_MAX_PER_ROUND
+    seen = set()
+    for title, mal_id, _ in await asyncio.to_thread(popularity.top, PREFETCH_TOP_N):
+        cached = await _cached(title, mal_id)
+        details = cached[0] if cached is not None else None
+        if cached is None or cached[1] < PREFETCH_REFRESH_WINDOW:
+            if budget <= 0:
+                return
+            if _live_traffic_waiting():
+                prefetch_stats["skipped_busy"] += 1
+                return
+            budget -= 1
+            details = await _run(title, refresh=True)
+        seen.add(normalize_title(title))
+        if details is None:
+            continue
+
+        for related_title, related_id in _related(details):
+            if normalize_title(related_title) in seen:
+                continue
+            if await _cached(related_title, related_id) is not None:
+                continue
+            if budget <= 0:
+                return
+            if _live_traffic_waiting():
+                prefetch_stats["skipped_busy"] += 1
+                return
+            budget -= 1
+            seen.add(normalize_title(related_title))
+            await _run(related_title, refresh=False)
+
+
+def enrich_alternatives(matches: list) -> None:
+    """
+    Loads the Jikan details of the first SPECULATIVE_ENRICH_TOP_N alternative matches in
+    the background, so picking one from "not what you were looking for?" hits the cache.
+    Called once the /search response has been sent; titles already queued are skipped,
+    and so are titles found cached once their task runs.
+    """
+    if SPECULATIVE_ENRICH_TOP_N <= 0:
+        return
+    for match in matches[:SPECULATIVE_ENRICH_TOP_N]:
+        key = normalize_title(match.titulo or "")
+        if not key or key in _speculative_pending:
+            continue
+        if len(_speculative_pending) >= SPECULATIVE_MAX_PENDING:
+            prefetch_stats["skipped_busy"] += 1
+            return
+        _speculative_pending.add(key)
+        task = asyncio.create_task(_enrich_alternative(match.titulo, key))
+        _speculative_tasks.add(task)
+        task.add_done_callback(_speculative_tasks.discard)
+
+
+async def _enrich_alternative(title: str, key: str) -> None:
+    request_priority.set(PRIORITY_BACKGROUND)
+    try:
+        async with _speculative_slots:
+            if await _cached(title, None) is not None:
+                return
+            if _live_traffic_waiting():
+                prefetch_stats["skipped_busy"] += 1
+                return
+            await _run(title, refresh=False, stat="speculative")
+    finally:
+        _speculative_pending.discard(key)
+
+
+async def prefetch_forever() -> None:
+    """
+    Background loop: flushes this worker's popularity counts every PREFETCH_INTERVAL,
+    and one worker (holding the lease) runs a prefetch round at background priority.
+    """
+    request_priority.set(PRIORITY_BACKGROUND)
+    owner = uuid.uuid4().hex
+    while True:
+        await asyncio.sleep(PREFETCH_INTERVAL)
+        try:
+            try:
+                await asyncio.to_thread(popularity.flush)
+            except sqlite3.Error as e:
+                # The hits stay pending; the round can still run on the stored scores
+                print(f"Popularity flush failed: {e}")
+            leased = await asyncio.to_thread(
+                snapshot.try_lease, "prefetch", owner, PREFETCH_INTERVAL * 2
+            )
+            if not leased:
+                continue
+            await prefetch_round()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Prefetch error: {e}")
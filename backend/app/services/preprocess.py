@@ -0,0 +1,114 @@
+import asyncio
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, Tuple, TypeVar
+
+from PIL import Image, ImageOps
+
+from .image_cache import dhash_image
+from .uploads import ImageUpload
+
+# SauceNAO matches against small thumbnails, so a ~1000px page carries all it needs
+PREPROCESS_MAX_EDGE = int(os.getenv("PREPROCESS_MAX_EDGE", "1000"))
+PREPROCESS_QUALITY = int(os.getenv("PREPROCESS_QUALITY", "85"))
+PREPROCESS_WORKERS = int(
+    os.getenv("PREPROCESS_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+T = TypeVar("T")
+
+
+def start_preprocess_pool() -> None:
+    global _pool
+    if _pool is None and PREPROCESS_WORKERS > 0:
+        # spawn: forking a process that already runs an event loop and threads is unsafe
+        _pool = ProcessPoolExecutor(
+            max_workers=PREPROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+
+def close_preprocess_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def _prepare(data: bytes, max_edge: int, quality: int) -> Tuple[bytes, int]:
+    """
+    Runs in a worker process: decodes the first frame, applies the EXIF orientation,
+    scales the longest edge down to `max_edge`, hashes the pixels and re-encodes as a
+    metadata-free JPEG. Returns (jpeg bytes, dhash).
+    """
+    img = Image.open(io.BytesIO(data))
+    img.seek(0)  # First frame of animated GIF/WEBP
+    # Lets the JPEG decoder skip full-size decoding
+    img.draft("RGB", (max_edge, max_edge))
+    img = ImageOps.exif_transpose(img)
+
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        img = background
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+
+    img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    image_hash = dhash_image(img)
+
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=quality, optimize=True)
+    return out.getvalue(), image_hash
+
+
+def _replace_broken_pool(broken: ProcessPoolExecutor) -> None:
+    global _pool
+    if _pool is broken:
+        broken.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+        start_preprocess_pool()
+
+
+async def run_image_job(fn: Callable[..., T], *args) -> T:
+    """
+    Runs a Pillow function in the worker pool (a thread with PREPROCESS_WORKERS=0, or
+    when a worker died and broke the pool; later jobs get a new pool).
+    """
+    pool = _pool
+    if pool is not None:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+        except BrokenProcessPool as e:
+            print(f"Image worker pool is broken, running in-process: {e}")
+            _replace_broken_pool(pool)
+    return await asyncio.to_thread(fn, *args)
+
+
+async def preprocess_image(upload: ImageUpload) -> Tuple[ImageUpload, Optional[int]]:
+    """
+    Shrinks the upload before it goes to SauceNAO and returns it with its perceptual
+    hash. Falls back to the original bytes (and no hash) if the image can't be decoded.
+    """
+    try:
+        data, image_hash = await run_image_job(
+            _prepare, upload.data, PREPROCESS_MAX_EDGE, PREPROCESS_QUALITY
+        )
+    except Exception as e:
+        print(f"Image preprocessing failed, sending original: {e}")
+        return upload, None
+
+    if len(data) >= len(upload.data):
+        # Already small; keep the original encoding but reuse the hash
+        return upload, image_hash
+
+    stem = os.path.splitext(upload.filename)[0] or "upload"
+    return ImageUpload(
+        filename=f"{stem}.jpg", content_type="image/jpeg", data=data
+    ), image_hash
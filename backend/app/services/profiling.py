@@ -0,0 +1,97 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict
+
+# Requests slower than this get a flame graph written to PROFILE_DIR (0 disables it)
+PROFILE_SLOW_REQUEST_MS = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "cache/profiles")
+PROFILE_MAX_DEPTH = 64
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of every thread each PROFILE_INTERVAL_MS while at least one
+    request is being profiled, into a ring buffer of the last minute or so.
+
+    The event loop thread sitting in `selectors.py:select` means it was idle, waiting on
+    upstream I/O; any other stack there is our own code holding the loop. Samples are
+    per thread, not per request, so under concurrency a request's window also shows the
+    work of requests running next to it.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._samples = deque(maxlen=20000)  # (monotonic time, collapsed stack)
+        self._active = 0
+        self._wake = threading.Event()
+        self._thread = None
+
+    def begin(self) -> None:
+        self._active += 1
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="sampling-profiler", daemon=True
+            )
+            self._thread.start()
+        self._wake.set()
+
+    def end(self) -> None:
+        self._active -= 1
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while True:
+            if self._active <= 0:
+                self._wake.clear()
+                self._wake.wait()
+                continue
+            now = time.monotonic()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self._samples.append(
+                        (now, f"{names.get(ident, ident)};{_collapse(frame)}")
+                    )
+            time.sleep(self.interval)
+
+    def collapsed(self, start: float, end: float) -> Dict[str, int]:
+        """Sample counts per stack between two time.monotonic() readings."""
+        return Counter(stack for at, stack in list(self._samples) if start <= at <= end)
+
+
+profiler = SamplingProfiler(PROFILE_INTERVAL_MS / 1000)
+
+
+def write_profile(trace_id: str, name: str, stacks: Dict[str, int]) -> None:
+    """
+    Writes collapsed stacks (flamegraph.pl / speedscope format) off the event loop.
+    """
+    if not stacks:
+        return
+    path = os.path.join(PROFILE_DIR, f"{int(time.time())}-{trace_id}.folded")
+    body = "".join(f"{stack} {count}\n" for stack, count in stacks.items())
+
+    def write():
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(body)
+            print(f"Slow request {name} ({trace_id}): profile written to {path}")
+        except OSError as e:
+            print(f"Could not write profile {path}: {e}")
+
+    asyncio.get_running_loop().run_in_executor(None, write)
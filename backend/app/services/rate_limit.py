@@ -0,0 +1,404 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import List, Optional, Sequence
+
+import httpx
+
+from .circuit_breaker import BreakerGroup, CircuitBreaker, CircuitOpen, endpoint_of
+from .http_client import get_client
+from .metrics import (
+    upstream_errors,
+    upstream_in_flight,
+    upstream_rate_limited,
+    upstream_request_seconds,
+    upstream_requests,
+)
+from .tracing import span
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# Priority of upstream calls made by the current task. Background work (cache refreshes,
+# prefetching) sets PRIORITY_BACKGROUND so it only uses quota live traffic leaves over.
+request_priority: ContextVar[int] = ContextVar(
+    "request_priority", default=PRIORITY_INTERACTIVE
+)
+
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.5"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "10"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when a request is shed because the upstream's queue is full or too slow.
+    """
+
+
+class TokenBucket:
+    """Allows `limit` requests per `period` seconds, refilling continuously."""
+
+    def __init__(self, limit: int, period: float):
+        self.capacity = float(limit)
+        self.rate = limit / period
+        self.tokens = float(limit)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def sync(self, remaining: int) -> None:
+        """Lowers the local estimate to what the upstream says is left."""
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, float(remaining))
+
+
+class UpstreamScheduler:
+    """
+    Hands out upstream request slots from a set of token buckets (all must have one).
+
+    Waiters are served in priority order, FIFO within a priority, by a single dispatcher
+    task, so a burst turns into a steady stream at the upstream's rate instead of a wave
+    of 429s. Requests are shed with RateLimitExceeded when their priority's queue is
+    full or they waited longer than that priority's `max_wait`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        buckets: List[TokenBucket],
+        max_queue: Sequence[int] = (100, 10),
+        max_wait: Sequence[float] = (15.0, 60.0),
+    ):
+        self.name = name
+        self.buckets = buckets
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._loop = None
+        self._paused_until = 0.0
+
+        self.granted = 0
+        self.shed = 0
+        self.retries = 0
+        self.hedges = 0
+
+    def stats(self) -> dict:
+        return {
+            "granted": self.granted,
+            "shed": self.shed,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "queued": sum(1 for _, _, f in self._waiters if not f.done()),
+        }
+
+    def pause(self, seconds: float) -> None:
+        """Stops handing out slots for `seconds`, e.g. after a 429 with Retry-After."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, priority: Optional[int] = None) -> None:
+        priority = request_priority.get() if priority is None else priority
+        self._ensure_dispatcher()
+
+        queued = sum(1 for p, _, f in self._waiters if p == priority and not f.done())
+        if queued >= self.max_queue[priority]:
+            self.shed += 1
+            raise RateLimitExceeded(f"{self.name} queue is full")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(future, self.max_wait[priority])
+        except asyncio.TimeoutError:
+            self.shed += 1
+            raise RateLimitExceeded(f"Timed out waiting for a {self.name} slot")
+
+    def try_acquire(self) -> bool:
+        """Takes a slot only if one is free right now and nobody is queued for it."""
+        if self._loop is asyncio.get_running_loop() and any(
+            not f.done() for _, _, f in self._waiters
+        ):
+            return False
+        if self._delay() > 0:
+            return False
+        for bucket in self.buckets:
+            bucket.take()
+        self.granted += 1
+        return True
+
+    def _ensure_dispatcher(self) -> None:
+        loop = asyncio.get_running_loop()
+        if (
+            self._loop is not loop
+            or self._dispatcher is None
+            or self._dispatcher.done()
+        ):
+            # First use, or the previous event loop is gone (asyncio.run called twice)
+            self._loop = loop
+            self._waiters = []
+            self._wakeup = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch())
+
+    def _delay(self) -> float:
+        now = time.monotonic()
+        return max(
+            [self._paused_until - now] + [b.wait_time(now) for b in self.buckets]
+        )
+
+    async def _dispatch(self) -> None:
+        while True:
+            while self._waiters and self._waiters[0][2].done():
+                heapq.heappop(self._waiters)
+            if not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            delay = self._delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            for bucket in self.buckets:
+                bucket.take()
+            _, _, future = heapq.heappop(self._waiters)
+            future.set_result(None)
+            self.granted += 1
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(
+        0, min(UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKOFF_BASE * 2**attempt)
+    )
+
+
+async def _send(
+    scheduler: UpstreamScheduler,
+    breaker: Optional[CircuitBreaker],
+    method: str,
+    url: str,
+    acquire: bool = True,
+    attempt_timeout: Optional[float] = None,
+    **kwargs,
+) -> httpx.Response:
+    """
+    One attempt: waits for a slot (unless the caller already holds one) and records the
+    outcome. `attempt_timeout` bounds the request once it has its slot.
+    """
+    upstream, endpoint = scheduler.name, endpoint_of(url)
+    with span(f"{upstream} {method} {endpoint}", **{"http.url": url}) as current:
+        if current is not None:
+            kwargs["headers"] = {
+                **(kwargs.get("headers") or {}),
+                "traceparent": current.traceparent(),
+            }
+        response = await _attempt(
+            scheduler,
+            breaker,
+            method,
+            url,
+            upstream,
+            endpoint,
+            acquire,
+            attempt_timeout,
+            **kwargs,
+        )
+        if current is not None:
+            current.set("http.status_code", response.status_code)
+        return response
+
+
+async def _attempt(
+    scheduler: UpstreamScheduler,
+    breaker: Optional[CircuitBreaker],
+    method: str,
+    url: str,
+    upstream: str,
+    endpoint: str,
+    acquire: bool,
+    attempt_timeout: Optional[float],
+    **kwargs,
+) -> httpx.Response:
+    try:
+        if acquire:
+            # Waiting here is bounded by the scheduler's max_wait, not attempt_timeout
+            with span("rate limit wait"):
+                await scheduler.acquire()
+        started = time.monotonic()
+        upstream_in_flight.inc(upstream=upstream)
+        try:
+            request = get_client(url).request(method, url, **kwargs)
+            if attempt_timeout is None:
+                response = await request
+            else:
+                try:
+                    response = await asyncio.wait_for(request, attempt_timeout)
+                except asyncio.TimeoutError:
+                    raise httpx.TimeoutException(
+                        f"No response from {upstream} within {attempt_timeout}s"
+                    )
+        finally:
+            upstream_in_flight.dec(upstream=upstream)
+    except httpx.TransportError as e:
+        elapsed = time.monotonic() - started
+        upstream_errors.inc(
+            upstream=upstream, endpoint=endpoint,
+            kind="timeout" if isinstance(e, httpx.TimeoutException) else "connection",
+        )
+        upstream_request_seconds.observe(elapsed, upstream=upstream, endpoint=endpoint)
+        if breaker is not None:
+            breaker.record(True, elapsed)
+        raise
+    except BaseException as e:
+        if isinstance(e, RateLimitExceeded):
+            upstream_errors.inc(upstream=upstream, endpoint=endpoint, kind="shed")
+        if breaker is not None:
+            breaker.release()
+        raise
+    elapsed = time.monotonic() - started
+    upstream_requests.inc(
+        upstream=upstream, endpoint=endpoint, status=response.status_code
+    )
+    upstream_request_seconds.observe(elapsed, upstream=upstream, endpoint=endpoint)
+    if response.status_code == 429:
+        upstream_rate_limited.inc(upstream=upstream)
+    if breaker is not None:
+        breaker.record(response.status_code >= 500, elapsed)
+    return response
+
+
+async def scheduled_request(
+    scheduler: UpstreamScheduler,
+    method: str,
+    url: str,
+    retries: int = UPSTREAM_MAX_RETRIES,
+    breakers: Optional[BreakerGroup] = None,
+    **kwargs,
+) -> httpx.Response:
+    """
+    Sends a request through the upstream's scheduler, retrying 429/5xx responses with
+    jittered backoff (or the upstream's Retry-After). The last response is returned
+    as-is once retries run out. With `breakers`, raises CircuitOpen without queueing
+    when the endpoint's breaker is open. An `attempt_timeout` keyword applies to each
+    attempt from the moment it gets its slot, raising httpx.TimeoutException.
+    """
+    breaker = breakers.for_url(url) if breakers is not None else None
+    attempt = 0
+    while True:
+        if breaker is not None:
+            try:
+                breaker.allow()
+            except CircuitOpen:
+                upstream_errors.inc(
+                    upstream=scheduler.name,
+                    endpoint=endpoint_of(url),
+                    kind="circuit_open",
+                )
+                raise
+        response = await _send(scheduler, breaker, method, url, **kwargs)
+        if response.status_code not in RETRY_STATUSES or attempt >= retries:
+            return response
+
+        delay = _retry_after(response)
+        if delay is None:
+            delay = backoff_delay(attempt)
+        if response.status_code == 429:
+            scheduler.pause(delay)
+        print(
+            f"{scheduler.name} returned {response.status_code}, "
+            f"retrying in {delay:.2f}s"
+        )
+        scheduler.retries += 1
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+async def hedged_request(
+    scheduler: UpstreamScheduler, method: str, url: str, hedge_after: float,
+    breakers: Optional[BreakerGroup] = None, **kwargs
+) -> httpx.Response:
+    """
+    scheduled_request that, when no response has arrived after `hedge_after` seconds,
+    sends one duplicate and returns whichever attempt answers first. The duplicate only
+    uses a slot that is free right now, so hedging never queues behind or delays other
+    requests; background work is never hedged.
+    """
+    if hedge_after <= 0 or request_priority.get() != PRIORITY_INTERACTIVE:
+        return await scheduled_request(
+            scheduler, method, url, breakers=breakers, **kwargs
+        )
+
+    primary = asyncio.ensure_future(
+        scheduled_request(scheduler, method, url, breakers=breakers, **kwargs)
+    )
+    pending = {primary}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        breaker = breakers.for_url(url) if breakers is not None else None
+        try:
+            if breaker is not None:
+                breaker.allow()
+        except Exception:
+            return await primary
+        if not scheduler.try_acquire():
+            if breaker is not None:
+                breaker.release()
+            return await primary
+        scheduler.hedges += 1
+        pending.add(
+            asyncio.ensure_future(
+                _send(scheduler, breaker, method, url, acquire=False, **kwargs)
+            )
+        )
+
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,71 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, Optional
+
+from .image_cache import PHASH_THRESHOLD, PerceptualCache
+
+# Fully built, already encoded responses. Kept briefly, so a Jikan refresh or a partial
+# result retried by the next lookup shows up within RESPONSE_CACHE_TTL seconds.
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "60"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2000"))
+
+
+@dataclass(slots=True)
+class CachedDetails:
+    body: bytes
+    etag: str
+    modified_at: Optional[float]  # When the Jikan record last changed
+    fresh_until: float  # When the Jikan record goes stale, for Cache-Control max-age
+    title: str
+    complete: bool = True  # False when some requested part failed to load
+
+
+class ResponseCache:
+    """LRU + TTL cache of encoded response bodies."""
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, body: bytes) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, body)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self),
+        }
+
+
+# /details responses by normalized title or ("mal", id), /search bodies by the upload's
+# perceptual hash
+details_responses = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+search_responses = PerceptualCache(
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, PHASH_THRESHOLD
+)
@@ -1,19 +1,49 @@
 import os
-import requests
-from fastapi import HTTPException, UploadFile
 from typing import List, Optional
-from ..schemas import MangaSearchResult, OtherMatch, Author
+
+import httpx
+from fastapi import HTTPException
+
+from ..records import MatchRecord
+from .circuit_breaker import BreakerGroup, CircuitOpen
+from .image_proxy import proxied_url
+from .rate_limit import (
+    RateLimitExceeded,
+    TokenBucket,
+    UpstreamScheduler,
+    scheduled_request,
+)
+from .uploads import ImageUpload
 
 SAUCENAO_API_KEY = os.getenv("SAUCENAO_API_KEY")
+SAUCENAO_URL = os.getenv("SAUCENAO_URL", "https://saucenao.com/search.php")
+
+# Account quotas (free tier: 4 searches per 30s, 100 per 24h). The buckets are corrected
+# from the short_remaining/long_remaining SauceNAO reports with every response.
+SAUCENAO_SHORT_LIMIT = int(os.getenv("SAUCENAO_SHORT_LIMIT", "4"))
+SAUCENAO_LONG_LIMIT = int(os.getenv("SAUCENAO_LONG_LIMIT", "100"))
+short_quota = TokenBucket(SAUCENAO_SHORT_LIMIT, 30)
+long_quota = TokenBucket(SAUCENAO_LONG_LIMIT, 24 * 3600)
+scheduler = UpstreamScheduler("saucenao", [short_quota, long_quota], max_queue=(20, 2))
+# Searches slower than this count against the breaker like failures do
+SAUCENAO_SLOW_CALL_SECONDS = float(os.getenv("SAUCENAO_SLOW_CALL_SECONDS", "20"))
+breakers = BreakerGroup("saucenao", SAUCENAO_SLOW_CALL_SECONDS)
 
-async def search_saucenao(file: UploadFile, include_nsfw: bool) -> dict:
+
+def _sync_quota(data: dict) -> None:
+    header = data.get("header", {})
+    if header.get("short_remaining") is not None:
+        short_quota.sync(int(header["short_remaining"]))
+    if header.get("long_remaining") is not None:
+        long_quota.sync(int(header["long_remaining"]))
+
+async def search_saucenao(upload: ImageUpload, include_nsfw: bool) -> dict:
     if not SAUCENAO_API_KEY:
         raise HTTPException(status_code=500, detail="SAUCENAO_API_KEY not configured")
 
     # hide: 0=Show All, 1=Hide Explicit, 2=Hide Suspected, 3=Hide All Explicit
     hide_value = 0 if include_nsfw else 3
     
-    saucenao_url = "https://saucenao.com/search.php"
     params = {
         "db": 999,
         "output_type": 2,
@@ -23,30 +53,62 @@ async def search_saucenao(file: UploadFile, include_nsfw: bool) -> dict:
         "api_key": SAUCENAO_API_KEY,
     }
     
-    # Read file content
-    content = await file.read()
-    files = {"file": (file.filename, content, file.content_type)}
+    # Streamed from the upload buffer, no extra copy of the image
+    files = {"file": (upload.filename, upload.open(), upload.content_type)}
     
     try:
-        response = requests.post(saucenao_url, params=params, files=files)
+        response = await scheduled_request(
+            scheduler,
+            "POST",
+            SAUCENAO_URL,
+            params=params,
+            files=files,
+            breakers=breakers,
+        )
         response.raise_for_status()
         data = response.json()
-    except requests.exceptions.Timeout as e:
+        _sync_quota(data)
+    except RateLimitExceeded as e:
+        print(f"SauceNAO request shed: {str(e)}")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests to SauceNAO. Please wait a moment and try again.",
+        )
+    except CircuitOpen as e:
+        print(f"SauceNAO request skipped: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail="SauceNAO is currently unavailable. Please try again later.",
+        )
+    except httpx.TimeoutException as e:
         print(f"SauceNAO timeout error: {str(e)}")
-        raise HTTPException(status_code=504, detail="SauceNAO API timeout. Please try again.")
-    except requests.exceptions.ConnectionError as e:
+        raise HTTPException(
+            status_code=504, detail="SauceNAO API timeout. Please try again."
+        )
+    except httpx.TransportError as e:
         print(f"SauceNAO connection error: {str(e)}")
-        raise HTTPException(status_code=503, detail="Cannot connect to SauceNAO API. Please try again later.")
-    except requests.exceptions.HTTPError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Cannot connect to SauceNAO API. Please try again later.",
+        )
+    except httpx.HTTPStatusError as e:
         print(f"SauceNAO HTTP error: {str(e)}")
         if response.status_code == 429:
-            raise HTTPException(status_code=429, detail="Too many requests to SauceNAO. Please wait a moment and try again.")
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests to SauceNAO. "
+                "Please wait a moment and try again.",
+            )
         raise HTTPException(status_code=500, detail=f"SauceNAO API error: {str(e)}")
     except Exception as e:
         print(f"Unexpected error contacting SauceNAO: {str(e)}")
         import traceback
+
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail="Failed to process image with SauceNAO. Please try again.")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to process image with SauceNAO. Please try again.",
+        )
 
     raw_results = data.get("results", [])
     
@@ -87,6 +149,8 @@ async def search_saucenao(file: UploadFile, include_nsfw: bool) -> dict:
 
     part = data_content.get("part", "")
     
+    # SauceNAO thumbnail URLs expire, so the proxy fetches them right away
+    thumbnail = proxied_url(header.get("thumbnail"), "card", warm=True)
     result_data = {
         "found": True,
         "similarity_confidence": similarity,
@@ -94,8 +158,8 @@ async def search_saucenao(file: UploadFile, include_nsfw: bool) -> dict:
         "capitulo_estimado": part,
         "pagina_estimada": None,
         "sinopsis": None,
-        "portada_url": header.get("thumbnail"),
-        "match_image_url": header.get("thumbnail"),
+        "portada_url": thumbnail,
+        "match_image_url": thumbnail,
         "otras_coincidencias": [],
         "saucenao_author": saucenao_author # Pass this to be used if Jikan fails
     }
@@ -120,11 +184,15 @@ async def search_saucenao(file: UploadFile, include_nsfw: bool) -> dict:
                 if not m_title:
                     m_title = m_header.get("index_name", "").split(":")[0]
                 
-                other_matches.append(OtherMatch(
-                    titulo=m_title,
-                    similarity=m_similarity,
-                    portada_url=m_header.get("thumbnail")
-                ))
+                other_matches.append(
+                    MatchRecord(
+                        titulo=m_title,
+                        similarity=m_similarity,
+                        portada_url=proxied_url(
+                            m_header.get("thumbnail"), "thumb", warm=True
+                        ),
+                    )
+                )
         result_data["otras_coincidencias"] = other_matches
 
     if similarity < 60:
@@ -0,0 +1,293 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Iterable, List, Optional
+
+from .rate_limit import PRIORITY_BACKGROUND, request_priority
+from .tiered_cache import get_connection
+from .title_index import normalize_title, record_titles, title_index
+
+SNAPSHOT_DB_PATH = os.getenv("SNAPSHOT_DB_PATH", "cache/snapshot.sqlite3")
+# Entries older than this are re-fetched by the background refresher
+SNAPSHOT_MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", str(7 * 24 * 3600)))
+# Seconds between refresh rounds (0 disables the refresher) and manga per round
+SNAPSHOT_REFRESH_INTERVAL = float(os.getenv("SNAPSHOT_REFRESH_INTERVAL", "300"))
+SNAPSHOT_REFRESH_BATCH = int(os.getenv("SNAPSHOT_REFRESH_BATCH", "20"))
+
+
+class Snapshot:
+    """
+    Local copy of the raw Jikan records for the head of the catalogue: manga (/full and
+    /external), people (/people/{id} and their /manga), and which people wrote which
+    manga, indexed by mal_id, title and author. Records are stored as Jikan returned
+    them, so details are built by the same code as for live responses. The methods
+    block on SQLite, so async code calls them through asyncio.to_thread.
+    """
+
+    def __init__(self, path: str = SNAPSHOT_DB_PATH):
+        self.path = path
+        self._conn = None
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        # Rows in `manga` as of the last count_manga()
+        self.manga = 0
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = get_connection(self.path, owner="snapshot")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS manga (
+                    mal_id INTEGER PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    full TEXT NOT NULL,
+                    external TEXT,
+                    fetched_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS manga_title ON manga (title);
+                CREATE INDEX IF NOT EXISTS manga_fetched_at ON manga (fetched_at);
+                CREATE TABLE IF NOT EXISTS people (
+                    mal_id INTEGER PRIMARY KEY,
+                    person TEXT,
+                    works TEXT,
+                    fetched_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS manga_authors (
+                    manga_id INTEGER NOT NULL,
+                    person_id INTEGER NOT NULL,
+                    position INTEGER NOT NULL,
+                    PRIMARY KEY (manga_id, person_id)
+                );
+                CREATE INDEX IF NOT EXISTS manga_authors_person
+                    ON manga_authors (person_id);
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                """
+            )
+        return self._conn
+
+    def stats(self) -> dict:
+        return {"manga": self.manga, "hits": self.hits, "misses": self.misses}
+
+    def count_manga(self) -> int:
+        with self._lock:
+            self.manga = self.conn.execute("SELECT COUNT(*) FROM manga").fetchone()[0]
+        return self.manga
+
+    def get_manga(self, mal_id: int) -> Optional[dict]:
+        """
+        Returns the raw branches for a manga, keyed like the live enrichment ({"full",
+        "external", "people", "people_manga"}), or None if it isn't in the snapshot.
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT full, external FROM manga WHERE mal_id = ?", (mal_id,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            person = self.conn.execute(
+                """SELECT p.person, p.works
+                   FROM manga_authors a JOIN people p ON p.mal_id = a.person_id
+                   WHERE a.manga_id = ? ORDER BY a.position LIMIT 1""",
+                (mal_id,),
+            ).fetchone()
+        self.hits += 1
+        return {
+            "full": json.loads(row[0]),
+            "external": json.loads(row[1]) if row[1] is not None else None,
+            "people": json.loads(person[0]) if person and person[0] else None,
+            "people_manga": json.loads(person[1]) if person and person[1] else None,
+        }
+
+    def find_by_title(self, title: str) -> Optional[int]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT mal_id FROM manga WHERE title = ?", (normalize_title(title),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def manga_by_author(self, person_id: int) -> List[int]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT manga_id FROM manga_authors WHERE person_id = ?", (person_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def store_manga(self, full: dict, external: Optional[list]) -> None:
+        mal_id = full["mal_id"]
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO manga VALUES (?, ?, ?, ?, ?)",
+                    (mal_id, normalize_title(full.get("title") or ""), json.dumps(full),
+                     json.dumps(external) if external is not None else None, now),
+                )
+                self.conn.execute(
+                    "DELETE FROM manga_authors WHERE manga_id = ?", (mal_id,)
+                )
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO manga_authors VALUES (?, ?, ?)",
+                    [
+                        (mal_id, a["mal_id"], i)
+                        for i, a in enumerate(full.get("authors") or [])
+                        if a.get("mal_id")
+                    ],
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        title_index.add(mal_id, record_titles(full), source="snapshot")
+
+    def store_person(
+        self, person_id: int, person: Optional[dict], works: Optional[list]
+    ) -> None:
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO people VALUES (?, ?, ?, ?)",
+                (person_id, json.dumps(person) if person is not None else None,
+                 json.dumps(works) if works is not None else None, time.time()),
+            )
+
+    def person_is_fresh(self, person_id: int) -> bool:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT fetched_at FROM people WHERE mal_id = ?", (person_id,)
+            ).fetchone()
+        return row is not None and time.time() - row[0] < SNAPSHOT_MAX_AGE
+
+    def stale_manga(self, limit: int) -> List[int]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT mal_id FROM manga WHERE fetched_at < ?"
+                " ORDER BY fetched_at LIMIT ?",
+                (time.time() - SNAPSHOT_MAX_AGE, limit),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def try_lease(self, name: str, owner: str, seconds: float) -> bool:
+        """
+        Cross-worker lease so only one uvicorn worker runs the refresher at a time.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self.conn.execute(
+                """INSERT INTO leases VALUES (?, ?, ?)
+                   ON CONFLICT(name) DO UPDATE
+                   SET owner = excluded.owner, expires_at = excluded.expires_at
+                   WHERE leases.owner = excluded.owner OR leases.expires_at < ?""",
+                (name, owner, now + seconds, now),
+            )
+        return cursor.rowcount > 0
+
+
+snapshot = Snapshot()
+
+
+async def ingest_manga(mal_id: int) -> bool:
+    """
+    Fetches a manga's records (and its first author's, unless recently fetched) from
+    Jikan into the snapshot. Returns False if the full record couldn't be fetched.
+    """
+    from .jikan import JIKAN_BASE_URL, _get_json
+
+    try:
+        full, external = await asyncio.gather(
+            _get_json(f"{JIKAN_BASE_URL}/manga/{mal_id}/full"),
+            _get_json(f"{JIKAN_BASE_URL}/manga/{mal_id}/external"),
+            return_exceptions=True,
+        )
+        if isinstance(full, Exception) or not full:
+            print(f"Snapshot: could not fetch manga {mal_id}: {full}")
+            return False
+        await asyncio.to_thread(
+            snapshot.store_manga,
+            full,
+            None if isinstance(external, Exception) else external,
+        )
+
+        authors = full.get("authors") or []
+        person_id = authors[0].get("mal_id") if authors else None
+        if person_id and not await asyncio.to_thread(
+            snapshot.person_is_fresh, person_id
+        ):
+            person, works = await asyncio.gather(
+                _get_json(f"{JIKAN_BASE_URL}/people/{person_id}"),
+                _get_json(f"{JIKAN_BASE_URL}/people/{person_id}/manga", {"limit": 5}),
+                return_exceptions=True,
+            )
+            await asyncio.to_thread(
+                snapshot.store_person,
+                person_id,
+                None if isinstance(person, Exception) else person,
+                None if isinstance(works, Exception) else (works or [])[:5],
+            )
+        return True
+    except Exception as e:
+        print(f"Snapshot: error ingesting manga {mal_id}: {e}")
+        return False
+
+
+async def ingest_many(mal_ids: Iterable[int]) -> int:
+    """
+    Ingests manga one at a time at background priority; returns how many succeeded.
+    """
+    request_priority.set(PRIORITY_BACKGROUND)
+    ingested = 0
+    for mal_id in mal_ids:
+        ingested += await ingest_manga(mal_id)
+    return ingested
+
+
+async def bulk_ingest_top(pages: int) -> int:
+    """Ingests the first `pages` pages (25 manga each) of Jikan's /top/manga ranking."""
+    from .jikan import JIKAN_BASE_URL, _get_json
+
+    request_priority.set(PRIORITY_BACKGROUND)
+    ingested = 0
+    for page in range(1, pages + 1):
+        entries = await _get_json(f"{JIKAN_BASE_URL}/top/manga", {"page": page})
+        if not entries:
+            break
+        ingested += await ingest_many(
+            entry["mal_id"] for entry in entries if entry.get("mal_id")
+        )
+        print(f"Snapshot: page {page}/{pages}, {ingested} manga ingested")
+    return ingested
+
+
+async def refresh_snapshot_forever() -> None:
+    """
+    Background loop re-fetching the oldest entries past SNAPSHOT_MAX_AGE, a batch per
+    round, at background priority.
+    """
+    owner = uuid.uuid4().hex
+    while True:
+        await asyncio.sleep(SNAPSHOT_REFRESH_INTERVAL)
+        try:
+            leased = await asyncio.to_thread(
+                snapshot.try_lease, "refresh", owner, SNAPSHOT_REFRESH_INTERVAL * 2
+            )
+            if not leased:
+                continue
+            stale = await asyncio.to_thread(
+                snapshot.stale_manga, SNAPSHOT_REFRESH_BATCH
+            )
+            if stale:
+                refreshed = await ingest_many(stale)
+                print(f"Snapshot: refreshed {refreshed}/{len(stale)} stale manga")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Snapshot refresh error: {e}")
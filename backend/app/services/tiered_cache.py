@@ -0,0 +1,402 @@
+import asyncio
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "cache/mangafinder.sqlite3")
+
+# Stores check their size every this many writes; checking on every write would cost
+# more than the write itself
+TRIM_EVERY_WRITES = 50
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def get_connection(
+    path: str = CACHE_DB_PATH, owner: str = "cache"
+) -> sqlite3.Connection:
+    """
+    Returns the process-wide connection for `path` and `owner`, opened in WAL mode so
+    every uvicorn worker can read while another one writes. Components that run their
+    own transactions pass their own `owner` so they don't share a connection with the
+    caches.
+    """
+    with _connections_lock:
+        conn = _connections.get((path, owner))
+        if conn is None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(
+                path, check_same_thread=False, isolation_level=None, timeout=5
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            _connections[(path, owner)] = conn
+        return conn
+
+
+class SqliteWriter:
+    """
+    A thread owning its own connection to one database and running the writes queued
+    for it, up to WRITE_BATCH per transaction. Callers on the event loop hand a write
+    over and move on instead of waiting for the database lock or the disk.
+    """
+
+    WRITE_BATCH = 100
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: "queue.Queue[Callable[[sqlite3.Connection], None]]" = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, write: Callable[[sqlite3.Connection], None]) -> None:
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name=f"sqlite-writer:{self.path}", daemon=True
+                    )
+                    self._thread.start()
+        self._queue.put(write)
+
+    def flush(self) -> None:
+        """Blocks until every write submitted so far has been committed (or failed)."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _run(self) -> None:
+        conn = get_connection(self.path, owner="writer")
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.WRITE_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for write in batch:
+                    try:
+                        write(conn)
+                    except sqlite3.Error as e:
+                        print(f"Cache write error ({self.path}): {e}")
+                conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                print(f"Cache write batch failed ({self.path}): {e}")
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+_writers: Dict[str, SqliteWriter] = {}
+
+
+def get_writer(path: str = CACHE_DB_PATH) -> SqliteWriter:
+    with _connections_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = _writers[path] = SqliteWriter(path)
+        return writer
+
+
+def flush_writes() -> None:
+    """Waits for the queued cache writes of every database, e.g. on shutdown."""
+    for writer in list(_writers.values()):
+        writer.flush()
+
+
+def lru_victims(
+    conn: sqlite3.Connection,
+    table: str,
+    max_bytes: int,
+    where: str = "1",
+    params: tuple = (),
+) -> list:
+    """
+    Keys of the least recently accessed rows of `table` to drop to get its total `size`
+    back under 90% of `max_bytes`; [] while it is within the budget. The table needs
+    key, size and accessed_at columns; `where` picks the rows sharing the budget.
+    """
+    total = conn.execute(
+        f"SELECT COALESCE(SUM(size), 0) FROM {table} WHERE {where}", params
+    ).fetchone()[0]
+    if total <= max_bytes:
+        return []
+    excess = total - int(max_bytes * 0.9)
+    doomed = []
+    rows = conn.execute(
+        f"SELECT key, size FROM {table} WHERE {where} ORDER BY accessed_at", params
+    )
+    for key, size in rows:
+        if excess <= 0:
+            break
+        doomed.append(key)
+        excess -= size
+    return doomed
+
+
+def _create_cache_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS cache_entries (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT,
+            alias_of TEXT,
+            expires_at REAL NOT NULL,
+            stale_until REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            size INTEGER NOT NULL,
+            PRIMARY KEY (namespace, key)
+        )"""
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS cache_entries_accessed"
+        " ON cache_entries (namespace, accessed_at)"
+    )
+
+
+_SELECT_ENTRY = (
+    "SELECT value, alias_of, expires_at, stale_until FROM cache_entries"
+    " WHERE namespace = ? AND key = ?"
+)
+
+
+class TieredCache:
+    """
+    Two-tier cache: an in-process LRU in front of a SQLite table shared by all workers.
+
+    Every entry carries its own TTL plus a stale window: `get` returns (value, fresh),
+    and entries past their TTL but inside the stale window come back with fresh=False so
+    the caller can serve them while it revalidates. Keys can be aliases of other keys,
+    which lets several lookups (title, id) share one stored record.
+    The disk tier is bounded by total stored bytes and evicts least recently accessed
+    rows.
+
+    Only the memory tier is touched on the event loop: disk reads run in a worker thread
+    (hence `get` and `peek` are coroutines) and writes are queued to the database's
+    SqliteWriter, so other workers see them once that thread has committed them.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl: float,
+        stale_ttl: float = 0,
+        memory_size: int = 1000,
+        max_bytes: int = 100 * 1024 * 1024,
+        dumps: Callable[[Any], str] = json.dumps,
+        loads: Callable[[str], Any] = json.loads,
+        path: str = CACHE_DB_PATH,
+    ):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.memory_size = memory_size
+        self.max_bytes = max_bytes
+        self.dumps = dumps
+        self.loads = loads
+        self.path = path
+        self._memory: "OrderedDict[str, Tuple[float, float, Any]]" = OrderedDict()
+        self._aliases: "OrderedDict[str, str]" = OrderedDict()
+        # _lock guards the memory tier, _read_lock the reading connection
+        self._lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._conn = None
+        self._writer = get_writer(path)
+        self._writer_ready = False
+        self._writes_since_trim = 0
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.memory_evictions = 0
+        self.disk_evictions = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = get_connection(self.path)
+            _create_cache_table(conn)
+            self._conn = conn
+        return self._conn
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "memory_evictions": self.memory_evictions,
+            "disk_evictions": self.disk_evictions,
+            "memory_entries": len(self._memory),
+        }
+
+    async def get(self, key: str) -> Optional[Tuple[Any, bool]]:
+        """Returns (value, fresh) or None. Aliases are followed one level."""
+        entry = await self._get_entry(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, _, value = entry
+        fresh = time.time() < expires_at
+        if fresh:
+            self.hits += 1
+        else:
+            self.stale_hits += 1
+        return value, fresh
+
+    async def peek(self, key: str) -> Optional[Tuple[Any, float]]:
+        """(value, seconds until it goes stale), without counting a hit or a miss."""
+        entry = await self._get_entry(key)
+        if entry is None:
+            return None
+        return entry[2], entry[0] - time.time()
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expires_at, stale_until = now + ttl, now + ttl + self.stale_ttl
+        payload = self.dumps(value)
+        with self._lock:
+            self._aliases.pop(key, None)
+            self._remember(key, (expires_at, stale_until, value))
+
+        def write(conn):
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries"
+                " VALUES (?, ?, ?, NULL, ?, ?, ?, ?)",
+                (
+                    self.namespace, key, payload, expires_at, stale_until, now,
+                    len(payload),
+                ),
+            )
+            self._maybe_trim(conn)
+
+        self._write(write)
+
+    def alias(self, key: str, target: str) -> None:
+        """Makes `key` resolve to whatever is stored under `target`."""
+        now = time.time()
+        until = now + self.ttl + self.stale_ttl
+        with self._lock:
+            self._memory.pop(key, None)
+            self._remember_alias(key, target)
+        self._write(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO cache_entries VALUES (?, ?, NULL, ?, ?, ?, ?, ?)",
+            (self.namespace, key, target, until, until, now, len(target)),
+        ))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._memory.pop(key, None)
+            self._aliases.pop(key, None)
+        self._write(lambda conn: conn.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        ))
+
+    def flush(self) -> None:
+        """Blocks until this cache's queued writes are on disk."""
+        self._writer.flush()
+
+    def _write(self, write: Callable[[sqlite3.Connection], None]) -> None:
+        def run(conn):
+            # Runs on the writer thread, which has its own connection
+            if not self._writer_ready:
+                _create_cache_table(conn)
+                self._writer_ready = True
+            write(conn)
+
+        self._writer.submit(run)
+
+    async def _get_entry(self, key: str):
+        now = time.time()
+        with self._lock:
+            key = self._aliases.get(key, key)
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    return entry
+                del self._memory[key]
+
+        loaded = await asyncio.to_thread(self._load, key, now)
+        if loaded is None:
+            return None
+        key, entry = loaded
+        if entry is None:
+            return None
+        with self._lock:
+            self._remember(key, entry)
+        self._write(lambda conn: conn.execute(
+            "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+            (now, self.namespace, key),
+        ))
+        return entry
+
+    def _load(self, key: str, now: float):
+        """Disk lookup, in a worker thread: (key the value is stored under, entry)."""
+        with self._read_lock:
+            row = self.conn.execute(_SELECT_ENTRY, (self.namespace, key)).fetchone()
+            if row is not None and row[1] is not None:
+                if row[3] <= now:
+                    return None
+                target = row[1]
+                with self._lock:
+                    self._remember_alias(key, target)
+                    entry = self._memory.get(target)
+                    if entry is not None and entry[1] > now:
+                        self._memory.move_to_end(target)
+                        return target, entry
+                row = self.conn.execute(
+                    _SELECT_ENTRY, (self.namespace, target)
+                ).fetchone()
+                key = target
+        if row is None or row[0] is None or row[3] <= now:
+            return None
+        return key, (row[2], row[3], self.loads(row[0]))
+
+    def _remember(self, key: str, entry) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+            self.memory_evictions += 1
+
+    def _remember_alias(self, key: str, target: str) -> None:
+        self._aliases[key] = target
+        self._aliases.move_to_end(key)
+        while len(self._aliases) > self.memory_size:
+            self._aliases.popitem(last=False)
+
+    def _maybe_trim(self, conn: sqlite3.Connection) -> None:
+        self._writes_since_trim += 1
+        if self._writes_since_trim < TRIM_EVERY_WRITES:
+            return
+        self._writes_since_trim = 0
+
+        now = time.time()
+        expired = conn.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND stale_until <= ?",
+            (self.namespace, now),
+        ).rowcount
+        doomed = lru_victims(
+            conn, "cache_entries", self.max_bytes, "namespace = ?", (self.namespace,)
+        )
+        conn.executemany(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+            [(self.namespace, row_key) for row_key in doomed],
+        )
+        with self._lock:
+            for row_key in doomed:
+                self._memory.pop(row_key, None)
+        self.disk_evictions += expired + len(doomed)
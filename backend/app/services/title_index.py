@@ -0,0 +1,193 @@
+import json
+import os
+import re
+import threading
+import unicodedata
+from typing import Iterable, List, Optional, Set, Tuple
+
+from .tiered_cache import CACHE_DB_PATH, get_connection
+
+# Minimum trigram Jaccard similarity for a fuzzy hit to skip the Jikan search
+TITLE_INDEX_MIN_SCORE = float(os.getenv("TITLE_INDEX_MIN_SCORE", "0.8"))
+# A learned alias must look at least this much like one of the manga's official titles
+TITLE_INDEX_LEARN_SCORE = 0.5
+
+
+def normalize_title(title: str) -> str:
+    title = unicodedata.normalize("NFKC", title).casefold()
+    title = re.sub(r"[^\w\s]", " ", title)
+    return " ".join(title.split())
+
+
+def trigrams(normalized: str) -> Set[str]:
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a: str, b: str) -> float:
+    ta, tb = trigrams(normalize_title(a)), trigrams(normalize_title(b))
+    return len(ta & tb) / len(ta | tb) if ta and tb else 0.0
+
+
+def record_titles(manga: dict) -> List[str]:
+    """All the names Jikan knows a manga by (default, English, Japanese, synonyms)."""
+    names = [
+        manga.get("title"),
+        manga.get("title_english"),
+        manga.get("title_japanese"),
+    ]
+    names += [t.get("title") for t in manga.get("titles") or []]
+    names += manga.get("title_synonyms") or []
+    return [name for name in dict.fromkeys(names) if name]
+
+
+class TitleIndex:
+    """
+    Local title -> mal_id resolver stored in SQLite next to the caches, so every worker
+    learns from every resolution. Exact normalized titles are looked up directly; other
+    queries are matched by trigram Jaccard similarity, and only a confident, unambiguous
+    best match is returned. The methods block on SQLite, so async code calls them
+    through asyncio.to_thread.
+    """
+
+    def __init__(self, path: str = CACHE_DB_PATH):
+        self.path = path
+        self._conn = None
+        self._lock = threading.RLock()
+        self.exact_hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = get_connection(self.path, owner="title_index")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS title_index (
+                    title TEXT PRIMARY KEY,
+                    mal_id INTEGER NOT NULL,
+                    trigram_count INTEGER NOT NULL,
+                    source TEXT NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS title_trigrams (
+                    trigram TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    PRIMARY KEY (trigram, title)
+                ) WITHOUT ROWID"""
+            )
+        return self._conn
+
+    def stats(self) -> dict:
+        return {
+            "exact_hits": self.exact_hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "misses": self.misses,
+        }
+
+    def lookup(self, title: str) -> Optional[int]:
+        normalized = normalize_title(title)
+        if not normalized:
+            return None
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT mal_id FROM title_index WHERE title = ?", (normalized,)
+            ).fetchone()
+            if row is not None:
+                self.exact_hits += 1
+                return row[0]
+
+            grams = trigrams(normalized)
+            placeholders = ",".join("?" * len(grams))
+            candidates = self.conn.execute(
+                f"""SELECT t.title, t.mal_id, t.trigram_count, COUNT(*) AS shared
+                    FROM title_trigrams g JOIN title_index t ON t.title = g.title
+                    WHERE g.trigram IN ({placeholders})
+                    GROUP BY t.title ORDER BY shared DESC LIMIT 20""",
+                list(grams),
+            ).fetchall()
+
+        scored: List[Tuple[float, int]] = sorted(
+            (
+                (shared / (len(grams) + count - shared), mal_id)
+                for _, mal_id, count, shared in candidates
+            ),
+            reverse=True,
+        )
+        if scored and scored[0][0] >= TITLE_INDEX_MIN_SCORE:
+            best_score, best_id = scored[0]
+            # Two different manga scoring about the same is a coin toss; Jikan decides
+            rival = next(
+                (score for score, mal_id in scored[1:] if mal_id != best_id), 0.0
+            )
+            if best_score - rival >= 0.1:
+                self.fuzzy_hits += 1
+                return best_id
+        self.misses += 1
+        return None
+
+    def add(self, mal_id: int, titles: Iterable[str], source: str = "jikan") -> None:
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self._insert(mal_id, titles, source)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _insert(self, mal_id: int, titles: Iterable[str], source: str) -> None:
+        for title in titles:
+            normalized = normalize_title(title)
+            if not normalized:
+                continue
+            grams = trigrams(normalized)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO title_index VALUES (?, ?, ?, ?)",
+                (normalized, mal_id, len(grams), source),
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO title_trigrams VALUES (?, ?)",
+                [(gram, normalized) for gram in grams],
+            )
+
+    def learn(self, mal_id: int, manga: dict, query: Optional[str] = None) -> None:
+        """
+        Records a resolution: the manga's own titles, plus the title we looked it up by
+        (e.g. SauceNAO's romanization) when it plausibly names the same work.
+        """
+        titles = record_titles(manga)
+        self.add(mal_id, titles)
+        if query and any(
+            similarity(query, t) >= TITLE_INDEX_LEARN_SCORE for t in titles
+        ):
+            self.add(mal_id, [query], source="resolved")
+
+    def load_dump(self, path: str) -> int:
+        """
+        Preloads the index from a JSON-lines dump, one manga per line, either Jikan
+        manga objects or {"mal_id": ..., "titles": [...]}. Returns the number of manga
+        loaded.
+        """
+        loaded = 0
+        with self._lock, open(path, encoding="utf-8") as f:
+            self.conn.execute("BEGIN")
+            try:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    titles = entry.get("titles")
+                    if not (titles and isinstance(titles[0], str)):
+                        titles = record_titles(entry)
+                    self._insert(entry["mal_id"], titles, source="dump")
+                    loaded += 1
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return loaded
+
+
+title_index = TitleIndex()
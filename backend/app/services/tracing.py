@@ -0,0 +1,231 @@
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import stage_seconds
+from .profiling import PROFILE_SLOW_REQUEST_MS, profiler, write_profile
+
+# JSON-lines file receiving finished traces in the OTLP/JSON layout (empty disables it)
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+# Share of requests exported; those slower than TRACE_SLOW_MS always are (0 = off)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "0"))
+# Spans kept per trace; a large batch upload would otherwise grow its trace unbounded
+TRACE_MAX_SPANS = 1000
+
+SERVICE_NAME = "mangafinder-api"
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+class Trace:
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List["Span"] = []
+        self.dropped = 0
+
+
+class Span:
+    __slots__ = (
+        "trace",
+        "span_id",
+        "parent_id",
+        "name",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "error",
+    )
+
+    def __init__(
+        self, trace: Trace, name: str, parent_id: Optional[str], attributes: dict
+    ):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+        if len(trace.spans) < TRACE_MAX_SPANS:
+            trace.spans.append(self)
+        else:
+            trace.dropped += 1
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def traceparent(self) -> str:
+        """The W3C `traceparent` naming this span as the parent of a remote call."""
+        return f"00-{self.trace.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [
+                {"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items()
+            ],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Opens a child of the current span for the duration of the block. Outside a traced
+    request (or with tracing off) this is a no-op that yields None. Tasks created inside
+    the block inherit it as their parent.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    current = Span(parent.trace, name, parent.span_id, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+
+
+@contextmanager
+def stage(endpoint: str, name: str):
+    """A pipeline stage: traced as a span and timed in mangafinder_stage_seconds."""
+    with span(name), stage_seconds.time(endpoint=endpoint, stage=name):
+        yield
+
+
+def _export(trace: Trace) -> None:
+    record = {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": SERVICE_NAME}}
+                    ]
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "mangafinder"},
+                        "spans": [s.to_otlp() for s in trace.spans],
+                    }
+                ],
+            }
+        ]
+    }
+    line = json.dumps(record) + "\n"
+
+    def append():
+        try:
+            with open(TRACE_EXPORT_PATH, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            print(f"Could not export trace {trace.trace_id}: {e}")
+
+    asyncio.get_running_loop().run_in_executor(None, append)
+
+
+class TracingMiddleware:
+    """
+    Opens the root span of every HTTP request (continuing an incoming W3C
+    `traceparent`), returns the trace id in a `traceparent` response header and exports
+    the finished trace. Upstream requests carry the trace on in their own `traceparent`
+    (see rate_limit._send). With PROFILE_SLOW_REQUEST_MS set, also keeps the sampling
+    profiler running while requests are in flight and writes a flame graph for each
+    request over the threshold.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.enabled = bool(TRACE_EXPORT_PATH) or PROFILE_SLOW_REQUEST_MS > 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        incoming = _TRACEPARENT.match(
+            dict(scope["headers"]).get(b"traceparent", b"").decode("latin-1")
+        )
+        trace = Trace(incoming.group(1) if incoming else os.urandom(16).hex())
+        root = Span(
+            trace,
+            f"{scope['method']} {scope['path']}",
+            incoming.group(2) if incoming else None,
+            {
+                "http.method": scope["method"],
+                "http.target": scope["path"],
+            },
+        )
+        traceparent = root.traceparent().encode()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                root.set("http.status_code", message["status"])
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"traceparent", traceparent)
+                ]
+            await send(message)
+
+        token = _current_span.set(root)
+        profiling = PROFILE_SLOW_REQUEST_MS > 0
+        if profiling:
+            profiler.begin()
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            root.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            ended = time.monotonic()
+            _current_span.reset(token)
+            root.end_ns = time.time_ns()
+            route = getattr(scope.get("route"), "path", None)
+            if route:
+                root.name = f"{scope['method']} {route}"
+            elapsed_ms = (ended - started) * 1000
+            if profiling:
+                profiler.end()
+                if elapsed_ms >= PROFILE_SLOW_REQUEST_MS:
+                    write_profile(
+                        trace.trace_id, root.name, profiler.collapsed(started, ended)
+                    )
+            if TRACE_EXPORT_PATH and (
+                random.random() < TRACE_SAMPLE_RATE
+                or (TRACE_SLOW_MS and elapsed_ms >= TRACE_SLOW_MS)
+            ):
+                _export(trace)
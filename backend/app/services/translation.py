@@ -0,0 +1,126 @@
+import asyncio
+import hashlib
+import os
+import re
+from abc import ABC, abstractmethod
+from typing import List, Tuple
+
+from deep_translator import GoogleTranslator
+
+from .singleflight import SingleFlight
+from .tiered_cache import TieredCache
+
+TRANSLATION_BACKEND = os.getenv("TRANSLATION_BACKEND", "google")
+# Provider calls running at once; each blocks a worker thread for a network round trip
+TRANSLATION_CONCURRENCY = int(os.getenv("TRANSLATION_CONCURRENCY", "4"))
+TRANSLATION_CACHE_TTL = float(os.getenv("TRANSLATION_CACHE_TTL", str(30 * 24 * 3600)))
+TRANSLATION_CACHE_MAX_MB = int(os.getenv("TRANSLATION_CACHE_MAX_MB", "50"))
+
+
+class TranslationBackend(ABC):
+    """A blocking translation provider; `max_chars` is the most it takes per call."""
+
+    max_chars = 4500
+
+    @abstractmethod
+    def translate(self, text: str, target: str) -> str:
+        ...
+
+
+class GoogleBackend(TranslationBackend):
+    # Google Translate rejects requests over 5000 characters
+    max_chars = 4500
+
+    def translate(self, text: str, target: str) -> str:
+        return GoogleTranslator(source='auto', target=target).translate(text)
+
+
+class StubBackend(TranslationBackend):
+    """Returns the text unchanged, for tests and offline development."""
+
+    def translate(self, text: str, target: str) -> str:
+        return text
+
+
+BACKENDS = {
+    "google": GoogleBackend,
+    "stub": StubBackend,
+}
+
+
+def split_text(text: str, max_chars: int) -> List[Tuple[str, str]]:
+    """
+    Splits text into chunks of at most `max_chars`, breaking at paragraph, then
+    sentence, then word boundaries. Returns (chunk, separator) pairs so the translated
+    chunks can be stitched back together with the original whitespace.
+    """
+    chunks = []
+    while len(text) > max_chars:
+        window = text[:max_chars + 1]
+        cut = -1
+        for pattern in (r"\n\s*\n", r"(?<=[.!?])\s+", r"\s+"):
+            matches = list(re.finditer(pattern, window))
+            if matches:
+                cut = matches[-1].start()
+                separator = matches[-1].group()
+                break
+        if cut <= 0:
+            cut, separator = max_chars, ""
+        chunks.append((text[:cut], separator))
+        text = text[cut + len(separator):]
+    chunks.append((text, ""))
+    return chunks
+
+
+class TranslationService:
+    """
+    Cached, non-blocking front for a TranslationBackend. Results are stored by target
+    language and content hash in a TieredCache, identical concurrent requests are
+    coalesced, and provider calls run in worker threads behind a concurrency cap.
+    """
+
+    def __init__(
+        self, backend: TranslationBackend, cache: TieredCache, concurrency: int
+    ):
+        self.backend = backend
+        self.cache = cache
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._flight = SingleFlight("translation")
+
+    async def translate(self, text: str, target: str) -> str:
+        key = f"{target}:{hashlib.sha256(text.encode()).hexdigest()}"
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return cached[0]
+        return await self._flight.do(
+            key, lambda: self._translate_and_store(key, text, target)
+        )
+
+    async def _translate_and_store(self, key: str, text: str, target: str) -> str:
+        chunks = split_text(text, self.backend.max_chars)
+        translated = await asyncio.gather(
+            *(self._translate_chunk(chunk, target) for chunk, _ in chunks)
+        )
+        result = "".join(
+            part + separator for part, (_, separator) in zip(translated, chunks)
+        )
+        self.cache.set(key, result)
+        return result
+
+    async def _translate_chunk(self, chunk: str, target: str) -> str:
+        if not chunk.strip():
+            return chunk
+        async with self._semaphore:
+            return await asyncio.to_thread(self.backend.translate, chunk, target)
+
+
+translation_service = TranslationService(
+    BACKENDS[TRANSLATION_BACKEND](),
+    TieredCache(
+        "translation",
+        ttl=TRANSLATION_CACHE_TTL,
+        memory_size=2000,
+        max_bytes=TRANSLATION_CACHE_MAX_MB * 1024 * 1024,
+    ),
+    TRANSLATION_CONCURRENCY,
+)
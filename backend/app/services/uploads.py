@@ -0,0 +1,263 @@
+import asyncio
+import io
+import os
+import re
+import zipfile
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))  # 10MB
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Room for the multipart boundaries and the small form fields sent next to the file
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+def format_size(size: int) -> str:
+    """A byte count for error messages, in MB from 1 MB up, then KB, then bytes."""
+    for unit, scale in (("MB", 1024 * 1024), ("KB", 1024)):
+        if size >= scale:
+            return f"{round(size / scale, 1):g}{unit}"
+    return f"{size} bytes"
+
+
+TOO_LARGE_DETAIL = (
+    f"File is too large. Maximum size is {format_size(UPLOAD_MAX_BYTES)}."
+)
+
+# Batch uploads: bytes across all files (archives counted uncompressed) and page count
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(100 * 1024 * 1024)))
+BATCH_MAX_PAGES = int(os.getenv("BATCH_MAX_PAGES", "60"))
+
+ZIP_TYPE = "application/zip"
+
+
+@dataclass
+class ImageUpload:
+    """
+    A validated upload. `data` is the only copy of the image; `open()` hands out readers
+    over it (BytesIO shares an immutable bytes buffer instead of copying it).
+    """
+    filename: str
+    content_type: str
+    data: bytes
+
+    def open(self) -> io.BytesIO:
+        return io.BytesIO(self.data)
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Identifies JPEG/PNG/GIF/WEBP by magic bytes, not the client's content_type."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+async def _read_limited(
+    file: UploadFile,
+    max_size: int,
+    sniff: Callable[[bytes], Optional[str]],
+    too_large_detail: str,
+) -> Tuple[bytes, str]:
+    """
+    Reads the upload in chunks, rejecting it as soon as `sniff` doesn't recognise the
+    first chunk or it grows past `max_size`, and joins the chunks once.
+    Returns (data, type).
+    """
+    if file.size is not None and file.size > max_size:
+        raise HTTPException(status_code=400, detail=too_large_detail)
+
+    chunks = []
+    total = 0
+    content_type = None
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if content_type is None:
+            content_type = sniff(chunk)
+            if content_type is None:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Invalid file type: {file.content_type}. "
+                    "Please upload a JPG, PNG, WEBP, or GIF image.",
+                )
+        total += len(chunk)
+        if total > max_size:
+            raise HTTPException(status_code=400, detail=too_large_detail)
+        chunks.append(chunk)
+
+    if content_type is None:
+        raise HTTPException(status_code=400, detail="The uploaded file is empty.")
+
+    data = chunks[0] if len(chunks) == 1 else b"".join(chunks)
+    return data, content_type
+
+
+async def read_image_upload(
+    file: UploadFile, max_size: int = UPLOAD_MAX_BYTES
+) -> ImageUpload:
+    """Reads and validates a single image upload; its buffer is passed on as-is."""
+    data, content_type = await _read_limited(
+        file, max_size, sniff_image_type, TOO_LARGE_DETAIL
+    )
+    return ImageUpload(
+        filename=file.filename or "upload", content_type=content_type, data=data
+    )
+
+
+def _sniff_batch_file(head: bytes) -> Optional[str]:
+    if head.startswith(b"PK\x03\x04"):
+        return ZIP_TYPE
+    return sniff_image_type(head)
+
+
+def _natural_key(name: str):
+    return [
+        int(part) if part.isdigit() else part.lower()
+        for part in re.split(r"(\d+)", name)
+    ]
+
+
+def _extract_archive(data: bytes, max_pages: int, max_bytes: int) -> List[ImageUpload]:
+    """
+    Pulls the images out of a zip/CBZ in reading order. Sizes are checked against the
+    declared sizes before anything is decompressed; non-image entries are skipped.
+    """
+    pages = []
+    total = 0
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            entries = sorted(
+                (info for info in archive.infolist() if not info.is_dir()),
+                key=lambda info: _natural_key(info.filename),
+            )
+            for info in entries:
+                if info.file_size > UPLOAD_MAX_BYTES:
+                    print(f"Skipping archive entry {info.filename}: too large")
+                    continue
+                total += info.file_size
+                if total > max_bytes:
+                    raise HTTPException(status_code=400, detail="Batch is too large.")
+                content = archive.read(info)
+                content_type = sniff_image_type(content[:16])
+                if content_type is None:
+                    continue
+                if len(pages) >= max_pages:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Too many pages. Maximum is {BATCH_MAX_PAGES}.",
+                    )
+                pages.append(
+                    ImageUpload(
+                        filename=os.path.basename(info.filename),
+                        content_type=content_type,
+                        data=content,
+                    )
+                )
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Could not read the archive.")
+    return pages
+
+
+async def read_batch_uploads(files: List[UploadFile]) -> List[ImageUpload]:
+    """
+    Reads a multi-file upload where every file is an image or a zip/CBZ of images, and
+    returns the pages in upload order (archive pages in natural filename order).
+    """
+    pages: List[ImageUpload] = []
+    budget = BATCH_MAX_BYTES
+    for file in files:
+        data, content_type = await _read_limited(
+            file, budget, _sniff_batch_file, "Batch is too large."
+        )
+        budget -= len(data)
+        if content_type == ZIP_TYPE:
+            extracted = await asyncio.to_thread(
+                _extract_archive, data, BATCH_MAX_PAGES - len(pages),
+                BATCH_MAX_BYTES - sum(len(page.data) for page in pages),
+            )
+            pages.extend(extracted)
+        else:
+            if len(data) > UPLOAD_MAX_BYTES:
+                raise HTTPException(
+                    status_code=400, detail=f"{file.filename}: {TOO_LARGE_DETAIL}"
+                )
+            pages.append(
+                ImageUpload(
+                    filename=file.filename or "upload",
+                    content_type=content_type,
+                    data=data,
+                )
+            )
+        if len(pages) > BATCH_MAX_PAGES:
+            raise HTTPException(
+                status_code=400, detail=f"Too many pages. Maximum is {BATCH_MAX_PAGES}."
+            )
+
+    if not pages:
+        raise HTTPException(status_code=400, detail="No images found in the upload.")
+    return pages
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Caps request bodies per path before the multipart parser buffers them: a too large
+    Content-Length is answered with 413 straight away, and chunked bodies are cut off as
+    soon as the running total passes the limit.
+    """
+
+    def __init__(self, app: ASGIApp, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if (
+            content_length is not None
+            and content_length.isdigit()
+            and int(content_length) > limit
+        ):
+            await self._reject(send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # FastAPI re-raises HTTPExceptions from body parsing as-is
+                    raise HTTPException(status_code=413, detail=TOO_LARGE_DETAIL)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    async def _reject(send: Send) -> None:
+        body = b'{"detail":"' + TOO_LARGE_DETAIL.encode() + b'"}'
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
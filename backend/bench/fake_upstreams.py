@@ -0,0 +1,218 @@
+"""
+Local stand-in for SauceNAO and Jikan that replays recorded responses.
+
+    uvicorn bench.fake_upstreams:app --port 9100
+
+Point the backend at it with SAUCENAO_URL=http://127.0.0.1:9100/search.php and
+JIKAN_BASE_URL=http://127.0.0.1:9100/v4. Behaviour is set through the environment:
+
+    BENCH_LATENCY_MS      base latency added to every upstream response (default 200)
+    BENCH_JITTER_MS       extra random latency, uniform in [0, jitter] (default 100)
+    BENCH_RATE_429        share of requests answered 429 with Retry-After: 1 (default 0)
+    BENCH_FAILURE_RATE    share of requests answered 503 (default 0)
+    BENCH_CATALOGUE_SIZE  number of distinct manga served, cloned from the fixtures
+                          (default 50)
+    BENCH_FIXTURES        directory holding jikan.json and saucenao.json
+    BENCH_SEED            seed for latency and failure injection
+
+SauceNAO picks the matched manga from a hash of the uploaded image, so the same page
+always resolves to the same title. GET /_stats returns call counts per route and
+POST /_reset clears them.
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import random
+import re
+from collections import Counter
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+BENCH_LATENCY_MS = float(os.getenv("BENCH_LATENCY_MS", "200"))
+BENCH_JITTER_MS = float(os.getenv("BENCH_JITTER_MS", "100"))
+BENCH_RATE_429 = float(os.getenv("BENCH_RATE_429", "0"))
+BENCH_FAILURE_RATE = float(os.getenv("BENCH_FAILURE_RATE", "0"))
+BENCH_CATALOGUE_SIZE = int(os.getenv("BENCH_CATALOGUE_SIZE", "50"))
+BENCH_FIXTURES = os.getenv(
+    "BENCH_FIXTURES", os.path.join(os.path.dirname(__file__), "fixtures")
+)
+
+_random = random.Random(int(os.getenv("BENCH_SEED", "1")))
+
+
+def _load(name: str) -> dict:
+    with open(os.path.join(BENCH_FIXTURES, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _normalize(title: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", title.casefold()).split())
+
+
+def build_catalogue(fixtures: dict, size: int):
+    """
+    Returns (manga by mal_id, manga in catalogue order). Beyond the recorded manga,
+    entries are clones with a new mal_id and a numbered title that share the original's
+    author.
+    """
+    recorded = fixtures["manga"]
+    ordered = []
+    for i in range(max(size, len(recorded))):
+        base = recorded[i % len(recorded)]
+        copy_number = i // len(recorded)
+        if copy_number == 0:
+            ordered.append(base)
+            continue
+        clone = copy.deepcopy(base)
+        clone["mal_id"] = base["mal_id"] + 1_000_000 * copy_number
+        clone["title"] = f"{base['title']} {copy_number + 1}"
+        clone["title_english"] = clone["title"]
+        clone["titles"] = [{"type": "Default", "title": clone["title"]}]
+        clone["url"] = f"https://myanimelist.net/manga/{clone['mal_id']}"
+        ordered.append(clone)
+    return {m["mal_id"]: m for m in ordered}, ordered
+
+
+jikan_fixtures = _load("jikan.json")
+saucenao_fixture = _load("saucenao.json")
+manga_by_id, catalogue = build_catalogue(jikan_fixtures, BENCH_CATALOGUE_SIZE)
+manga_by_title = {_normalize(m["title"]): m for m in catalogue}
+
+calls = Counter()
+
+
+async def _upstream(route: str):
+    """Counts the call, waits the configured latency and maybe injects a 429 or 503."""
+    calls[route] += 1
+    await asyncio.sleep((BENCH_LATENCY_MS + _random.uniform(0, BENCH_JITTER_MS)) / 1000)
+    roll = _random.random()
+    if roll < BENCH_RATE_429:
+        calls["429"] += 1
+        return JSONResponse(
+            {"status": 429, "message": "Too many requests"},
+            status_code=429,
+            headers={"Retry-After": "1"},
+        )
+    if roll < BENCH_RATE_429 + BENCH_FAILURE_RATE:
+        calls["503"] += 1
+        return JSONResponse(
+            {"status": 503, "message": "Service unavailable"}, status_code=503
+        )
+    return None
+
+
+def _data(data) -> JSONResponse:
+    return JSONResponse({"data": data})
+
+
+async def saucenao_search(request: Request):
+    injected = await _upstream("saucenao /search.php")
+    if injected is not None:
+        return injected
+    form = await request.form()
+    upload = form.get("file")
+    content = await upload.read() if upload is not None else b""
+    index = int.from_bytes(hashlib.sha1(content).digest()[:4], "big")
+    match = catalogue[index % len(catalogue)]
+    other = catalogue[(index + 1) % len(catalogue)]
+
+    response = copy.deepcopy(saucenao_fixture)
+    response.pop("_note", None)
+    response["results"][0]["data"]["source"] = match["title"]
+    response["results"][0]["data"]["author"] = match["authors"][0]["name"]
+    if len(response["results"]) > 1:
+        response["results"][1]["data"]["source"] = other["title"]
+    return JSONResponse(response)
+
+
+async def jikan_manga_search(request: Request):
+    injected = await _upstream("jikan /v4/manga")
+    if injected is not None:
+        return injected
+    query = _normalize(request.query_params.get("q", ""))
+    match = manga_by_title.get(query) or next(
+        (m for title, m in manga_by_title.items() if query and query in title), None
+    )
+    return _data([match] if match else [])
+
+
+def _manga_route(route: str, build):
+    async def endpoint(request: Request):
+        injected = await _upstream(route)
+        if injected is not None:
+            return injected
+        manga = manga_by_id.get(int(request.path_params["mal_id"]))
+        if manga is None:
+            return JSONResponse(
+                {"status": 404, "message": "Resource does not exist"}, status_code=404
+            )
+        return _data(build(manga))
+    return endpoint
+
+
+def _people_route(route: str, section: str):
+    async def endpoint(request: Request):
+        injected = await _upstream(route)
+        if injected is not None:
+            return injected
+        person = jikan_fixtures[section].get(str(request.path_params["person_id"]))
+        if person is None:
+            return JSONResponse(
+                {"status": 404, "message": "Resource does not exist"}, status_code=404
+            )
+        return _data(person)
+    return endpoint
+
+
+async def jikan_top_manga(request: Request):
+    injected = await _upstream("jikan /v4/top/manga")
+    if injected is not None:
+        return injected
+    page = int(request.query_params.get("page", "1"))
+    return _data(catalogue[(page - 1) * 25:page * 25])
+
+
+async def stats(request: Request):
+    return JSONResponse(dict(calls))
+
+
+async def reset(request: Request):
+    calls.clear()
+    return JSONResponse({})
+
+
+app = Starlette(
+    routes=[
+        Route("/search.php", saucenao_search, methods=["POST"]),
+        Route("/v4/manga", jikan_manga_search),
+        Route(
+            "/v4/manga/{mal_id:int}/full",
+            _manga_route("jikan /v4/manga/{id}/full", lambda m: m),
+        ),
+        Route(
+            "/v4/manga/{mal_id:int}/external",
+            _manga_route(
+                "jikan /v4/manga/{id}/external",
+                lambda m: jikan_fixtures["external"].get(
+                    str(m["mal_id"] % 1_000_000), []
+                ),
+            ),
+        ),
+        Route(
+            "/v4/people/{person_id:int}",
+            _people_route("jikan /v4/people/{id}", "people"),
+        ),
+        Route(
+            "/v4/people/{person_id:int}/manga",
+            _people_route("jikan /v4/people/{id}/manga", "people_manga"),
+        ),
+        Route("/v4/top/manga", jikan_top_manga),
+        Route("/_stats", stats),
+        Route("/_reset", reset, methods=["POST"]),
+    ]
+)
@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import time
+
+import requests
+
+JIKAN = "https://api.jikan.moe/v4"
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def get(path: str, params=None):
+    # Stay under Jikan's 3 requests per second
+    time.sleep(0.4)
+    resp = requests.get(f"{JIKAN}{path}", params=params, timeout=30)
+    resp.raise_for_status()
+    return resp.json().get("data")
+
+
+def record_jikan(mal_ids):
+    fixtures = {"manga": [], "external": {}, "people": {}, "people_manga": {}}
+    for mal_id in mal_ids:
+        print(f"Recording manga {mal_id}...")
+        manga = get(f"/manga/{mal_id}/full")
+        fixtures["manga"].append(manga)
+        fixtures["external"][str(mal_id)] = get(f"/manga/{mal_id}/external")
+        for author in manga.get("authors", [])[:1]:
+            person_id = str(author["mal_id"])
+            if person_id not in fixtures["people"]:
+                fixtures["people"][person_id] = get(f"/people/{person_id}")
+                fixtures["people_manga"][person_id] = get(
+                    f"/people/{person_id}/manga", {"limit": 5}
+                )[:5]
+    return fixtures
+
+
+def record_saucenao(image_path: str, api_key: str):
+    print(f"Recording SauceNAO response for {image_path}...")
+    with open(image_path, "rb") as f:
+        resp = requests.post(
+            "https://saucenao.com/search.php",
+            params={"db": 999, "output_type": 2, "numres": 5, "api_key": api_key},
+            files={"file": f},
+            timeout=60,
+        )
+    resp.raise_for_status()
+    return resp.json()
+
+
+# Usage: python bench/record_fixtures.py --mal-ids 2 11 13 [--saucenao-image page.jpg]
+# Overwrites bench/fixtures/jikan.json, and saucenao.json given an image and
+# SAUCENAO_API_KEY
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Record real upstream responses for the fake upstreams"
+    )
+    parser.add_argument("--mal-ids", type=int, nargs="+", required=True)
+    parser.add_argument("--saucenao-image")
+    args = parser.parse_args()
+
+    with open(os.path.join(FIXTURES, "jikan.json"), "w", encoding="utf-8") as f:
+        json.dump(record_jikan(args.mal_ids), f, indent=2, ensure_ascii=False)
+
+    if args.saucenao_image:
+        from dotenv import load_dotenv
+        load_dotenv()
+        with open(os.path.join(FIXTURES, "saucenao.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                record_saucenao(args.saucenao_image, os.getenv("SAUCENAO_API_KEY")),
+                f,
+                indent=2,
+            )
+    print("Done")
@@ -0,0 +1,321 @@
+"""
+Load test for the backend against the local fake upstreams.
+
+    python bench/run_bench.py --endpoints search details batch --concurrency 1 8 32 \
+        --requests 200 --out bench/results/current.json \
+        --baseline bench/results/main.json
+
+Each scenario (endpoint x concurrency) starts the fake upstreams and a fresh backend
+with empty caches, fires --requests requests from --concurrency workers and reports
+latency percentiles, throughput, status codes, backend memory and upstream calls.
+Payloads repeat (--images distinct pages, --titles distinct titles), so the caches and
+request coalescing are exercised the same way on every run. Run from the backend
+directory.
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import httpx
+from PIL import Image, ImageDraw
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BATCH_PAGES = 5
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_pages(count: int, seed: int) -> List[bytes]:
+    """Distinct synthetic manga-ish pages (panels, noise), each with its own phash."""
+    rng = random.Random(seed)
+    pages = []
+    for _ in range(count):
+        img = Image.new("L", (800, 1200), 255)
+        draw = ImageDraw.Draw(img)
+        for _ in range(rng.randint(4, 9)):
+            x0, y0 = rng.randint(0, 700), rng.randint(0, 1100)
+            draw.rectangle(
+                [x0, y0, x0 + rng.randint(60, 400), y0 + rng.randint(60, 500)],
+                fill=rng.randint(0, 255),
+                outline=0,
+                width=4,
+            )
+        out = io.BytesIO()
+        img.convert("RGB").save(out, "JPEG", quality=90)
+        pages.append(out.getvalue())
+    return pages
+
+
+class Server:
+    """A uvicorn subprocess that is killed on exit."""
+
+    def __init__(self, app: str, port: int, env: Dict[str, str], log_path: str):
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+        self.log = open(log_path, "w")
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                app,
+                "--port",
+                str(port),
+                "--log-level",
+                "warning",
+            ],
+            cwd=BACKEND_DIR,
+            env=dict(os.environ, **env),
+            stdout=self.log,
+            stderr=subprocess.STDOUT,
+        )
+
+    def wait_ready(self, path: str, timeout: float = 30) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(
+                    f"Server on port {self.port} exited; see {self.log.name}"
+                )
+            try:
+                httpx.get(self.url + path, timeout=1)
+                return
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        raise RuntimeError(
+            f"Server on port {self.port} did not start; see {self.log.name}"
+        )
+
+    def memory_kb(self) -> Dict[str, Optional[int]]:
+        """Current (VmRSS) and peak (VmHWM) resident memory; Linux only."""
+        memory = {"rss_kb": None, "peak_rss_kb": None}
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        memory["rss_kb"] = int(line.split()[1])
+                    elif line.startswith("VmHWM:"):
+                        memory["peak_rss_kb"] = int(line.split()[1])
+        except OSError:
+            pass
+        return memory
+
+    def stop(self) -> None:
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+def request_for(endpoint: str, i: int, pages: List[bytes], titles: List[str]):
+    if endpoint == "search":
+        page = pages[i % len(pages)]
+        return "/search", {
+            "files": {"file": (f"page{i % len(pages)}.jpg", page, "image/jpeg")}
+        }
+    if endpoint == "details":
+        return "/details", {"data": {"title": titles[i % len(titles)]}}
+    if endpoint == "batch":
+        start = (i * BATCH_PAGES) % len(pages)
+        batch = [pages[(start + k) % len(pages)] for k in range(BATCH_PAGES)]
+        return "/search/batch", {
+            "files": [
+                ("files", (f"p{k}.jpg", b, "image/jpeg")) for k, b in enumerate(batch)
+            ]
+        }
+    raise ValueError(f"Unknown endpoint {endpoint}")
+
+
+async def drive(
+    base_url: str, endpoint: str, concurrency: int, total: int, pages, titles
+) -> dict:
+    latencies: List[float] = []
+    statuses = Counter()
+    counter = itertools.count()
+    limits = httpx.Limits(
+        max_connections=concurrency, max_keepalive_connections=concurrency
+    )
+
+    async with httpx.AsyncClient(
+        base_url=base_url, timeout=300, limits=limits
+    ) as client:
+
+        async def worker(n: int):
+            # Each worker is its own client for admission control's per-client queues
+            headers = {"X-API-Key": f"bench-{n}"}
+            while True:
+                i = next(counter)
+                if i >= total:
+                    return
+                path, kwargs = request_for(endpoint, i, pages, titles)
+                started = time.perf_counter()
+                try:
+                    response = await client.post(path, headers=headers, **kwargs)
+                    statuses[str(response.status_code)] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    return {
+        "requests": total,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(total / wall, 2) if wall else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1),
+        "statuses": dict(statuses),
+    }
+
+
+def run_scenario(
+    args, endpoint: str, concurrency: int, pages, titles, workdir: str
+) -> dict:
+    fake_port, app_port = free_port(), free_port()
+    fake = Server("bench.fake_upstreams:app", fake_port, {
+        "BENCH_LATENCY_MS": str(args.latency_ms),
+        "BENCH_JITTER_MS": str(args.jitter_ms),
+        "BENCH_RATE_429": str(args.rate_429),
+        "BENCH_FAILURE_RATE": str(args.failure_rate),
+        "BENCH_CATALOGUE_SIZE": str(args.titles),
+        "BENCH_SEED": str(args.seed),
+    }, os.path.join(workdir, "fake_upstreams.log"))
+    scenario_dir = tempfile.mkdtemp(dir=workdir, prefix=f"{endpoint}-{concurrency}-")
+    app = Server("main:app", app_port, {
+        "SAUCENAO_URL": f"{fake.url}/search.php",
+        "JIKAN_BASE_URL": f"{fake.url}/v4",
+        "SAUCENAO_API_KEY": "bench",
+        # The fakes have no quota; only the injected 429s should slow the backend down
+        "SAUCENAO_SHORT_LIMIT": "100000",
+        "SAUCENAO_LONG_LIMIT": "100000000",
+        "JIKAN_RATE_PER_SECOND": "100000",
+        "JIKAN_RATE_PER_MINUTE": "100000000",
+        "TRANSLATION_BACKEND": "stub",
+        "CACHE_DB_PATH": os.path.join(scenario_dir, "cache.sqlite3"),
+        "SNAPSHOT_DB_PATH": os.path.join(scenario_dir, "snapshot.sqlite3"),
+        "SNAPSHOT_REFRESH_INTERVAL": "0",
+    }, os.path.join(scenario_dir, "backend.log"))
+    try:
+        fake.wait_ready("/_stats")
+        app.wait_ready("/stats")
+        result = asyncio.run(
+            drive(app.url, endpoint, concurrency, args.requests, pages, titles)
+        )
+        result["memory"] = app.memory_kb()
+        result["upstream_calls"] = httpx.get(f"{fake.url}/_stats").json()
+        result["backend_stats"] = httpx.get(f"{app.url}/stats").json()
+    finally:
+        app.stop()
+        fake.stop()
+    return result
+
+
+def print_table(results: Dict[str, dict], baseline: Optional[Dict[str, dict]]) -> None:
+    print(
+        f"\n{'scenario':<16}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        f"{'peak MB':>9}{'upstream':>10}  statuses"
+    )
+    for name, r in results.items():
+        peak = r["memory"]["peak_rss_kb"]
+        upstream = sum(
+            v for k, v in r["upstream_calls"].items() if k not in ("429", "503")
+        )
+        print(
+            f"{name:<16}{r['throughput_rps']:>9}"
+            f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}"
+            f"{(peak // 1024 if peak else '-'):>9}{upstream:>10}  {r['statuses']}"
+        )
+        old = (baseline or {}).get(name)
+        if old:
+            deltas = []
+            for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+                if old.get(key):
+                    deltas.append(f"{key} {100 * (r[key] - old[key]) / old[key]:+.1f}%")
+            print(f"{'':<16}vs baseline: " + ", ".join(deltas))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the backend against fake upstreams"
+    )
+    parser.add_argument(
+        "--endpoints",
+        nargs="+",
+        default=["search", "details", "batch"],
+        choices=["search", "details", "batch"],
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument(
+        "--requests", type=int, default=200, help="requests per scenario"
+    )
+    parser.add_argument(
+        "--images", type=int, default=50, help="distinct pages in the upload mix"
+    )
+    parser.add_argument(
+        "--titles", type=int, default=50, help="distinct manga served by the fakes"
+    )
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the results as JSON")
+    parser.add_argument(
+        "--baseline", help="JSON results of an earlier run to compare against"
+    )
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    from bench.fake_upstreams import build_catalogue, jikan_fixtures
+
+    pages = make_pages(args.images, args.seed)
+    titles = [m["title"] for m in build_catalogue(jikan_fixtures, args.titles)[1]]
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="mangafinder-bench-") as workdir:
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                name = f"{endpoint}@{concurrency}"
+                print(f"Running {name}...")
+                results[name] = run_scenario(
+                    args, endpoint, concurrency, pages, titles, workdir
+                )
+
+    print_table(results, baseline)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"\nResults written to {args.out}")
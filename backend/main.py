@@ -2,13 +2,79 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import search
 
-app = FastAPI(title="MangaFinder API")
+from app.routers import images, jobs, monitoring, search
+from app.services.admission import AdmissionControlMiddleware, admission_queues
+from app.services.http_client import close_http_clients, start_http_clients
+from app.services.jikan import JIKAN_BASE_URL
+from app.services.jobs import JOB_WORKERS, start_job_workers
+from app.services.metrics import MetricsMiddleware
+from app.services.prefetch import PREFETCH_INTERVAL, prefetch_forever
+from app.services.preprocess import close_preprocess_pool, start_preprocess_pool
+from app.services.saucenao import SAUCENAO_URL
+from app.services.snapshot import SNAPSHOT_REFRESH_INTERVAL, refresh_snapshot_forever
+from app.services.tiered_cache import flush_writes
+from app.services.tracing import TracingMiddleware
+from app.services.uploads import (
+    BATCH_MAX_BYTES,
+    FORM_OVERHEAD_BYTES,
+    UPLOAD_MAX_BYTES,
+    UploadSizeLimitMiddleware,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared upstream connection pools live for the whole process
+    await start_http_clients(SAUCENAO_URL, JIKAN_BASE_URL)
+    start_preprocess_pool()
+    background = []
+    if SNAPSHOT_REFRESH_INTERVAL > 0:
+        background.append(asyncio.create_task(refresh_snapshot_forever()))
+    if PREFETCH_INTERVAL > 0:
+        background.append(asyncio.create_task(prefetch_forever()))
+    if JOB_WORKERS > 0:
+        background.extend(start_job_workers(JOB_WORKERS, jobs.run_search_job))
+    yield
+    for task in background:
+        task.cancel()
+    # Let running jobs and refreshes unwind before their clients and pools go away
+    await asyncio.gather(*background, return_exceptions=True)
+    close_preprocess_pool()
+    await close_http_clients()
+    # Cache writes are queued to a writer thread; let it finish before the process exits
+    await asyncio.to_thread(flush_writes)
+
+
+app = FastAPI(title="MangaFinder API", lifespan=lifespan)
+
+# Reject oversized uploads as they stream in, before the multipart parser buffers them
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    limits={
+        "/search": UPLOAD_MAX_BYTES + FORM_OVERHEAD_BYTES,
+        "/search/stream": UPLOAD_MAX_BYTES + FORM_OVERHEAD_BYTES,
+        "/search/batch": BATCH_MAX_BYTES + FORM_OVERHEAD_BYTES,
+        "/jobs": UPLOAD_MAX_BYTES + FORM_OVERHEAD_BYTES,
+    },
+)
+
+# Bounded concurrency with fair per-client queuing (waiting requests haven't uploaded)
+app.add_middleware(AdmissionControlMiddleware, queues=admission_queues)
+
+# Request counts and latency, including requests rejected by the upload limit or shed
+app.add_middleware(MetricsMiddleware)
+
+# Root span per request; a no-op unless TRACE_EXPORT_PATH or PROFILE_SLOW_REQUEST_MS is
+# set
+app.add_middleware(TracingMiddleware)
 
-# Configure CORS
+# Configure CORS (added last so it also wraps the early rejections)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # For development, allow all. In production, specify frontend URL.
@@ -18,3 +84,6 @@ app.add_middleware(
 )
 
 app.include_router(search.router)
+app.include_router(jobs.router)
+app.include_router(images.router)
+app.include_router(monitoring.router)
@@ -0,0 +1,37 @@
+import asyncio
+import os
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Add current directory to sys.path to allow importing app
+sys.path.append(os.getcwd())
+
+from app.services.http_client import close_http_clients, start_http_clients
+from app.services.jikan import JIKAN_BASE_URL
+from app.services.snapshot import bulk_ingest_top, ingest_many, snapshot
+
+
+async def main(args):
+    await start_http_clients(JIKAN_BASE_URL)
+    try:
+        if args[0] == "--top":
+            count = await bulk_ingest_top(int(args[1]))
+        else:
+            count = await ingest_many(int(mal_id) for mal_id in args)
+    finally:
+        await close_http_clients()
+    print(f"Ingested {count} manga; snapshot now holds {snapshot.count_manga()}")
+
+
+# Usage: python scripts/build_snapshot.py --top 40  (first 40 pages of /top/manga)
+#        python scripts/build_snapshot.py 2 13 11   (specific mal_ids)
+# /top/manga has 25 manga per page. Jikan allows ~60 requests a minute, so a 1000 manga
+# snapshot takes a bit over an hour.
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or (sys.argv[1] == "--top" and len(sys.argv) != 3):
+        print("Usage: python scripts/build_snapshot.py --top <pages> | <mal_id> ...")
+        sys.exit(1)
+    asyncio.run(main(sys.argv[1:]))
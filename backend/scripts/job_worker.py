@@ -0,0 +1,42 @@
+import asyncio
+import os
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Add current directory to sys.path to allow importing app
+sys.path.append(os.getcwd())
+
+from app.routers.jobs import run_search_job
+from app.services.http_client import close_http_clients, start_http_clients
+from app.services.jikan import JIKAN_BASE_URL
+from app.services.jobs import JOB_DB_PATH, start_job_workers
+from app.services.preprocess import close_preprocess_pool, start_preprocess_pool
+from app.services.saucenao import SAUCENAO_URL
+
+
+async def main(count: int):
+    await start_http_clients(SAUCENAO_URL, JIKAN_BASE_URL)
+    start_preprocess_pool()
+    print(f"Running {count} job workers on {JOB_DB_PATH}")
+    try:
+        await asyncio.gather(*start_job_workers(count, run_search_job))
+    finally:
+        close_preprocess_pool()
+        await close_http_clients()
+
+
+# Usage: python scripts/job_worker.py [workers]
+# Runs /jobs searches without serving HTTP, so workers scale apart from the API. Point
+# it at the API's JOB_DB_PATH (and CACHE_DB_PATH, to share its caches); set
+# JOB_WORKERS=0 on API nodes that should only accept jobs.
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        print("Usage: python scripts/job_worker.py [workers]")
+        sys.exit(1)
+    try:
+        asyncio.run(main(int(sys.argv[1]) if len(sys.argv) == 2 else 4))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,21 @@
+import os
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Add current directory to sys.path to allow importing app
+sys.path.append(os.getcwd())
+
+from app.services.title_index import title_index
+
+# Usage: python scripts/load_title_index.py dump.jsonl
+# One manga per line: a Jikan manga object, or
+# {"mal_id": 11, "titles": ["Naruto", "ナルト"]}
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python scripts/load_title_index.py <dump.jsonl>")
+        sys.exit(1)
+    count = title_index.load_dump(sys.argv[1])
+    print(f"Loaded {count} manga into the title index")
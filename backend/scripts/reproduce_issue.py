@@ -2,7 +2,7 @@
 import asyncio
 import os
 import sys
-from fastapi import UploadFile
+
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,15 +11,8 @@ load_dotenv()
 sys.path.append(os.getcwd())
 
 from app.services.saucenao import search_saucenao
+from app.services.uploads import ImageUpload
 
-class MockUploadFile:
-    def __init__(self, filename, content):
-        self.filename = filename
-        self.content_type = "image/jpeg"
-        self._content = content
-    
-    async def read(self):
-        return self._content
 
 async def main():
     if not os.path.exists("test_image.jpg"):
@@ -28,9 +21,11 @@ async def main():
 
     with open("test_image.jpg", "rb") as f:
         content = f.read()
-    
-    file = MockUploadFile("test_image.jpg", content)
-    
+
+    file = ImageUpload(
+        filename="test_image.jpg", content_type="image/jpeg", data=content
+    )
+
     try:
         print("Calling search_saucenao...")
         result = await search_saucenao(file, include_nsfw=False)
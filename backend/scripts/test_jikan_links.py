@@ -1,16 +1,22 @@
-from app.services.jikan import fetch_manga_details
+import asyncio
 import json
 
-def test():
+from app.records import to_dict
+from app.services.jikan import fetch_manga_details
+
+
+async def test():
     print("Fetching details for 'Naruto'...")
-    details = fetch_manga_details("Naruto")
+    details = await fetch_manga_details("Naruto")
     print("External Links found:")
-    print(json.dumps([l.dict() for l in details.get('external_links', [])], indent=2))
+    links = [to_dict(link) for link in details.get('external_links', [])]
+    print(json.dumps(links, indent=2))
 
     print("\nFetching details for 'Berserk'...")
-    details = fetch_manga_details("Berserk")
+    details = await fetch_manga_details("Berserk")
     print("External Links found:")
-    print(json.dumps([l.dict() for l in details.get('external_links', [])], indent=2))
+    links = [to_dict(link) for link in details.get('external_links', [])]
+    print(json.dumps(links, indent=2))
 
 if __name__ == "__main__":
-    test()
+    asyncio.run(test())
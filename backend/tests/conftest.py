@@ -0,0 +1,50 @@
+"""
+The services read their settings when imported, so the test environment is set here,
+before anything under app/ is imported: databases go to a scratch directory,
+translations use the stub backend, upstream URLs point at bench/fake_upstreams.py and
+no background loops run.
+"""
+import os
+import tempfile
+
+_scratch = tempfile.mkdtemp(prefix="mangafinder-tests-")
+
+os.environ.update({
+    "CACHE_DB_PATH": os.path.join(_scratch, "cache.sqlite3"),
+    "SNAPSHOT_DB_PATH": os.path.join(_scratch, "snapshot.sqlite3"),
+    "JOB_DB_PATH": os.path.join(_scratch, "jobs.sqlite3"),
+    "IMAGE_PROXY_DIR": os.path.join(_scratch, "images"),
+    "PROFILE_DIR": os.path.join(_scratch, "profiles"),
+    "TRANSLATION_BACKEND": "stub",
+    "SAUCENAO_API_KEY": "test",
+    "SAUCENAO_URL": "http://upstreams.test/search.php",
+    "JIKAN_BASE_URL": "http://upstreams.test/v4",
+    # SauceNAO's 4-per-30s quota would spread a batch over minutes; Jikan keeps its own
+    "SAUCENAO_SHORT_LIMIT": "100",
+    "PREPROCESS_WORKERS": "0",
+    "PREFETCH_INTERVAL": "0",
+    "SNAPSHOT_REFRESH_INTERVAL": "0",
+    "JOB_WORKERS": "0",
+    "BENCH_LATENCY_MS": "20",
+    "BENCH_JITTER_MS": "20",
+})
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def fake_upstreams(monkeypatch):
+    """Serves every upstream request from bench/fake_upstreams.py, in process."""
+    from app.services import http_client
+    from bench import fake_upstreams
+
+    def build_client() -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_upstreams.app))
+
+    # Clients belong to the event loop that made them; each test runs its own
+    http_client._clients.clear()
+    monkeypatch.setattr(http_client, "_build_client", build_client)
+    fake_upstreams.calls.clear()
+    yield fake_upstreams
+    http_client._clients.clear()
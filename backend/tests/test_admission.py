@@ -0,0 +1,107 @@
+import asyncio
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from app.services.admission import (
+    AdmissionControlMiddleware,
+    AdmissionQueue,
+    AdmissionRejected,
+)
+
+
+def test_freed_slot_goes_to_the_client_with_fewest_in_progress():
+    async def scenario():
+        queue = AdmissionQueue("test", 2, max_queue=10, client_queue=10, max_wait=5)
+        await queue.acquire("a")
+        await queue.acquire("a")
+        order = []
+
+        async def request(client: str):
+            await queue.acquire(client)
+            order.append(client)
+
+        tasks = [asyncio.create_task(request(client)) for client in ("a", "a", "b")]
+        await asyncio.sleep(0)
+        queue.release("a", 0.1)
+        await asyncio.sleep(0.01)
+        # "a" queued first, but "b" has nothing in progress
+        assert order == ["b"]
+        queue.release("a", 0.1)
+        queue.release("b", 0.1)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["b", "a", "a"]
+
+
+def test_client_over_its_queue_share_gets_429():
+    async def scenario():
+        queue = AdmissionQueue("test", 1, max_queue=10, client_queue=1, max_wait=5)
+        await queue.acquire("a")
+        waiting = asyncio.create_task(queue.acquire("a"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await queue.acquire("a")
+        # Other clients still get in line
+        other = asyncio.create_task(queue.acquire("b"))
+        await asyncio.sleep(0)
+        assert queue.stats()["queued"] == 2
+        waiting.cancel()
+        other.cancel()
+        return rejected.value
+
+    rejection = asyncio.run(scenario())
+    assert rejection.status_code == 429
+    assert rejection.reason == "client_queue_full"
+    assert rejection.retry_after >= 1
+
+
+def test_full_queue_and_timeout_get_503():
+    async def scenario():
+        queue = AdmissionQueue("test", 1, max_queue=1, client_queue=5, max_wait=0.05)
+        await queue.acquire("a")
+        with pytest.raises(AdmissionRejected) as timed_out:
+            await queue.acquire("b")
+        waiting = asyncio.create_task(queue.acquire("b"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as full:
+            await queue.acquire("c")
+        waiting.cancel()
+        return timed_out.value, full.value, queue.stats()
+
+    timed_out, full, stats = asyncio.run(scenario())
+    assert (timed_out.status_code, timed_out.reason) == (503, "timeout")
+    assert (full.status_code, full.reason) == (503, "queue_full")
+    assert stats["rejected_timeout"] == stats["rejected_queue_full"] == 1
+
+
+def test_middleware_answers_shed_requests_with_retry_after():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def slow(request):
+            await release.wait()
+            return PlainTextResponse("done")
+
+        queue = AdmissionQueue("search", 1, max_queue=0, client_queue=1, max_wait=5)
+        app = AdmissionControlMiddleware(
+            Starlette(routes=[Route("/search", slow)]), {"/search": queue}
+        )
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://test")
+        async with client:
+            first = asyncio.create_task(client.get("/search"))
+            await asyncio.sleep(0.01)
+            shed = await client.get("/search")
+            release.set()
+            return (await first), shed
+
+    first, shed = asyncio.run(scenario())
+    assert first.status_code == 200
+    assert shed.status_code == 503
+    assert int(shed.headers["retry-after"]) >= 1
+    assert shed.json() == {"detail": "The server is busy. Please retry later."}
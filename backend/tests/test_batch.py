@@ -0,0 +1,46 @@
+import asyncio
+import io
+import os
+
+import httpx
+from PIL import Image
+
+from app.services import jikan
+from main import app
+
+
+def noise_page(number: int) -> tuple:
+    out = io.BytesIO()
+    Image.frombytes("L", (64, 64), os.urandom(64 * 64)).save(out, "PNG")
+    return ("files", (f"page{number}.png", out.getvalue(), "image/png"))
+
+
+def test_ten_page_batch_comes_back_complete(fake_upstreams):
+    """
+    Every title of a 10-page batch gets its full Jikan record under the default Jikan
+    rate limits, with nothing shed by the scheduler.
+    """
+    shed = jikan.scheduler.shed
+
+    async def post_batch():
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://test")
+        async with client:
+            return await client.post(
+                "/search/batch",
+                files=[noise_page(number) for number in range(10)],
+                timeout=120,
+            )
+
+    response = asyncio.run(post_batch())
+    assert response.status_code == 200
+    body = response.json()
+    assert body["unique_pages"] == 10
+    assert not body["unmatched"]
+    assert sum(len(result["pages"]) for result in body["results"]) == 10
+    for result in body["results"]:
+        assert result["sinopsis"], result["titulo"]
+        assert result["autores"] and result["autores"][0]["mal_id"], result["titulo"]
+        assert result["otras_obras"], result["titulo"]
+        assert result["external_links"], result["titulo"]
+    assert jikan.scheduler.shed == shed
@@ -0,0 +1,87 @@
+import pytest
+
+from app.services import circuit_breaker
+from app.services.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    BreakerGroup,
+    CircuitBreaker,
+    CircuitOpen,
+    endpoint_of,
+)
+
+
+def trip(breaker: CircuitBreaker) -> None:
+    for _ in range(circuit_breaker.BREAKER_MIN_CALLS):
+        breaker.allow()
+        breaker.record(True, 0.1)
+
+
+def test_breaker_needs_min_calls_before_tripping():
+    breaker = CircuitBreaker("test", slow_call_seconds=1)
+    for _ in range(circuit_breaker.BREAKER_MIN_CALLS - 1):
+        breaker.record(True, 0.1)
+    assert breaker.state == CLOSED
+    breaker.record(True, 0.1)
+    assert breaker.state == OPEN
+    assert breaker.trips == 1
+
+
+def test_open_breaker_fails_fast():
+    breaker = CircuitBreaker("test", slow_call_seconds=1)
+    trip(breaker)
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    assert breaker.rejected == 1
+
+
+def test_slow_calls_trip_the_breaker():
+    breaker = CircuitBreaker("test", slow_call_seconds=1)
+    for _ in range(circuit_breaker.BREAKER_MIN_CALLS):
+        breaker.record(False, 2.0)
+    assert breaker.state == OPEN
+
+
+def test_successful_probe_closes_the_breaker(monkeypatch):
+    breaker = CircuitBreaker("test", slow_call_seconds=1)
+    trip(breaker)
+    monkeypatch.setattr(circuit_breaker, "BREAKER_OPEN_SECONDS", 0)
+    breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Only one probe at a time
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    breaker.record(False, 0.1)
+    assert breaker.state == CLOSED
+    breaker.allow()
+
+
+def test_failed_probe_opens_the_breaker_again(monkeypatch):
+    breaker = CircuitBreaker("test", slow_call_seconds=1)
+    trip(breaker)
+    monkeypatch.setattr(circuit_breaker, "BREAKER_OPEN_SECONDS", 0)
+    breaker.allow()
+    breaker.record(True, 0.1)
+    assert breaker.state == OPEN
+    assert breaker.trips == 2
+
+
+def test_released_probe_lets_the_next_one_through(monkeypatch):
+    breaker = CircuitBreaker("test", slow_call_seconds=1)
+    trip(breaker)
+    monkeypatch.setattr(circuit_breaker, "BREAKER_OPEN_SECONDS", 0)
+    breaker.allow()
+    breaker.release()
+    breaker.allow()
+    assert breaker.state == HALF_OPEN
+
+
+def test_breakers_are_per_endpoint():
+    url = "https://api.jikan.moe/v4/manga/13/full"
+    assert endpoint_of(url) == "/v4/manga/{id}/full"
+    group = BreakerGroup("jikan", slow_call_seconds=1)
+    full = group.for_url(url)
+    assert group.for_url("https://api.jikan.moe/v4/manga/2/full") is full
+    trip(full)
+    group.for_url("https://api.jikan.moe/v4/manga/13/external").allow()
@@ -0,0 +1,86 @@
+import random
+
+from app.services import image_cache
+from app.services.image_cache import BKTree, PerceptualCache, hamming
+
+
+def flip(value: int, *bits: int) -> int:
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+class Clock:
+    now = 1000.0
+
+    @classmethod
+    def monotonic(cls) -> float:
+        return cls.now
+
+
+def test_bktree_search_finds_every_hash_within_the_radius():
+    rng = random.Random(7)
+    hashes = [rng.getrandbits(64) for _ in range(500)]
+    tree = BKTree()
+    for value in hashes:
+        tree.add(value)
+    query = flip(hashes[0], 3, 17, 40)
+    found = tree.search(query, 5)
+    expected = sorted((hamming(query, h), h) for h in hashes if hamming(query, h) <= 5)
+    assert found == expected
+    assert found[0] == (3, hashes[0])
+
+
+def test_bktree_ignores_duplicates():
+    tree = BKTree()
+    tree.add(0b1011)
+    tree.add(0b1011)
+    assert tree.size == 1
+    assert tree.search(0b1011, 0) == [(0, 0b1011)]
+
+
+def test_near_duplicates_hit_within_the_threshold():
+    cache = PerceptualCache(maxsize=10, ttl=60, threshold=6)
+    page = 0x0F0F_F0F0_1234_5678
+    cache.set(page, "Berserk")
+    assert cache.get(flip(page, 1, 9, 33, 50, 62, 63)) == "Berserk"
+    assert cache.get(flip(page, *range(7))) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_variants_are_kept_apart():
+    cache = PerceptualCache(maxsize=10, ttl=60, threshold=6)
+    cache.set(42, "safe", variant=False)
+    assert cache.get(42, variant=True) is None
+    assert cache.get(42, variant=False) == "safe"
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    monkeypatch.setattr(image_cache, "time", Clock)
+    cache = PerceptualCache(maxsize=10, ttl=60, threshold=6)
+    cache.set(42, "Berserk")
+    Clock.now += 59
+    assert cache.get(42) == "Berserk"
+    Clock.now += 2
+    assert cache.get(42) is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PerceptualCache(maxsize=2, ttl=60, threshold=0)
+    cache.set(1, "one")
+    cache.set(2, "two")
+    assert cache.get(1) == "one"
+    cache.set(4, "four")
+    assert cache.get(2) is None
+    assert cache.get(1) == "one"
+    assert cache.get(4) == "four"
+    assert cache.evictions == 1
+
+
+def test_tree_is_rebuilt_once_evicted_hashes_pile_up():
+    cache = PerceptualCache(maxsize=2, ttl=60, threshold=0)
+    for value in range(1, 20):
+        cache.set(value, value)
+    assert cache._tree.size <= 2 * len(cache)
+    assert cache.get(19) == 19
@@ -0,0 +1,113 @@
+import asyncio
+import io
+import sqlite3
+
+import httpx
+import pytest
+from PIL import Image
+
+from app.services import http_client, image_proxy
+from app.services.image_proxy import ImageProxyError, ImageStore
+from app.services.tiered_cache import TRIM_EVERY_WRITES, TieredCache
+
+URL = "https://cdn.myanimelist.net/images/manga/2/1.jpg"
+
+
+def serve(monkeypatch, handler):
+    def build_client() -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    http_client._clients.clear()
+    monkeypatch.setattr(http_client, "_build_client", build_client)
+
+
+@pytest.fixture(autouse=True)
+def fresh_clients():
+    yield
+    http_client._clients.clear()
+
+
+def test_oversized_source_is_abandoned_mid_transfer(monkeypatch):
+    monkeypatch.setattr(image_proxy, "IMAGE_PROXY_MAX_SOURCE_BYTES", 1000)
+    sent = []
+
+    class Endless(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            for _ in range(100):
+                sent.append(1)
+                yield b"x" * 300
+
+    # No Content-Length, so only the running count can catch it
+    serve(monkeypatch, lambda request: httpx.Response(200, stream=Endless()))
+    with pytest.raises(ImageProxyError, match="larger than"):
+        asyncio.run(image_proxy._fetch_source(URL))
+    assert len(sent) <= 5
+
+
+def test_declared_oversized_source_is_refused(monkeypatch):
+    monkeypatch.setattr(image_proxy, "IMAGE_PROXY_MAX_SOURCE_BYTES", 1000)
+    serve(monkeypatch, lambda request: httpx.Response(200, content=b"x" * 2000))
+    with pytest.raises(ImageProxyError, match="larger than"):
+        asyncio.run(image_proxy._fetch_source(URL))
+
+
+def test_source_is_rendered_and_stored(monkeypatch, tmp_path):
+    out = io.BytesIO()
+    Image.new("RGB", (800, 400), "red").save(out, "JPEG")
+    serve(monkeypatch, lambda request: httpx.Response(200, content=out.getvalue()))
+    store = ImageStore(str(tmp_path / "images"), 10**6, path=str(tmp_path / "db"))
+    monkeypatch.setattr(image_proxy, "image_store", store)
+
+    data = asyncio.run(image_proxy.get_image(URL, "thumb"))
+    assert Image.open(io.BytesIO(data)).size == (160, 80)
+    assert asyncio.run(image_proxy.get_image(URL, "thumb")) == data
+    assert store.stats()["hits"] == 1
+
+
+def test_renditions_are_served_while_the_index_is_locked(monkeypatch, tmp_path):
+    class Locked:
+        def execute(self, *args):
+            raise sqlite3.OperationalError("database is locked")
+
+    out = io.BytesIO()
+    Image.new("RGB", (800, 400), "red").save(out, "JPEG")
+    serve(monkeypatch, lambda request: httpx.Response(200, content=out.getvalue()))
+    store = ImageStore(str(tmp_path / "images"), 10**6, path=str(tmp_path / "db"))
+    store._conn = Locked()
+    monkeypatch.setattr(image_proxy, "image_store", store)
+
+    data = asyncio.run(image_proxy.get_image(URL, "thumb"))
+    assert asyncio.run(image_proxy.get_image(URL, "thumb")) == data
+    assert store.stats()["hits"] == 1
+
+
+def test_failed_fetch_raises_image_proxy_error(monkeypatch):
+    serve(monkeypatch, lambda request: httpx.Response(404))
+    with pytest.raises(ImageProxyError, match="HTTP 404"):
+        asyncio.run(image_proxy._fetch_source(URL))
+
+
+def test_image_store_evicts_least_recently_served(tmp_path):
+    store = ImageStore(str(tmp_path / "images"), 2000, path=str(tmp_path / "db"))
+    for number in range(TRIM_EVERY_WRITES):
+        store.put(f"{number:04d}", b"x" * 100)
+    total = store.conn.execute("SELECT SUM(size) FROM image_files").fetchone()[0]
+    assert total <= 1800
+    assert store.evictions == TRIM_EVERY_WRITES - total // 100
+    assert store.get("0000") is None
+    assert store.get(f"{TRIM_EVERY_WRITES - 1:04d}") is not None
+
+
+def test_tiered_cache_trims_its_own_namespace(tmp_path):
+    path = str(tmp_path / "db")
+    small = TieredCache("small", ttl=60, memory_size=0, max_bytes=500, path=path)
+    other = TieredCache("other", ttl=60, memory_size=0, max_bytes=10**6, path=path)
+    other.set("kept", "y" * 100)
+    for number in range(TRIM_EVERY_WRITES):
+        small.set(str(number), "x" * 100)
+    small.flush()
+    other.flush()
+    assert asyncio.run(small.get("0")) is None
+    assert asyncio.run(small.get(str(TRIM_EVERY_WRITES - 1))) is not None
+    assert asyncio.run(other.get("kept")) is not None
+    assert small.disk_evictions > 0
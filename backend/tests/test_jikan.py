@@ -0,0 +1,145 @@
+import asyncio
+import sqlite3
+
+import httpx
+
+from app.services import http_client, jikan
+from app.services.jikan import ALL_BRANCHES, _empty_details, _enrich, _merge_branches
+
+SEARCH_HIT = {
+    "mal_id": 2,
+    "title": "Berserk",
+    "synopsis": "Guts, a former mercenary...",
+    "status": "Publishing",
+    "authors": [{"mal_id": 1868, "name": "Miura, Kentarou", "url": "https://mal/people/1868"}],
+}
+FULL = {
+    **SEARCH_HIT,
+    "chapters": 380,
+    "relations": [
+        {
+            "relation": "Sequel",
+            "entry": [{"type": "manga", "name": "Duranki", "url": "u"}],
+        },
+    ],
+}
+PEOPLE_MANGA = [{"manga": {"title": "Giganto Maxia", "url": "https://mal/manga/2"}}]
+EXTERNAL = [{"name": "Wikipedia", "url": "https://en.wikipedia.org/wiki/Berserk"}]
+
+
+def test_merge_keeps_the_search_hit_when_full_is_missing():
+    details = _empty_details()
+    _merge_branches(details, SEARCH_HIT, {"full": None, "external": EXTERNAL})
+    assert details["title"] == "Berserk"
+    assert details["sinopsis"] == SEARCH_HIT["synopsis"]
+    assert [a.name for a in details["autores"]] == ["Miura, Kentarou"]
+    assert [link.name for link in details["external_links"]] == ["Wikipedia"]
+    # Branches that haven't landed leave their fields empty
+    assert details["otras_obras"] == []
+    assert details["related_manga"] == []
+
+
+def test_merge_layers_the_full_record_and_author_branches():
+    details = _empty_details()
+    results = {"full": FULL, "people_manga": PEOPLE_MANGA, "external": None}
+    _merge_branches(details, SEARCH_HIT, results)
+    assert details["chapters"] == 380
+    assert [work.title for work in details["related_manga"]] == ["Duranki"]
+    assert [work.title for work in details["otras_obras"]] == ["Giganto Maxia"]
+    assert details["external_links"] == []
+
+
+def test_enrich_reports_dropped_branches(monkeypatch):
+    async def get_json(url, params=None, revalidate=False):
+        if url.endswith("/external"):
+            raise RuntimeError("HTTP 503")
+        if url.endswith("/full"):
+            return FULL
+        if url.endswith("/manga"):
+            return PEOPLE_MANGA
+        return {"images": {"jpg": {"image_url": None}}}
+
+    monkeypatch.setattr(jikan, "_get_json", get_json)
+    details, complete = asyncio.run(_enrich("Berserk", SEARCH_HIT, {}))
+    assert not complete
+    assert set(details["branches"]) == ALL_BRANCHES - {"external"}
+    assert details["chapters"] == 380
+    assert details["otras_obras"][0].title == "Giganto Maxia"
+
+
+def test_enrich_only_runs_the_requested_branches(monkeypatch):
+    fetched = []
+
+    async def get_json(url, params=None, revalidate=False):
+        fetched.append(url.rsplit("/", 1)[-1])
+        return EXTERNAL
+
+    monkeypatch.setattr(jikan, "_get_json", get_json)
+    details, complete = asyncio.run(
+        _enrich("Berserk", SEARCH_HIT, {}, branches=frozenset({"external"}))
+    )
+    assert complete
+    assert fetched == ["external"]
+    assert details["branches"] == ["external"]
+
+
+def test_a_locked_title_index_does_not_fail_the_lookup(monkeypatch):
+    def locked(*args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+
+    async def get_json(url, params=None, revalidate=False):
+        return FULL if url.endswith("/full") else None
+
+    monkeypatch.setattr(jikan.title_index, "lookup", locked)
+    monkeypatch.setattr(jikan.title_index, "learn", locked)
+    monkeypatch.setattr(jikan, "_get_json", get_json)
+    assert asyncio.run(jikan._indexed_mal_id("Berserk")) is None
+    details, _ = asyncio.run(
+        _enrich("Berserk", SEARCH_HIT, {}, branches=frozenset({"full"}))
+    )
+    assert details["chapters"] == 380
+
+
+def test_a_locked_snapshot_reads_as_a_miss(monkeypatch):
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(jikan.snapshot, "get_manga", locked)
+    monkeypatch.setattr(jikan.snapshot, "find_by_title", locked)
+    assert asyncio.run(jikan._details_from_snapshot(2)) is None
+    assert asyncio.run(jikan._from_snapshot(jikan.snapshot.find_by_title, "x")) is None
+
+
+def test_get_json_revalidates_with_the_stored_etag(monkeypatch):
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.headers.get("if-none-match"))
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(
+            200, json={"data": {"mal_id": 99}}, headers={"ETag": '"v1"'}
+        )
+
+    def build_client() -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    http_client._clients.clear()
+    monkeypatch.setattr(http_client, "_build_client", build_client)
+    url = f"{jikan.JIKAN_BASE_URL}/manga/99/full"
+
+    async def fetch_twice():
+        first = await jikan._get_json(url, revalidate=True)
+        # The upstream cache is disk only; let the writer thread store the record
+        await asyncio.to_thread(jikan.upstream_cache.flush)
+        second = await jikan._get_json(url, revalidate=True)
+        return first, second
+
+    not_modified = jikan.revalidation_stats["not_modified"]
+    try:
+        first, second = asyncio.run(fetch_twice())
+    finally:
+        http_client._clients.clear()
+    assert first == second == {"mal_id": 99}
+    assert seen == [None, '"v1"']
+    assert jikan.revalidation_stats["not_modified"] == not_modified + 1
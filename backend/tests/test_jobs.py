@@ -0,0 +1,145 @@
+import asyncio
+import io
+import json
+import os
+import time
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+from app.routers.jobs import run_search_job
+from app.services import jobs
+from app.services.jobs import DONE, FAILED, QUEUED, RUNNING, JobQueue, _run_job
+from app.services.uploads import ImageUpload
+
+
+@pytest.fixture
+def queue(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    return JobQueue(path, max_attempts=2, lease_seconds=0.05, result_ttl=60)
+
+
+def page() -> ImageUpload:
+    out = io.BytesIO()
+    Image.frombytes("L", (64, 64), os.urandom(64 * 64)).save(out, "PNG")
+    return ImageUpload(
+        filename="page.png", content_type="image/png", data=out.getvalue()
+    )
+
+
+def test_submit_is_bounded(queue):
+    assert queue.submit(page(), {}, max_queued=1) is not None
+    assert queue.submit(page(), {}, max_queued=1) is None
+    assert queue.stats()[QUEUED] == 1
+
+
+def test_expired_lease_is_claimed_again(queue):
+    job_id = queue.submit(page(), {"include_nsfw": True})
+    first = queue.claim("worker-a")
+    assert first.id == job_id and first.attempts == 1
+    assert first.params == {"include_nsfw": True}
+    assert queue.claim("worker-b") is None  # Still leased
+
+    time.sleep(0.1)
+    second = queue.claim("worker-b")
+    assert second.id == job_id and second.attempts == 2
+    assert second.upload.data == first.upload.data
+    assert queue.stats()["recovered"] == 1
+
+    # The worker that lost its lease can neither renew nor finish the job
+    assert not queue.renew(job_id, "worker-a")
+    queue.complete(job_id, "worker-a", b"{}")
+    assert queue.get(job_id)["status"] == RUNNING
+    queue.complete(job_id, "worker-b", b'{"found":false}')
+    job = queue.get(job_id)
+    assert job["status"] == DONE
+    assert job["result"] == b'{"found":false}'
+
+
+def test_lease_lost_on_the_last_attempt_fails_the_job(queue):
+    job_id = queue.submit(page(), {})
+    queue.claim("worker-a")
+    time.sleep(0.1)
+    queue.claim("worker-b")
+    time.sleep(0.1)
+    assert queue.claim("worker-c") is None
+    assert queue.get(job_id)["status"] == FAILED
+    assert queue.get(job_id)["error"]["status_code"] == 500
+
+
+def test_failed_attempt_is_retried_after_a_backoff(queue):
+    job_id = queue.submit(page(), {})
+    queue.claim("worker")
+    queue.fail(job_id, "worker", 503, "SauceNAO is unavailable.", retry=True)
+    assert queue.get(job_id)["status"] == QUEUED
+    assert queue.claim("worker") is None  # Backing off
+
+    with queue._lock:
+        queue.conn.execute("UPDATE jobs SET available_at = 0 WHERE id = ?", (job_id,))
+    job = queue.claim("worker")
+    assert job.attempts == 2
+    queue.fail(job_id, "worker", 503, "SauceNAO is unavailable.", retry=True)
+    failed = queue.get(job_id)
+    assert failed["status"] == FAILED
+    assert failed["error"] == {"status_code": 503, "detail": "SauceNAO is unavailable."}
+    assert queue.stats()["retried"] == 1
+
+
+def test_client_errors_are_not_retried(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "job_queue", queue)
+
+    async def handler(job):
+        raise HTTPException(status_code=400, detail="Not an image.")
+
+    job_id = queue.submit(page(), {})
+    asyncio.run(_run_job(queue.claim("worker"), "worker", handler))
+    job = queue.get(job_id)
+    assert job["status"] == FAILED
+    assert job["attempts"] == 1
+    assert job["error"] == {"status_code": 400, "detail": "Not an image."}
+
+
+def test_search_job_runs_the_search_pipeline(queue, monkeypatch, fake_upstreams):
+    monkeypatch.setattr(jobs, "job_queue", queue)
+    job_id = queue.submit(page(), {"include_nsfw": False, "include": None})
+    asyncio.run(_run_job(queue.claim("worker"), "worker", run_search_job))
+
+    job = queue.get(job_id)
+    assert job["status"] == DONE
+    result = json.loads(job["result"])
+    assert result["found"]
+    assert result["titulo"]
+    # The stub translation backend hands the synopsis back unchanged
+    assert result["sinopsis_es"] == result["sinopsis_en"]
+
+
+def test_shutdown_lets_workers_unwind_first(queue, monkeypatch):
+    import main
+
+    events = []
+    close = main.close_http_clients
+
+    async def handler(job):
+        try:
+            await asyncio.sleep(30)
+        finally:
+            events.append("job unwound")
+
+    async def close_http_clients():
+        events.append("clients closed")
+        await close()
+
+    monkeypatch.setattr(jobs, "job_queue", queue)
+    monkeypatch.setattr(main, "JOB_WORKERS", 1)
+    monkeypatch.setattr(main.jobs, "run_search_job", handler)
+    monkeypatch.setattr(main, "close_http_clients", close_http_clients)
+
+    async def run():
+        job_id = await asyncio.to_thread(queue.submit, page(), {})
+        async with main.lifespan(main.app):
+            while (await asyncio.to_thread(queue.get, job_id))["status"] != RUNNING:
+                await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert events == ["job unwound", "clients closed"]
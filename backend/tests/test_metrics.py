@@ -0,0 +1,76 @@
+import asyncio
+import re
+
+import httpx
+
+from app.services import metrics
+from app.services.metrics import Counter, Histogram, Registry
+from main import app
+
+SAMPLE = re.compile(r"^(\w+)(\{.*\})? (\S+)$")
+
+
+def scrape(*paths: str) -> dict:
+    """GETs `paths` in order, then /metrics; returns its samples by name and labels."""
+
+    async def get():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            for path in paths:
+                await c.get(path)
+            return await c.get("/metrics")
+
+    response = asyncio.run(get())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    samples = {}
+    for line in response.text.splitlines():
+        if line.startswith("#"):
+            continue
+        name, labels, value = SAMPLE.match(line).groups()
+        samples[name + (labels or "")] = float(value)
+    return samples
+
+
+def test_histogram_buckets_are_cumulative(monkeypatch):
+    monkeypatch.setattr(metrics, "registry", Registry())
+    histogram = Histogram("test_seconds", "Test.", ["stage"], buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 3):
+        histogram.observe(value, stage="jikan")
+    assert metrics.registry.render().splitlines() == [
+        "# HELP test_seconds Test.",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{stage="jikan",le="0.1"} 1',
+        'test_seconds_bucket{stage="jikan",le="1"} 3',
+        'test_seconds_bucket{stage="jikan",le="+Inf"} 4',
+        'test_seconds_sum{stage="jikan"} 4.05',
+        'test_seconds_count{stage="jikan"} 4',
+    ]
+
+
+def test_label_values_are_escaped(monkeypatch):
+    monkeypatch.setattr(metrics, "registry", Registry())
+    Counter("test_total", "Test.", ["detail"]).inc(detail='say "hi"\n')
+    assert 'test_total{detail="say \\"hi\\"\\n"} 1' in metrics.registry.render()
+
+
+def test_requests_are_counted_per_route_template(fake_upstreams):
+    found = fake_upstreams.catalogue[0]["mal_id"]
+    route = 'route="/details/{mal_id}"'
+    ok = f'mangafinder_http_requests_total{{method="GET",{route},status="200"}}'
+    missing = f'mangafinder_http_requests_total{{method="GET",{route},status="404"}}'
+
+    before = scrape()
+    after = scrape(f"/details/{found}", f"/details/{found}", "/details/999999999")
+    assert after[ok] - before.get(ok, 0) == 2
+    assert after[missing] - before.get(missing, 0) == 1
+    # Raw paths never become label values
+    assert not any(f"/details/{found}" in sample for sample in after)
+    assert not any("/details/999999999" in sample for sample in after)
+
+    bucket = f"mangafinder_http_request_seconds_bucket{{{route},le="
+    buckets = [after[bucket + f'"{bound}"}}'] for bound in metrics.DEFAULT_BUCKETS]
+    assert buckets == sorted(buckets)
+    count = f"mangafinder_http_request_seconds_count{{{route}}}"
+    assert after[bucket + '"+Inf"}'] == after[count]
+    assert after[count] - before.get(count, 0) == 3
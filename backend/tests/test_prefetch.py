@@ -0,0 +1,45 @@
+import sqlite3
+
+import pytest
+
+from app.services.prefetch import Popularity
+
+
+def test_popularity_ranks_flushed_hits(tmp_path):
+    popularity = Popularity(3600, path=str(tmp_path / "cache.sqlite3"))
+    for _ in range(3):
+        popularity.record("Berserk", 2)
+    popularity.record("Monster")
+    popularity.record("Monster", 1)
+    assert popularity.flush() == 2
+    assert popularity.flush() == 0
+    top = popularity.top(10)
+    ranked = [(title, mal_id) for title, mal_id, _ in top]
+    assert ranked == [("Berserk", 2), ("Monster", 1)]
+    assert top[0][2] == 3.0
+
+
+def test_disabled_popularity_keeps_nothing(tmp_path):
+    popularity = Popularity(3600, path=str(tmp_path / "cache.sqlite3"), enabled=False)
+    for _ in range(1000):
+        popularity.record("Berserk", 2)
+    assert popularity._pending == {}
+    assert popularity.flush() == 0
+
+
+def test_failed_flush_keeps_the_hits(tmp_path):
+    class Locked:
+        in_transaction = False
+
+        def execute(self, *args):
+            raise sqlite3.OperationalError("database is locked")
+
+    popularity = Popularity(3600, path=str(tmp_path / "cache.sqlite3"))
+    popularity.record("Berserk", 2)
+    popularity._conn = Locked()
+    with pytest.raises(sqlite3.OperationalError):
+        popularity.flush()
+    popularity.record("Berserk")
+    popularity._conn = None
+    assert popularity.flush() == 1
+    assert popularity.top(1) == [("Berserk", 2, 2.0)]
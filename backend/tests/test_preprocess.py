@@ -0,0 +1,79 @@
+import asyncio
+import io
+from concurrent.futures import Executor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+
+from app.services import preprocess
+from app.services.image_cache import dhash_image, hamming
+from app.services.preprocess import _prepare, preprocess_image
+from app.services.uploads import ImageUpload
+
+
+def encode(img: Image.Image, fmt: str, **options) -> bytes:
+    out = io.BytesIO()
+    img.save(out, fmt, **options)
+    return out.getvalue()
+
+
+def page(size=(3000, 1500)) -> Image.Image:
+    img = Image.linear_gradient("L").resize(size).convert("RGB")
+    img.paste((200, 30, 30), (0, 0, size[0] // 3, size[1] // 3))
+    return img
+
+
+class BrokenPool(Executor):
+    def submit(self, fn, *args, **kwargs):
+        raise BrokenProcessPool("a worker died")
+
+
+def test_large_pages_are_downscaled_to_a_jpeg():
+    upload = ImageUpload("scan.png", "image/png", encode(page(), "PNG"))
+    prepared, image_hash = asyncio.run(preprocess_image(upload))
+    assert prepared.filename == "scan.jpg"
+    assert prepared.content_type == "image/jpeg"
+    assert len(prepared.data) < len(upload.data)
+    assert Image.open(io.BytesIO(prepared.data)).size == (1000, 500)
+    assert image_hash == dhash_image(Image.open(io.BytesIO(prepared.data)))
+
+
+def test_downscaled_copy_hashes_like_the_original():
+    img = page()
+    _, image_hash = _prepare(encode(img, "PNG"), 1000, 85)
+    assert hamming(image_hash, dhash_image(img)) <= 2
+
+
+def test_the_first_frame_of_an_animation_is_used():
+    frames = [Image.new("RGB", (64, 64), color) for color in ("red", "blue")]
+    data = encode(frames[0], "GIF", save_all=True, append_images=frames[1:])
+    jpeg, _ = _prepare(data, 1000, 85)
+    red, green, blue = Image.open(io.BytesIO(jpeg)).getpixel((32, 32))
+    assert red > 200 and green < 50 and blue < 50
+
+
+def test_small_uploads_keep_their_encoding():
+    upload = ImageUpload("tiny.png", "image/png", encode(Image.new("1", (8, 8)), "PNG"))
+    prepared, image_hash = asyncio.run(preprocess_image(upload))
+    assert prepared is upload
+    assert image_hash is not None
+
+
+def test_undecodable_uploads_are_sent_as_they_are():
+    upload = ImageUpload("page.jpg", "image/jpeg", b"\xff\xd8\xff" + b"\0" * 100)
+    assert asyncio.run(preprocess_image(upload)) == (upload, None)
+
+
+def test_jobs_run_in_process_without_a_pool():
+    assert preprocess._pool is None
+    assert asyncio.run(preprocess.run_image_job(pow, 2, 10)) == 1024
+
+
+def test_a_broken_pool_falls_back_to_running_in_process(monkeypatch):
+    monkeypatch.setattr(preprocess, "_pool", BrokenPool())
+    upload = ImageUpload("scan.png", "image/png", encode(page(), "PNG"))
+    prepared, image_hash = asyncio.run(preprocess_image(upload))
+    assert prepared.content_type == "image/jpeg"
+    assert image_hash is not None
+    # Replaced by a new pool, or none with PREPROCESS_WORKERS=0
+    assert preprocess._pool is None
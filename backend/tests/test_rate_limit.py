@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from app.services.rate_limit import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    RateLimitExceeded,
+    TokenBucket,
+    UpstreamScheduler,
+)
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(2, 1)
+    now = bucket.updated
+    bucket.take()
+    bucket.take()
+    assert bucket.wait_time(now) == pytest.approx(0.5)
+    assert bucket.wait_time(now + 0.5) == 0.0
+
+
+def test_token_bucket_sync_only_lowers_the_estimate():
+    bucket = TokenBucket(10, 60)
+    bucket.sync(3)
+    assert bucket.tokens == pytest.approx(3, abs=0.01)
+    bucket.sync(8)
+    assert bucket.tokens == pytest.approx(3, abs=0.01)
+
+
+def test_scheduler_serves_interactive_before_background():
+    async def scenario():
+        scheduler = UpstreamScheduler("test", [TokenBucket(1, 0.05)])
+        await scheduler.acquire(PRIORITY_INTERACTIVE)  # Drains the bucket
+        order = []
+
+        async def waiter(name: str, priority: int):
+            await scheduler.acquire(priority)
+            order.append(name)
+
+        background = asyncio.create_task(waiter("background", PRIORITY_BACKGROUND))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(waiter("interactive", PRIORITY_INTERACTIVE))
+        await asyncio.gather(background, interactive)
+        return order, scheduler.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == ["interactive", "background"]
+    assert stats["granted"] == 3
+    assert stats["shed"] == 0
+
+
+def test_scheduler_sheds_when_the_queue_is_full():
+    async def scenario():
+        scheduler = UpstreamScheduler("test", [TokenBucket(1, 10)], max_queue=(1, 1))
+        await scheduler.acquire(PRIORITY_INTERACTIVE)
+        queued = asyncio.create_task(scheduler.acquire(PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+        with pytest.raises(RateLimitExceeded):
+            await scheduler.acquire(PRIORITY_INTERACTIVE)
+        # The other priority has its own queue
+        background = asyncio.create_task(scheduler.acquire(PRIORITY_BACKGROUND))
+        await asyncio.sleep(0)
+        assert not background.done()
+        queued.cancel()
+        background.cancel()
+        return scheduler.shed
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_scheduler_sheds_after_max_wait():
+    async def scenario():
+        scheduler = UpstreamScheduler(
+            "test", [TokenBucket(1, 10)], max_wait=(0.05, 0.05)
+        )
+        await scheduler.acquire(PRIORITY_INTERACTIVE)
+        with pytest.raises(RateLimitExceeded):
+            await scheduler.acquire(PRIORITY_INTERACTIVE)
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["shed"] == 1
+    assert stats["queued"] == 0
+
+
+def test_try_acquire_never_jumps_the_queue():
+    async def scenario():
+        scheduler = UpstreamScheduler("test", [TokenBucket(2, 10)])
+        await scheduler.acquire(PRIORITY_INTERACTIVE)
+        await scheduler.acquire(PRIORITY_INTERACTIVE)
+        waiting = asyncio.create_task(scheduler.acquire(PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0.01)  # Queued, with the dispatcher waiting for a refill
+        scheduler.buckets[0].tokens = 1.0  # A slot frees up, but it is spoken for
+        blocked = scheduler.try_acquire()
+        waiting.cancel()
+        await asyncio.sleep(0.01)
+        return blocked, scheduler.try_acquire()
+
+    assert asyncio.run(scenario()) == (False, True)
@@ -0,0 +1,183 @@
+import asyncio
+import io
+import json
+import os
+import time
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+from starlette.requests import Request
+
+from app.records import SearchRecord
+from app.routers import search
+from app.routers.search import (
+    STREAM_STAGES,
+    cacheable_details,
+    encode_result,
+    parse_include,
+)
+from app.services import jikan
+from app.services.circuit_breaker import BreakerGroup
+from app.services.response_cache import CachedDetails
+from main import app
+
+
+def request_with(**headers) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/details",
+        "headers": [
+            (name.replace("_", "-").encode(), value.encode())
+            for name, value in headers.items()
+        ],
+    })
+
+
+def details_entry(**fields) -> CachedDetails:
+    return CachedDetails(**{
+        "body": b'{"found":true}',
+        "etag": '"abc"',
+        "modified_at": 1_700_000_000.0,
+        "fresh_until": time.time() + 600,
+        "title": "Berserk",
+        **fields,
+    })
+
+
+def test_parse_include_rejects_unknown_names():
+    with pytest.raises(HTTPException) as rejected:
+        parse_include("authors,chapters")
+    assert rejected.value.status_code == 400
+    assert "chapters" in rejected.value.detail
+
+
+def test_parse_include_adds_the_synopsis_for_its_translation():
+    assert parse_include(None) is None
+    parsed = parse_include(" translation, ,authors")
+    assert parsed == {"translation", "synopsis", "authors"}
+
+
+def test_encode_result_leaves_out_parts_not_included():
+    record = SearchRecord(found=True, titulo="Berserk", sinopsis="s")
+    body = encode_result(record, frozenset({"synopsis"}))
+    assert b'"sinopsis":"s"' in body
+    assert b"autores" not in body
+    assert b"sinopsis_es" not in body
+
+
+def test_matching_etag_gets_304():
+    request = request_with(if_none_match='W/"abc", "other"')
+    response = cacheable_details(request, details_entry())
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == '"abc"'
+
+
+def test_changed_etag_gets_the_body():
+    response = cacheable_details(request_with(if_none_match='"stale"'), details_entry())
+    assert response.status_code == 200
+    assert response.body == b'{"found":true}'
+    assert "max-age=" in response.headers["cache-control"]
+
+
+def test_if_modified_since_is_used_without_if_none_match():
+    entry = details_entry()
+    not_modified = cacheable_details(
+        request_with(if_modified_since="Tue, 14 Nov 2023 22:13:20 GMT"), entry
+    )
+    assert not_modified.status_code == 304
+    modified = cacheable_details(
+        request_with(if_modified_since="Mon, 13 Nov 2023 00:00:00 GMT"), entry
+    )
+    assert modified.status_code == 200
+    assert modified.headers["last-modified"] == "Tue, 14 Nov 2023 22:13:20 GMT"
+
+
+def test_partial_records_are_not_stored_by_caches():
+    response = cacheable_details(request_with(), details_entry(complete=False))
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "no-store"
+    complete = cacheable_details(request_with(), details_entry())
+    assert "stale-while-revalidate=" in complete.headers["cache-control"]
+
+
+def get_details(path: str) -> httpx.Response:
+    async def get():
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://test")
+        async with client:
+            return await client.get(path)
+
+    return asyncio.run(get())
+
+
+def test_details_by_id(fake_upstreams):
+    mal_id = fake_upstreams.catalogue[0]["mal_id"]
+    response = get_details(f"/details/{mal_id}")
+    assert response.status_code == 200
+    assert response.json()["titulo"] == fake_upstreams.catalogue[0]["title"]
+    assert response.headers["cache-control"].startswith("public, max-age=")
+    assert get_details("/details/999999999").status_code == 404
+
+
+def test_details_by_id_when_jikan_is_down(fake_upstreams, monkeypatch):
+    # A breaker of its own, so the failures don't trip the shared one for other tests
+    monkeypatch.setattr(jikan, "breakers", BreakerGroup("jikan", 3))
+    monkeypatch.setattr(fake_upstreams, "BENCH_FAILURE_RATE", 1.0)
+    # An id no other test can have cached: searches match random catalogue entries
+    mal_id = max(manga["mal_id"] for manga in fake_upstreams.catalogue) + 1
+    response = get_details(f"/details/{mal_id}")
+    assert response.status_code == 503
+    assert int(response.headers["retry-after"]) > 0
+
+
+def noise_png() -> bytes:
+    out = io.BytesIO()
+    Image.frombytes("L", (64, 64), os.urandom(64 * 64)).save(out, "PNG")
+    return out.getvalue()
+
+
+def test_alternatives_are_enriched_after_the_response(fake_upstreams, monkeypatch):
+    events = []
+    monkeypatch.setattr(
+        search, "enrich_alternatives", lambda matches: events.append("enriched")
+    )
+
+    async def logged(scope, receive, send):
+        async def logging_send(message):
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                events.append("sent")
+            await send(message)
+
+        await app(scope, receive, logging_send)
+
+    async def post(path: str):
+        transport = httpx.ASGITransport(app=logged)
+        client = httpx.AsyncClient(transport=transport, base_url="http://test")
+        async with client:
+            response = await client.post(path, files={"file": ("p.png", noise_png())})
+        assert response.status_code == 200
+
+    asyncio.run(post("/search"))
+    asyncio.run(post("/search/stream"))
+    assert events == ["sent", "enriched", "sent", "enriched"]
+
+
+def test_stream_reports_every_stage(fake_upstreams):
+    async def stream():
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://test")
+        async with client:
+            response = await client.post(
+                "/search/stream", files={"file": ("page.png", noise_png())}
+            )
+        return [json.loads(line) for line in response.text.splitlines()]
+
+    events = asyncio.run(stream())
+    stages = [event["stage"] for event in events]
+    assert stages[0] == "match" and stages[-2:] == ["translation", "done"]
+    assert set(STREAM_STAGES.values()) <= set(stages)
+    assert events[-1]["data"]["titulo"] == events[0]["data"]["titulo"]
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from app.services.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"mal_id": 2}
+
+    async def main():
+        results = await asyncio.gather(*(flight.do("berserk", fetch) for _ in range(5)))
+        # Finished calls are forgotten; the next caller starts a new one
+        await flight.do("berserk", fetch)
+        return results
+
+    results = asyncio.run(main())
+    assert results == [{"mal_id": 2}] * 5
+    assert len(calls) == 2
+    assert flight.stats() == {"calls": 2, "coalesced": 4, "in_flight": 0}
+
+
+def test_an_exception_reaches_every_waiter():
+    flight = SingleFlight("test")
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("HTTP 503")
+
+    async def main():
+        return await asyncio.gather(
+            *(flight.do("berserk", fetch) for _ in range(3)), return_exceptions=True
+        )
+
+    errors = asyncio.run(main())
+    assert [str(e) for e in errors] == ["HTTP 503"] * 3
+    assert flight.calls == 1
+
+
+def test_a_cancelled_waiter_does_not_cancel_the_shared_call():
+    flight = SingleFlight("test")
+    finished = []
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        finished.append(1)
+        return "done"
+
+    async def main():
+        first = asyncio.create_task(flight.do("berserk", fetch))
+        second = asyncio.create_task(flight.do("berserk", fetch))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == "done"
+    assert finished == [1]
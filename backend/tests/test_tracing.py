@@ -0,0 +1,130 @@
+import asyncio
+import json
+
+import httpx
+from fastapi import FastAPI
+
+from app.services import http_client, tracing
+from app.services.rate_limit import TokenBucket, UpstreamScheduler, scheduled_request
+from app.services.tracing import TracingMiddleware
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+UPSTREAM_URL = "http://upstream.test/v4/manga/2/full"
+
+
+def traced_app(monkeypatch, seen_upstream: list, delay: float = 0) -> TracingMiddleware:
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen_upstream.append(request.headers.get("traceparent"))
+        return httpx.Response(200, json={"data": {}})
+
+    def build_client() -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    http_client._clients.clear()
+    monkeypatch.setattr(http_client, "_build_client", build_client)
+    scheduler = UpstreamScheduler("test", [TokenBucket(100, 1)])
+    app = FastAPI()
+
+    @app.get("/lookup/{mal_id}")
+    async def lookup(mal_id: int):
+        await asyncio.sleep(delay)
+        await scheduled_request(scheduler, "GET", UPSTREAM_URL, retries=0)
+        return {"mal_id": mal_id}
+
+    return TracingMiddleware(app)
+
+
+def get(app, path: str, **headers) -> httpx.Response:
+    async def send():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            return await c.get(path, headers=headers)
+
+    try:
+        # asyncio.run waits for the executor, so the export is written on return
+        return asyncio.run(send())
+    finally:
+        http_client._clients.clear()
+
+
+def test_incoming_trace_is_continued_upstream_and_echoed(monkeypatch, tmp_path):
+    monkeypatch.setattr(tracing, "TRACE_EXPORT_PATH", str(tmp_path / "traces.jsonl"))
+    seen = []
+    response = get(
+        traced_app(monkeypatch, seen), "/lookup/2",
+        traceparent=f"00-{TRACE_ID}-{PARENT_ID}-01",
+    )
+    assert response.status_code == 200
+    _, trace_id, root_id, _ = response.headers["traceparent"].split("-")
+    assert trace_id == TRACE_ID
+    assert root_id != PARENT_ID
+    _, upstream_trace_id, upstream_parent, _ = seen[0].split("-")
+    assert upstream_trace_id == TRACE_ID
+    # The upstream call's parent is its own span, a child of the request's root span
+    assert upstream_parent not in (PARENT_ID, root_id)
+
+
+def test_traces_are_exported_in_the_otlp_json_layout(monkeypatch, tmp_path):
+    export = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing, "TRACE_EXPORT_PATH", str(export))
+    seen = []
+    get(
+        traced_app(monkeypatch, seen), "/lookup/2",
+        traceparent=f"00-{TRACE_ID}-{PARENT_ID}-01",
+    )
+    [record] = [json.loads(line) for line in export.read_text().splitlines()]
+    [resource] = record["resourceSpans"]
+    assert resource["resource"]["attributes"] == [
+        {"key": "service.name", "value": {"stringValue": tracing.SERVICE_NAME}}
+    ]
+    [scope] = resource["scopeSpans"]
+    spans = {span["name"]: span for span in scope["spans"]}
+    root = spans["GET /lookup/{mal_id}"]
+    upstream = spans["test GET /v4/manga/{id}/full"]
+    assert {span["traceId"] for span in spans.values()} == {TRACE_ID}
+    assert root["parentSpanId"] == PARENT_ID
+    assert upstream["parentSpanId"] == root["spanId"]
+    assert seen[0].split("-")[2] == upstream["spanId"]
+    assert spans["rate limit wait"]["parentSpanId"] == upstream["spanId"]
+    attributes = {a["key"]: a["value"] for a in root["attributes"]}
+    assert attributes["http.status_code"] == {"intValue": "200"}
+    assert attributes["http.target"] == {"stringValue": "/lookup/2"}
+    assert root["status"] == {"code": 1}
+    assert int(root["startTimeUnixNano"]) <= int(root["endTimeUnixNano"])
+
+
+def test_a_request_without_traceparent_starts_a_new_trace(monkeypatch, tmp_path):
+    monkeypatch.setattr(tracing, "TRACE_EXPORT_PATH", str(tmp_path / "traces.jsonl"))
+    seen = []
+    response = get(traced_app(monkeypatch, seen), "/lookup/2")
+    trace_id = response.headers["traceparent"].split("-")[1]
+    assert len(trace_id) == 32 and trace_id != TRACE_ID
+    assert seen[0].split("-")[1] == trace_id
+
+
+def test_tracing_and_profiling_stay_off_unless_configured(monkeypatch):
+    begun = []
+    monkeypatch.setattr(tracing.profiler, "begin", lambda: begun.append(1))
+    seen = []
+    response = get(traced_app(monkeypatch, seen), "/lookup/2")
+    assert response.status_code == 200
+    assert "traceparent" not in response.headers
+    assert seen == [None]
+    assert begun == []
+
+
+def test_only_requests_over_the_threshold_are_profiled(monkeypatch):
+    written = []
+    monkeypatch.setattr(tracing, "PROFILE_SLOW_REQUEST_MS", 50)
+    monkeypatch.setattr(
+        tracing, "write_profile", lambda *args: written.append(args)
+    )
+    seen = []
+    fast = get(traced_app(monkeypatch, seen), "/lookup/2")
+    slow = get(traced_app(monkeypatch, seen, delay=0.1), "/lookup/2")
+    assert tracing.profiler._active == 0
+    assert [(trace_id, name) for trace_id, name, _ in written] == [
+        (slow.headers["traceparent"].split("-")[1], "GET /lookup/{mal_id}")
+    ]
+    assert fast.headers["traceparent"] != slow.headers["traceparent"]
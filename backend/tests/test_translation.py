@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from app.services.tiered_cache import TieredCache
+from app.services.translation import (
+    StubBackend,
+    TranslationBackend,
+    TranslationService,
+    split_text,
+)
+
+
+def test_backends_must_implement_translate():
+    class Incomplete(TranslationBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_split_text_prefers_paragraph_then_sentence_breaks():
+    text = "First one. Second one.\n\nThird paragraph here."
+    chunks = split_text(text, 25)
+    assert chunks[0] == ("First one. Second one.", "\n\n")
+    assert "".join(chunk + separator for chunk, separator in chunks) == text
+    assert all(len(chunk) <= 25 for chunk, _ in chunks)
+
+
+def test_service_caches_translations():
+    calls = []
+
+    class Counting(StubBackend):
+        def translate(self, text: str, target: str) -> str:
+            calls.append(text)
+            return text.upper()
+
+    service = TranslationService(
+        Counting(), TieredCache("translation_test", ttl=60, memory_size=10), 2
+    )
+
+    async def translate_twice():
+        return [await service.translate("hola", "en") for _ in range(2)]
+
+    assert asyncio.run(translate_twice()) == ["HOLA", "HOLA"]
+    assert calls == ["hola"]
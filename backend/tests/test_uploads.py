@@ -0,0 +1,122 @@
+import asyncio
+import io
+
+import httpx
+import pytest
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from PIL import Image
+from starlette.datastructures import Headers
+
+from app.services.uploads import (
+    UPLOAD_CHUNK_SIZE,
+    UploadSizeLimitMiddleware,
+    format_size,
+    read_image_upload,
+    sniff_image_type,
+)
+
+
+def image_bytes(fmt: str) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (8, 8), "red").save(out, fmt)
+    return out.getvalue()
+
+
+def upload(data: bytes, content_type: str = "image/jpeg") -> UploadFile:
+    return UploadFile(
+        io.BytesIO(data),
+        filename="page",
+        headers=Headers({"content-type": content_type}),
+    )
+
+
+@pytest.mark.parametrize(
+    "fmt, content_type",
+    [
+        ("JPEG", "image/jpeg"),
+        ("PNG", "image/png"),
+        ("GIF", "image/gif"),
+        ("WEBP", "image/webp"),
+    ],
+)
+def test_images_are_recognised_by_their_magic_bytes(fmt, content_type):
+    assert sniff_image_type(image_bytes(fmt)[:16]) == content_type
+
+
+def test_the_sniffed_type_beats_the_declared_one():
+    image = asyncio.run(read_image_upload(upload(image_bytes("PNG"), "image/jpeg")))
+    assert image.content_type == "image/png"
+
+
+@pytest.mark.parametrize(
+    "data", [b"<html><body>not an image</body>", b"%PDF-1.7", b"RIFF\0\0\0\0WAVE"]
+)
+def test_non_images_are_rejected_whatever_they_claim_to_be(data):
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(read_image_upload(upload(data, "image/jpeg")))
+    assert raised.value.status_code == 400
+    assert "Invalid file type" in raised.value.detail
+
+
+def test_uploads_past_the_limit_are_rejected_while_reading():
+    data = image_bytes("PNG") + b"\0" * (3 * UPLOAD_CHUNK_SIZE)
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(read_image_upload(upload(data), max_size=2 * UPLOAD_CHUNK_SIZE))
+    assert raised.value.status_code == 400
+
+
+def test_sizes_below_a_megabyte_are_not_rounded_to_zero():
+    assert format_size(10 * 1024 * 1024) == "10MB"
+    assert format_size(1536 * 1024) == "1.5MB"
+    assert format_size(512 * 1024) == "512KB"
+    assert format_size(100) == "100 bytes"
+
+
+def limited_app(limit: int) -> UploadSizeLimitMiddleware:
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def receive_upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    return UploadSizeLimitMiddleware(app, {"/upload": limit})
+
+
+def post(app, **kwargs) -> httpx.Response:
+    async def send():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            return await c.post("/upload", **kwargs)
+
+    return asyncio.run(send())
+
+
+def test_declared_oversized_body_gets_413_before_it_is_read():
+    response = post(limited_app(1000), files={"file": ("page.png", b"x" * 2000)})
+    assert response.status_code == 413
+    assert response.json()["detail"].startswith("File is too large.")
+
+
+def test_small_body_passes_the_limit():
+    response = post(limited_app(1000), files={"file": ("page.png", b"x" * 100)})
+    assert response.status_code == 200
+    assert response.json() == {"size": 100}
+
+
+def test_chunked_body_is_cut_off_past_the_limit():
+    sent = []
+
+    async def body():
+        yield b"--b\r\n"
+        yield b'Content-Disposition: form-data; name="file"; filename="p"\r\n\r\n'
+        for _ in range(100):
+            sent.append(1)
+            yield b"x" * 100
+
+    response = post(
+        limited_app(1000),
+        content=body(),
+        headers={"content-type": "multipart/form-data; boundary=b"},
+    )
+    assert response.status_code == 413
+    assert len(sent) < 100
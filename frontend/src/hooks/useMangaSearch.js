@@ -19,10 +19,9 @@ export const useSearchManga = () => {
 export const useMangaDetails = () => {
   return useMutation({
     mutationFn: async (formData) => {
-      const response = await axios.post(`${API_URL}/details`, formData, {
-        headers: {
-          'Content-Type': 'multipart/form-data',
-        },
+      // GET so the browser (and any proxy) can cache it and revalidate with the ETag
+      const response = await axios.get(`${API_URL}/details`, {
+        params: { title: formData.get('title') },
       });
       return response.data;
     },